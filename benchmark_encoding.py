@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+SnipRAG Encoding Benchmark - Measures chunk embedding throughput on CPU for
+different batch sizes, with and without normalization
+"""
+
+import time
+import random
+import argparse
+import numpy as np
+from sniprag.core import create_engine
+
+WORDS = ("invoice total amount payment due date customer account balance tax "
+         "quarterly report revenue region section figures unaudited").split()
+
+def make_texts(num_texts, seed=0):
+    """Create chunk-like texts with a realistic spread of lengths"""
+    rng = random.Random(seed)
+    texts = []
+    for i in range(num_texts):
+        # Mostly short blocks (headers, single lines) with some long paragraphs
+        length = rng.choice([4, 8, 12, 24, 60, 150])
+        texts.append(f"{i} " + " ".join(rng.choice(WORDS) for _ in range(length)))
+    return texts
+
+def time_call(fn, repeats):
+    """Return the best wall-clock time of several runs"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmark(model_name, num_texts, batch_sizes, repeats):
+    """
+    Print chunks/sec for the unbatched baseline and each engine setting
+    
+    Args:
+        model_name: sentence-transformers model to load
+        num_texts: Number of chunk texts to embed
+        batch_sizes: Values of encode_batch_size to try
+        repeats: Runs per setting; the fastest is reported
+    """
+    texts = make_texts(num_texts)
+    engine = create_engine("semantic", embedding_model_name=model_name)
+    
+    # Warm up the model
+    engine.embedding_model.encode(texts[:8])
+    
+    print(f"Embedding {num_texts} texts with {model_name}")
+    print(f"{'setting':<40} {'chunks/sec':>12}")
+    
+    # Previous behaviour: one encode call with default settings, then a copy to float32
+    elapsed = time_call(lambda: np.array(engine.embedding_model.encode(texts)).astype('float32'), repeats)
+    print(f"{'baseline encode()':<40} {num_texts / elapsed:>12.1f}")
+    
+    for normalize in (False, True):
+        for batch_size in batch_sizes:
+            engine.encode_batch_size = batch_size
+            engine.normalize_embeddings = normalize
+            elapsed = time_call(lambda: engine._encode_texts(texts), repeats)
+            setting = f"encode_batch_size={batch_size}, normalize={normalize}"
+            print(f"{setting:<40} {num_texts / elapsed:>12.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SnipRAG Encoding Benchmark")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="sentence-transformers model name")
+    parser.add_argument("--num-texts", type=int, default=2000, help="Number of chunk texts to embed")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128], 
+                        help="encode_batch_size values to try")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per setting")
+    
+    args = parser.parse_args()
+    run_benchmark(args.model, args.num_texts, args.batch_sizes, args.repeats)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+SnipRAG Query Latency Benchmark - Compares single-query encode latency across
+embedding backends
+"""
+
+import time
+import argparse
+import numpy as np
+from sniprag.core import create_engine
+
+QUERIES = [
+    "invoice total",
+    "when is the payment due",
+    "quarterly revenue growth by region",
+    "which figures are unaudited",
+    "customer account balance and tax",
+]
+
+def run_benchmark(model_name, backends, repeats):
+    """
+    Print single-query encode latency percentiles for each backend
+    
+    Args:
+        model_name: sentence-transformers model to load
+        backends: Embedding backends to compare
+        repeats: Number of timed queries per backend
+    """
+    print(f"Single-query encode latency for {model_name}")
+    print(f"{'backend':<10} {'p50 ms':>10} {'p95 ms':>10} {'cosine vs torch':>16}")
+    
+    reference = None
+    for backend in backends:
+        try:
+            engine = create_engine("semantic", embedding_model_name=model_name, 
+                                   embedding_backend=backend)
+        except Exception as e:
+            print(f"{backend:<10} unavailable: {e}")
+            continue
+            
+        # Warm up the backend
+        for query in QUERIES:
+            engine._encode_texts([query])
+            
+        latencies = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            engine._encode_texts([QUERIES[i % len(QUERIES)]])
+            latencies.append((time.perf_counter() - start) * 1000)
+            
+        # Agreement with the first backend on the same queries
+        embeddings = engine._encode_texts(QUERIES)
+        if reference is None:
+            reference = embeddings
+        cosine = (reference * embeddings).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(embeddings, axis=1))
+            
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"{backend:<10} {p50:>10.2f} {p95:>10.2f} {cosine.min():>16.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SnipRAG Query Latency Benchmark")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="sentence-transformers model name")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "int8"], 
+                        help="Embedding backends to compare (the first is the reference)")
+    parser.add_argument("--repeats", type=int, default=200, help="Timed queries per backend")
+    
+    args = parser.parse_args()
+    run_benchmark(args.model, args.backends, args.repeats)
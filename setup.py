@@ -36,7 +36,7 @@ setup(
         "pillow>=9.0.0",
         "boto3>=1.18.0",
         "sentence-transformers>=2.2.0",
-        "faiss-cpu>=1.7.0",
+        "faiss-cpu>=1.9.0",
         "langchain>=0.0.200",
     ],
     extras_require={
@@ -52,6 +52,9 @@ setup(
         "ocr": [
             "pytesseract>=0.3.10",
         ],
+        "onnx": [
+            "sentence-transformers[onnx]>=3.2.0",
+        ],
         "all": [
             "matplotlib>=3.5.0",
             "pytesseract>=0.3.10",
@@ -5,6 +5,11 @@ SnipRAG Core module - Retrieval Augmented Generation with image snippets from PD
 from .base_engine import BaseSnipRAGEngine
 from .semantic_engine import SemanticSnipRAGEngine
 from .ocr_engine import OCRSnipRAGEngine
+from .image_store import PageImageStore
+from .disk_cache import DiskCache
+from .query_cache import QueryCache
+from .chunk_store import ChunkStore
+from .filter_index import FilterIndex
 
 def create_engine(strategy: str = "semantic", **kwargs):
     """
@@ -3,11 +3,17 @@ SnipRAG Base Engine - Common functionality for all SnipRAG engines.
 """
 
 import os
+import hashlib
+import inspect
 import logging
+import platform
 import tempfile
+import threading
 import base64
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, Optional, Set, Tuple, Union, Callable, Iterable, Iterator
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import fitz  # PyMuPDF
 import boto3
 import faiss
@@ -18,150 +24,1540 @@ from sentence_transformers import SentenceTransformer
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 
+from .image_store import PageImageStore
+from .disk_cache import DiskCache
+from .query_cache import QueryCache
+from .chunk_store import ChunkStore, ChunkColumn, _json_default
+from .filter_index import FilterIndex
+
 logger = logging.getLogger(__name__)
 
+# Number of IVF lists and HNSW neighbours of the named index types, and IVF lists probed by default
+_IVF_LISTS = 1024
+_HNSW_NEIGHBORS = 32
+_DEFAULT_NPROBE = 16
+
+# Filtered searches selecting at most this many vectors compute their distances exactly
+_EXACT_SCAN_LIMIT = 10_000
+
+# Version of the on-disk layout written by save()
+_SAVE_FORMAT_VERSION = 1
+
+# Directory the int8 ONNX exports of embedding models are written to and reused from
+_INT8_MODEL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sniprag", "int8")
+
+
+def _encode_takes_pool(model: Any) -> bool:
+    """Check whether a model's encode() runs on a multi-process pool itself."""
+    return "pool" in inspect.signature(model.encode).parameters
+
+def _write_json(path: str, data: Any):
+    """Write a JSON file, replacing any existing file atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, default=_json_default, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def _open_pdf(pdf_source: Union[str, bytes]) -> fitz.Document:
+    """
+    Open a PDF from a file path or from its raw bytes.
+    
+    Args:
+        pdf_source: Path to the PDF file, or the PDF contents as bytes
+        
+    Returns:
+        The opened PyMuPDF document
+    """
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=bytes(pdf_source), filetype="pdf")
+    return fitz.open(pdf_source)
+
+
+def _merge_images(images: Dict[str, Dict[str, bytes]], new_images: Dict[str, Dict[str, bytes]]):
+    """
+    Merge images produced by a page extractor into an accumulated result.
+    
+    Args:
+        images: Accumulated images by store name and key, updated in place
+        new_images: Images to add
+    """
+    for store_name, store_images in new_images.items():
+        images.setdefault(store_name, {}).update(store_images)
+
+
+def _collect_pages(extractor: Callable, pdf_path: Union[str, bytes], document_id: str,
+                   page_numbers: List[int], options: Dict[str, Any]) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]:
+    """
+    Run a page extractor over a range of pages and merge its per-page output.
+    This is a module-level function so it can run in a worker process.
+    
+    Args:
+        extractor: Page extractor of the engine (see BaseSnipRAGEngine._page_extractor)
+        pdf_path: Path to the PDF file, or the PDF contents as bytes
+        document_id: Unique identifier for the document
+        page_numbers: Pages to process, in order
+        options: Extraction settings from the engine
+        
+    Returns:
+        Tuple of (list of (text_chunk, metadata), images by store name and key)
+    """
+    chunks_with_metadata = []
+    images = {}
+    for page_chunks, page_images in extractor(pdf_path, document_id, page_numbers, options):
+        chunks_with_metadata.extend(page_chunks)
+        _merge_images(images, page_images)
+    return chunks_with_metadata, images
+
+
 class BaseSnipRAGEngine:
     """
     Base class for SnipRAG engines providing common functionality.
     """
     
-    def __init__(self, embedding_model_name: str = "all-MiniLM-L6-v2", 
-                 aws_credentials: Optional[Dict[str, str]] = None):
+    def __init__(self, embedding_model_name: str = "all-MiniLM-L6-v2", 
+                 aws_credentials: Optional[Dict[str, str]] = None,
+                 image_memory_limit: Optional[int] = None,
+                 image_spill_dir: Optional[str] = None,
+                 workers: int = 1,
+                 stream_batch_size: Optional[int] = None,
+                 incremental_updates: bool = True,
+                 snippet_dpi: int = 300,
+                 embedding_cache_dir: Optional[str] = None,
+                 embedding_cache_size: Optional[int] = None,
+                 share_duplicate_vectors: bool = False,
+                 encode_batch_size: int = 32,
+                 normalize_embeddings: bool = False,
+                 embedding_processes: Union[int, str, None] = None,
+                 embedding_backend: str = "torch",
+                 query_cache_size: int = 1024,
+                 normalize_query_keys: bool = False,
+                 index_type: str = "flat",
+                 index_factory: Optional[str] = None,
+                 index_training_size: Optional[int] = None,
+                 index_migrations: Optional[Dict[int, str]] = None,
+                 filter_fields: Iterable[str] = ("document_id", "page_number", "source")):
+        """
+        Initialize the base SnipRAG Engine.
+        
+        Args:
+            embedding_model_name: Name of the sentence-transformers model to use for embeddings
+            aws_credentials: Optional AWS credentials for accessing S3
+            image_memory_limit: Optional byte budget for images held in memory by each image
+                store; least recently used images beyond it are spilled to disk
+            image_spill_dir: Optional directory for spilled images (a temporary directory
+                is used if a memory limit is set without one)
+            workers: Number of worker processes used to extract pages in parallel
+            stream_batch_size: If set, process_pdf and the batch methods stream chunks page
+                by page and embed them in micro-batches of this size, so peak memory does
+                not grow with document length
+            incremental_updates: If True, re-processing a document_id skips unchanged
+                documents and only re-extracts and re-embeds pages whose content changed
+            snippet_dpi: Resolution of the page images that snippets are cut from
+            embedding_cache_dir: Optional directory of a persistent cache of chunk embeddings
+                keyed by model and chunk text, so unchanged chunks are not re-encoded
+            embedding_cache_size: Optional size cap of the embedding cache in bytes; least
+                recently used embeddings beyond it are evicted
+            share_duplicate_vectors: If True, chunks with identical text share a single
+                vector in the index, and search returns every chunk behind a matching vector
+            encode_batch_size: Number of texts per batch sent through the embedding model;
+                texts are sorted by length first so each batch pads to similar lengths
+            normalize_embeddings: If True, chunk and query embeddings are scaled to unit
+                length, so distances in the index follow cosine similarity
+            embedding_processes: Number of CPU processes embedding chunks during ingestion,
+                or "auto" for one per core; the pool lives until close() (default: in-process)
+            embedding_backend: How the embedding model runs: "torch" (full precision),
+                "onnx" (ONNX Runtime, needs the onnx extra) or "int8" (ONNX Runtime
+                with dynamically quantized int8 weights, needs the onnx extra)
+            query_cache_size: Maximum number of query embeddings kept in an in-memory
+                LRU cache on the search path; 0 disables the cache
+            normalize_query_keys: If True, queries differing only in whitespace or case
+                share a query cache entry
+            index_type: Vector index used for search: "flat" (exact), "ivf", "hnsw"
+                or "ivfpq" (approximate)
+            index_factory: Optional FAISS index_factory string (e.g. "IVF4096,PQ32"),
+                overriding index_type
+            index_training_size: Number of vectors buffered in an exact index before an
+                index that needs training (IVF, PQ) is trained and takes over; at least
+                one vector per IVF list and PQ centroid, defaulting to 39
+            index_migrations: Optional mapping of chunk counts to index types or factory
+                strings (e.g. {100_000: "ivf", 5_000_000: "ivfpq"}); once the corpus
+                reaches a count, the index is rebuilt as that type in a background
+                thread while the current index keeps serving searches
+            filter_fields: Metadata fields with inverted indexes, so searches filtered on
+                them are restricted to matching chunks inside FAISS. Up to 10,000 matching
+                vectors are compared directly and return exactly top_k results; larger
+                matches on IVF and HNSW indexes can return fewer, depending on nprobe and
+                ef_search. Filters on other fields are applied after the search
+        """
+        self.aws_credentials = aws_credentials
+        self.image_memory_limit = image_memory_limit
+        self.image_spill_dir = image_spill_dir
+        
+        # Process pool for page extraction, created on first use
+        self.workers = workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        
+        self.stream_batch_size = stream_batch_size
+        
+        # Content hashes of processed documents and their pages, for incremental updates
+        self.incremental_updates = incremental_updates
+        self.document_hashes = {}
+        
+        # Initialize the embedding model
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_model = self._load_embedding_model(embedding_model_name, embedding_backend)
+        self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
+        self.encode_batch_size = encode_batch_size
+        self.normalize_embeddings = normalize_embeddings
+        
+        # Embedding processes for bulk ingestion, started on first use
+        if embedding_processes == "auto":
+            embedding_processes = os.cpu_count() or 1
+        self.embedding_processes = embedding_processes or 1
+        self._embedding_pool = None
+        
+        # Persistent cache of chunk embeddings
+        self.embedding_cache = None
+        if embedding_cache_dir:
+            self.embedding_cache = DiskCache(os.path.join(embedding_cache_dir, "embedding_cache.sqlite"),
+                                             max_bytes=embedding_cache_size)
+                                             
+        # Recently used query embeddings, emptied when the embedding model changes
+        self.query_cache = QueryCache(query_cache_size, normalize_keys=normalize_query_keys)
+        
+        # Initialize an in-memory FAISS index for vector storage, keyed by chunk ID
+        self.index_type = index_type
+        self.index_factory = index_factory or self._index_factory_string(index_type)
+        self.index_training_size = index_training_size
+        if index_training_size:
+            minimum = self._minimum_training_size(self._create_index())
+            if index_training_size < minimum:
+                raise ValueError(f"index_training_size must be at least {minimum} for a {self.index_factory} index, "
+                                 f"got {index_training_size}")
+                                 
+        # Index types to migrate to as the corpus grows, and the background rebuild in progress
+        self.index_migrations = sorted(
+            (threshold, self._index_factory_string(target) if target in ("flat", "ivf", "hnsw", "ivfpq") else target)
+            for threshold, target in (index_migrations or {}).items()
+        )
+        self._index_lock = threading.Lock()
+        self._index_generation = 0
+        self._migration_thread = None
+        self._migration_log = None
+        self._reset_index()
+        
+        # Columnar storage for chunk texts, metadata, coordinates and stable 64-bit
+        # chunk IDs, one row per chunk
+        self.chunks = ChunkStore()
+        
+        # The row of each chunk ID, and the IDs belonging to each document
+        self._chunk_rows = {}
+        self._document_chunks = {}
+        
+        # Vectors of the chunks with each value of the filterable metadata fields
+        self.filter_index = FilterIndex(filter_fields)
+        self._next_chunk_id = 0
+        
+        # With shared vectors, the vector of each chunk text, the chunks using each
+        # vector, and the vector of each chunk
+        self.share_duplicate_vectors = share_duplicate_vectors
+        self._text_vectors = {}
+        self._vector_chunks = {}
+        self._chunk_vectors = {}
+        
+        # Storage for page images
+        self.page_images = self._create_image_store("pages")
+        
+        # Source PDFs (path or bytes) for documents whose snippets are rendered
+        # on demand, and the clipped renders produced so far
+        self.pdf_sources = {}
+        self.snippet_images = self._create_image_store("snippets")
+        self._page_snippets = {}
+        
+        # Padding for image snippets (in pixels, applied to all sides)
+        self.snippet_padding = 20
+        
+        # Chunk coordinates are stored in PDF points and scaled to this resolution for snippets
+        self.snippet_dpi = snippet_dpi
+        
+        # Text splitter for chunking documents
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+    
+    @property
+    def documents(self) -> ChunkColumn:
+        """Text of each chunk, by row."""
+        return self.chunks.texts
+    
+    @property
+    def document_metadata(self) -> ChunkColumn:
+        """Metadata of each chunk, by row, materialized when accessed."""
+        return self.chunks.metadata
+    
+    @property
+    def text_coordinates(self) -> ChunkColumn:
+        """Coordinates of each chunk in PDF points, by row."""
+        return self.chunks.coordinates
+    
+    @property
+    def chunk_ids(self) -> ChunkColumn:
+        """Chunk ID of each row."""
+        return self.chunks.chunk_ids
+    
+    def _load_embedding_model(self, model_name: str, backend: str) -> SentenceTransformer:
+        """
+        Load the embedding model on the given backend.
+        Subclasses can override this to plug in other backends.
+        
+        Args:
+            model_name: Name of the sentence-transformers model
+            backend: "torch", "onnx" or "int8"
+            
+        Returns:
+            Model with a sentence-transformers compatible encode()
+            
+        Raises:
+            ValueError: If an invalid backend is specified
+        """
+        if backend == "torch":
+            return SentenceTransformer(model_name)
+        elif backend == "onnx":
+            # Needs sentence-transformers>=3.2 with optimum and onnxruntime installed
+            return SentenceTransformer(model_name, backend="onnx")
+        elif backend == "int8":
+            return self._load_int8_model(model_name)
+        else:
+            raise ValueError(f"Invalid embedding backend: {backend}. Must be 'torch', 'onnx' or 'int8'.")
+    
+    def _load_int8_model(self, model_name: str) -> SentenceTransformer:
+        """
+        Load an ONNX export of the model with int8 weights and activations quantized
+        on the fly. The quantized export is made once with sentence-transformers
+        (>=3.2, with optimum and onnxruntime installed) and reused afterwards.
+        
+        Args:
+            model_name: Name of the sentence-transformers model
+            
+        Returns:
+            Model running the quantized export on ONNX Runtime
+        """
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        
+        # Quantize for the instruction set of this machine
+        config = "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+        file_name = f"onnx/model_qint8_{config}.onnx"
+        model_dir = os.path.join(_INT8_MODEL_DIR, model_name.replace("/", "--"))
+        
+        if not os.path.exists(os.path.join(model_dir, file_name)):
+            logger.info(f"Exporting {model_name} to ONNX with int8 weights in {model_dir}")
+            model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+            model.save(model_dir)
+            export_dynamic_quantized_onnx_model(model, config, model_dir)
+            
+        return SentenceTransformer(model_dir, backend="onnx", device="cpu", model_kwargs={"file_name": file_name})
+    
+    def _index_factory_string(self, index_type: str) -> str:
+        """
+        Get the FAISS index_factory string of a named index type.
+        
+        Args:
+            index_type: "flat", "ivf", "hnsw" or "ivfpq"
+            
+        Returns:
+            The index_factory string
+            
+        Raises:
+            ValueError: If an invalid index type is specified
+        """
+        if index_type == "flat":
+            return "Flat"
+        elif index_type == "ivf":
+            return f"IVF{_IVF_LISTS},Flat"
+        elif index_type == "hnsw":
+            return f"HNSW{_HNSW_NEIGHBORS}"
+        elif index_type == "ivfpq":
+            # Largest number of sub-quantizers of at least 4 dimensions each dividing the embedding size
+            subquantizers = max(m for m in range(1, self.embedding_dim // 4 + 1) if self.embedding_dim % m == 0)
+            return f"IVF{_IVF_LISTS},PQ{subquantizers}"
+        else:
+            raise ValueError(f"Invalid index type: {index_type}. Must be 'flat', 'ivf', 'hnsw' or 'ivfpq'.")
+    
+    def _create_index(self, index_factory: Optional[str] = None) -> faiss.Index:
+        """
+        Create an empty vector index that stores vectors under their chunk IDs.
+        
+        Args:
+            index_factory: FAISS index_factory string; defaults to the configured index
+            
+        Returns:
+            FAISS index supporting add_with_ids, possibly still untrained
+        """
+        index = faiss.index_factory(self.embedding_dim, index_factory or self.index_factory)
+        
+        try:
+            ivf = faiss.extract_index_ivf(index)
+        except RuntimeError:
+            # Other indexes number vectors sequentially, so map chunk IDs onto them
+            return faiss.IndexIDMap2(index)
+            
+        # IVF lists store chunk IDs themselves; an ID-to-list hashtable supports
+        # reconstructing and removing vectors by ID
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        
+        # Probe more than one list by default, or IVF recall is poor
+        ivf.nprobe = min(_DEFAULT_NPROBE, ivf.nlist)
+        return index
+    
+    def _reset_index(self):
+        """
+        Replace the vector index with an empty one.
+        Indexes that need training start as an exact flat index that holds the
+        vectors until enough are available to train the configured index.
+        """
+        index = self._create_index()
+        with self._index_lock:
+            self._index_training = not index.is_trained
+            if self._index_training:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.embedding_dim))
+            self.index = index
+            self.active_index_factory = self.index_factory
+            
+            # Whether the index is memory-mapped from a saved file and must be copied before changes
+            self._mapped_index = False
+            
+            # Vectors deleted from indexes that cannot remove them (e.g. HNSW), excluded at search time
+            self._deleted_vectors = set()
+            self._deleted_selector = None
+            
+            # Discard any migration still building from the previous index
+            self._index_generation += 1
+            self._migration_stage = 0
+            self._migration_thread = None
+            self._migration_log = None
+    
+    def _minimum_training_size(self, index: faiss.Index) -> int:
+        """
+        Get the fewest vectors an index can be trained on.
+        
+        Args:
+            index: Index created by _create_index
+            
+        Returns:
+            The number of IVF lists or PQ centroids, whichever is larger, or 0 for
+            indexes that need no training
+        """
+        try:
+            quantizer = faiss.downcast_index(faiss.extract_index_ivf(index))
+        except RuntimeError:
+            quantizer = faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap2) else index)
+        pq = getattr(quantizer, "pq", None)
+        return max(getattr(quantizer, "nlist", 0), pq.ksub if pq is not None else 0)
+    
+    def _training_size(self, index: faiss.Index) -> int:
+        """
+        Get the number of vectors needed to train an index.
+        
+        Args:
+            index: Untrained index of the configured type
+            
+        Returns:
+            The configured training size, or 39 vectors per IVF list or PQ centroid
+        """
+        if self.index_training_size:
+            return self.index_training_size
+        return 39 * max(self._minimum_training_size(index), 256)
+    
+    def _train_index(self):
+        """Train the configured index once enough vectors are buffered, and move them into it."""
+        if not self._index_training:
+            return
+            
+        index = self._create_index()
+        if self.index.ntotal < self._training_size(index):
+            return
+            
+        # Take the buffered vectors and their chunk IDs out of the flat index
+        vector_ids = faiss.vector_to_array(self.index.id_map).astype('int64')
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        
+        # The buffer keeps serving if training fails, and training is retried on the next add
+        logger.info(f"Training {self.index_factory} index on {len(vectors)} vectors")
+        try:
+            index.train(vectors)
+            index.add_with_ids(vectors, vector_ids)
+        except RuntimeError as e:
+            logger.error(f"Error training {self.index_factory} index: {str(e)}")
+            return
+            
+        with self._index_lock:
+            self.index = index
+            self._index_training = False
+    
+    def _index_vectors(self, index: faiss.Index, deleted_vectors: Set[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the IDs and vectors stored in an index, leaving out deleted vectors.
+        
+        Args:
+            index: Index created by _create_index
+            deleted_vectors: IDs of vectors deleted from the index but still stored in it
+            
+        Returns:
+            Tuple of (vector IDs, vectors), lossy for compressed (PQ) indexes
+        """
+        if isinstance(index, faiss.IndexIDMap2):
+            vector_ids = faiss.vector_to_array(index.id_map).astype('int64')
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+        else:
+            invlists = faiss.extract_index_ivf(index).invlists
+            vector_ids = np.concatenate([np.zeros(0, dtype='int64')] + [
+                faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+                for list_no in range(invlists.nlist)
+            ])
+            vectors = index.reconstruct_batch(vector_ids)
+            
+        if deleted_vectors:
+            keep = ~np.isin(vector_ids, np.array(list(deleted_vectors), dtype='int64'))
+            vector_ids, vectors = vector_ids[keep], vectors[keep]
+        return vector_ids, vectors
+    
+    def _migrate_index(self):
+        """Start rebuilding the index as the next index type once the corpus is large enough."""
+        if self._migration_thread is not None:
+            return
+            
+        # Skip straight to the last stage whose threshold has been reached
+        target = None
+        while (self._migration_stage < len(self.index_migrations) and
+               len(self.chunk_ids) >= self.index_migrations[self._migration_stage][0]):
+            target = self.index_migrations[self._migration_stage][1]
+            self._migration_stage += 1
+        if target is None or target == self.active_index_factory:
+            return
+            
+        # Copy the current index, which only copies its stored codes, and log changes
+        # made while the new index is built; the vectors are read from the copy in the
+        # background, without holding the lock
+        with self._index_lock:
+            snapshot = faiss.clone_index(self.index)
+            self._migration_log = []
+            self._migration_thread = threading.Thread(
+                target=self._build_migrated_index,
+                args=(target, snapshot, set(self._deleted_vectors), self._index_generation),
+                daemon=True
+            )
+        logger.info(f"Migrating index to {target} at {len(self.chunk_ids)} chunks")
+        self._migration_thread.start()
+    
+    def _build_migrated_index(self, index_factory: str, snapshot: faiss.Index,
+                              deleted_vectors: Set[int], generation: int):
+        """
+        Build a new index from a snapshot of the current one and swap it in.
+        Runs in a background thread; the current index keeps serving until the swap.
+        
+        Args:
+            index_factory: FAISS index_factory string of the new index
+            snapshot: Copy of the current index
+            deleted_vectors: IDs of vectors deleted from the snapshot but still stored in it
+            generation: Index generation the snapshot was taken from
+        """
+        try:
+            vector_ids, vectors = self._index_vectors(snapshot, deleted_vectors)
+            index = self._create_index(index_factory)
+            if not index.is_trained:
+                index.train(vectors)
+            index.add_with_ids(vectors, vector_ids)
+        except Exception as e:
+            logger.error(f"Error migrating index to {index_factory}: {str(e)}")
+            with self._index_lock:
+                if generation == self._index_generation:
+                    self._migration_thread = None
+                    self._migration_log = None
+            return
+            
+        with self._index_lock:
+            # The index was cleared while this one was being built
+            if generation != self._index_generation:
+                return
+                
+            # Replay the changes made since the snapshot, then swap
+            deleted_vectors = set()
+            for operation, ids, embeddings in self._migration_log:
+                if operation == "add":
+                    index.add_with_ids(embeddings, ids)
+                elif not self._remove_from_index(index, ids):
+                    deleted_vectors.update(ids.tolist())
+                    
+            self.index = index
+            self.active_index_factory = index_factory
+            self._index_training = False
+            self._deleted_vectors = deleted_vectors
+            self._deleted_selector = None
+            self._migration_thread = None
+            self._migration_log = None
+            
+        logger.info(f"Migrated index to {index_factory} with {index.ntotal} vectors")
+    
+    def wait_for_index_migration(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a background index migration to finish.
+        
+        Args:
+            timeout: Maximum number of seconds to wait, or None to wait indefinitely
+            
+        Returns:
+            True if no migration is running anymore, False if the timeout expired
+        """
+        thread = self._migration_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+    
+    def _search_parameters(self, index: faiss.Index, nprobe: Optional[int], ef_search: Optional[int],
+                           selector: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+        """
+        Build per-query FAISS search parameters. Call with the index lock held.
+        
+        Args:
+            index: Index the parameters are for
+            nprobe: Number of IVF lists to visit, or None for the index default
+            ef_search: HNSW search queue size, or None for the index default
+            selector: Optional selector of the vectors to search, which must not
+                include deleted vectors
+                
+        Returns:
+            Search parameters, or None if the index defaults apply
+        """
+        # Exclude vectors deleted from an index that cannot remove them
+        if selector is None and self._deleted_vectors:
+            if self._deleted_selector is None:
+                deleted = faiss.IDSelectorBatch(np.array(sorted(self._deleted_vectors), dtype='int64'))
+                self._deleted_selector = (faiss.IDSelectorNot(deleted), deleted)
+            selector = self._deleted_selector[0]
+            
+        if isinstance(index, faiss.IndexIDMap2):
+            index = index.index
+        try:
+            ivf = faiss.extract_index_ivf(index)
+        except RuntimeError:
+            ivf = None
+        base = faiss.downcast_index(index)
+        
+        # IVF and HNSW indexes reject parameters of other types, so they always get
+        # their own, with the index defaults filled in
+        if nprobe is None and ef_search is None and selector is None:
+            return None
+        elif ivf is not None:
+            params = faiss.SearchParametersIVF(nprobe=nprobe or ivf.nprobe)
+        elif isinstance(base, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=ef_search or base.hnsw.efSearch)
+        elif selector is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+            
+        if selector is not None:
+            params.sel = selector
+        return params
+    
+    def _create_image_store(self, name: str) -> PageImageStore:
+        """
+        Create a store for rendered images.
+        Subclasses can override this to plug in a different store implementation.
+        
+        Args:
+            name: Name of the store, used for its spill subdirectory
+            
+        Returns:
+            A dictionary-like image store
+        """
+        spill_dir = None
+        if self.image_spill_dir:
+            spill_dir = os.path.join(self.image_spill_dir, name)
+        return PageImageStore(max_memory_bytes=self.image_memory_limit, spill_dir=spill_dir)
+    
+    def download_pdf_from_s3(self, s3_uri: str) -> str:
+        """
+        Download a PDF from S3 to a temporary file.
+        
+        Args:
+            s3_uri: S3 URI of the PDF
+            
+        Returns:
+            Path to the downloaded temporary file
+        """
+        # Parse the S3 URI
+        if not s3_uri.startswith('s3://'):
+            raise ValueError(f"Invalid S3 URI format: {s3_uri}")
+            
+        s3_parts = s3_uri[5:].split('/', 1)  # Remove 's3://' and split on first '/'
+        if len(s3_parts) != 2:
+            raise ValueError(f"Invalid S3 URI format: {s3_uri}")
+            
+        bucket_name = s3_parts[0]
+        object_key = s3_parts[1]
+        
+        # Create a temporary file
+        temp_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        temp_path = temp_file.name
+        temp_file.close()
+        
+        # Download the file
+        if self.aws_credentials:
+            s3_client = boto3.client('s3', **self.aws_credentials)
+        else:
+            s3_client = boto3.client('s3')
+            
+        s3_client.download_file(bucket_name, object_key, temp_path)
+        
+        return temp_path
+    
+    def process_pdf(self, pdf_path: str, document_id: str) -> bool:
+        """
+        Process a PDF file and add it to the SnipRAG engine.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            document_id: Unique identifier for the document
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            # Work out which pages are new or changed since the last time
+            plan = self._plan_update(pdf_path, document_id)
+            if plan is None:
+                logger.info(f"Document {document_id} is unchanged, skipping")
+                return True
+                
+            if self.stream_batch_size:
+                self._process_pdf_streaming(pdf_path, document_id, plan)
+                return True
+                
+            # Extract text from PDF - the page extractor is implemented by subclasses
+            chunks_with_metadata, images = self._extract_document(pdf_path, document_id, plan["pages"])
+            
+            # Replace the stale pages with the new ones
+            self._remove_pages(document_id, plan["stale_pages"])
+            self._store_images(images)
+            
+            # Create embeddings and add to index
+            self._add_chunks_to_index(chunks_with_metadata)
+            
+            self._record_hashes(document_id, plan)
+            return True
+                
+        except Exception as e:
+            logger.error(f"Error processing document {document_id}: {str(e)}")
+            return False
+    
+    def process_document_from_s3(self, s3_uri: str, document_id: str) -> bool:
+        """
+        Process a document from S3 and add it to the SnipRAG engine.
+        
+        Args:
+            s3_uri: S3 URI of the document PDF
+            document_id: Unique identifier for the document
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            # Download the PDF
+            temp_path = self.download_pdf_from_s3(s3_uri)
+            
+            try:
+                # Process the PDF
+                return self.process_pdf(temp_path, document_id)
+                
+            finally:
+                # Keep the PDF bytes for on-demand rendering once the temporary file is gone
+                if self.pdf_sources.get(document_id) == temp_path:
+                    with open(temp_path, "rb") as f:
+                        self.pdf_sources[document_id] = f.read()
+                
+                # Clean up the temporary file
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                    
+        except Exception as e:
+            logger.error(f"Error processing document {document_id} from S3: {str(e)}")
+            return False
+    
+    def _process_pdf_streaming(self, pdf_path: Union[str, bytes], document_id: str, plan: Dict[str, Any]) -> int:
+        """
+        Process a PDF page by page, embedding and indexing chunks in micro-batches.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
+            plan: Update plan from _plan_update
+            
+        Returns:
+            Number of chunks indexed
+        """
+        self._remove_pages(document_id, plan["stale_pages"])
+        existing = set(self._document_chunks.get(document_id, ()))
+        
+        try:
+            batch = []
+            num_chunks = 0
+            for chunks_with_metadata, images in self._iter_document(pdf_path, document_id, plan["pages"]):
+                self._store_images(images)
+                batch.extend(chunks_with_metadata)
+                num_chunks += len(chunks_with_metadata)
+                
+                while len(batch) >= self.stream_batch_size:
+                    self._add_chunks_to_index(batch[:self.stream_batch_size])
+                    del batch[:self.stream_batch_size]
+                    
+            self._add_chunks_to_index(batch)
+        except Exception:
+            # Roll back the micro-batches already indexed, since the hashes are only
+            # recorded once the whole document is, and a retry would index them again
+            self._remove_chunks([chunk_id for chunk_id in self._document_chunks.get(document_id, ())
+                                 if chunk_id not in existing])
+            if plan["pages"] is not None:
+                self._remove_page_images(document_id, plan["pages"])
+            raise
+            
+        self._record_hashes(document_id, plan)
+        return num_chunks
+    
+    def _plan_update(self, pdf_path: Union[str, bytes], document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Compare a PDF against the hashes recorded for its document_id.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
+            
+        Returns:
+            None if the document is unchanged, otherwise a dictionary with the new
+            "content_hash" and "page_hashes", the "pages" to extract and the
+            "stale_pages" whose existing chunks must be removed
+        """
+        if not self.incremental_updates:
+            return {"content_hash": None, "page_hashes": None, 
+                    "pages": None, "stale_pages": []}
+                    
+        content_hash = self._hash_content(pdf_path)
+        previous = self.document_hashes.get(document_id)
+        if previous is not None and previous["content_hash"] == content_hash:
+            return None
+            
+        page_hashes = self._hash_pages(pdf_path)
+        if previous is None:
+            pages = list(range(len(page_hashes)))
+            stale_pages = []
+        else:
+            old_hashes = previous["page_hashes"]
+            pages = [i for i, page_hash in enumerate(page_hashes)
+                     if i >= len(old_hashes) or old_hashes[i] != page_hash]
+                     
+            # Changed pages and pages that no longer exist
+            stale_pages = [i for i in pages if i < len(old_hashes)]
+            stale_pages.extend(range(len(page_hashes), len(old_hashes)))
+            
+        return {"content_hash": content_hash, "page_hashes": page_hashes,
+                "pages": pages, "stale_pages": stale_pages}
+    
+    def _record_hashes(self, document_id: str, plan: Dict[str, Any]):
+        """
+        Record the hashes of a document once its update has been indexed.
+        
+        Args:
+            document_id: Unique identifier for the document
+            plan: Update plan from _plan_update
+        """
+        if plan["content_hash"] is not None:
+            self.document_hashes[document_id] = {
+                "content_hash": plan["content_hash"],
+                "page_hashes": plan["page_hashes"]
+            }
+    
+    def _hash_content(self, pdf_path: Union[str, bytes]) -> str:
+        """
+        Hash the raw bytes of a PDF.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            
+        Returns:
+            Hex digest of the file contents
+        """
+        if isinstance(pdf_path, (bytes, bytearray)):
+            return hashlib.sha256(pdf_path).hexdigest()
+            
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _hash_pages(self, pdf_path: Union[str, bytes]) -> List[str]:
+        """
+        Hash the content of each page of a PDF: its geometry, content stream,
+        and the streams of the images and form XObjects it uses.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            
+        Returns:
+            Hex digest for each page
+        """
+        page_hashes = []
+        doc = _open_pdf(pdf_path)
+        try:
+            for page in doc:
+                digest = hashlib.sha256()
+                digest.update(repr((tuple(page.rect), page.rotation)).encode())
+                digest.update(page.read_contents())
+                
+                xrefs = {img[0] for img in page.get_images(full=True)}
+                xrefs.update(xobj[0] for xobj in page.get_xobjects())
+                for xref in sorted(xrefs):
+                    digest.update(doc.xref_stream_raw(xref) or b"")
+                    
+                page_hashes.append(digest.hexdigest())
+        finally:
+            doc.close()
+        return page_hashes
+    
+    def remove_document(self, document_id: str) -> bool:
+        """
+        Remove a document's chunks, images and source from the engine.
+        
+        Args:
+            document_id: Unique identifier for the document
+            
+        Returns:
+            True if the document was found and removed, False otherwise
+        """
+        chunk_ids = self._document_chunks.get(document_id)
+        hashes = self.document_hashes.pop(document_id, None)
+        if chunk_ids is None and hashes is None and document_id not in self.pdf_sources:
+            return False
+            
+        # Pages with chunks, plus pages without text that still have images
+        page_numbers = {self.chunks.value(self._chunk_rows[chunk_id], "page_number")
+                        for chunk_id in chunk_ids or ()}
+        if hashes is not None:
+            page_numbers.update(range(len(hashes["page_hashes"])))
+            
+        self._remove_chunks(list(chunk_ids or ()))
+        self._remove_page_images(document_id, sorted(page_numbers))
+        self.pdf_sources.pop(document_id, None)
+        return True
+    
+    def replace_document(self, pdf_path: Union[str, bytes], document_id: str) -> bool:
+        """
+        Replace a document with a new version, re-processing it from scratch.
+        Use process_pdf to re-process only the pages that changed.
+        
+        Args:
+            pdf_path: Path to the new PDF file, or its contents as bytes
+            document_id: Unique identifier for the document
+            
+        Returns:
+            True if the new version was processed successfully, False otherwise
+        """
+        self.remove_document(document_id)
+        return self.process_pdf(pdf_path, document_id)
+    
+    def _remove_pages(self, document_id: str, page_numbers: List[int]):
+        """
+        Remove the chunks and images of some pages of a document.
+        
+        Args:
+            document_id: Unique identifier for the document
+            page_numbers: Pages to remove
+        """
+        if not page_numbers:
+            return
+            
+        pages = set(page_numbers)
+        chunk_ids = [chunk_id for chunk_id in self._document_chunks.get(document_id, ())
+                     if self.chunks.value(self._chunk_rows[chunk_id], "page_number") in pages]
+        self._remove_chunks(chunk_ids)
+        self._remove_page_images(document_id, page_numbers)
+    
+    def _remove_chunks(self, chunk_ids: List[int]):
+        """
+        Remove chunks from the index and the chunk store.
+        The cost is proportional to the number of chunks removed.
+        
+        Args:
+            chunk_ids: IDs of the chunks to remove
+        """
+        if not chunk_ids:
+            return
+            
+        self.filter_index.remove([self._chunk_vectors.get(chunk_id, chunk_id) for chunk_id in chunk_ids],
+                                 [self.chunks.row_metadata(self._chunk_rows[chunk_id]) for chunk_id in chunk_ids])
+                                 
+        # Drop vectors no longer referenced by any chunk
+        removed_vectors = []
+        for chunk_id in chunk_ids:
+            vector_id = self._chunk_vectors.pop(chunk_id, chunk_id)
+            references = self._vector_chunks.get(vector_id)
+            if references is not None:
+                references.remove(chunk_id)
+                if references:
+                    continue
+                del self._vector_chunks[vector_id]
+                text = self.chunks.text(self._chunk_rows[chunk_id])
+                if self._text_vectors.get(text) == vector_id:
+                    del self._text_vectors[text]
+            removed_vectors.append(vector_id)
+            
+        self._remove_vectors(removed_vectors)
+        
+        # Fill each hole with the last row, working from the end so the last row
+        # is never one that is about to be removed
+        for row in sorted((self._chunk_rows.pop(chunk_id) for chunk_id in chunk_ids), reverse=True):
+            document_id = self.chunks.value(row, "document_id")
+            document_chunks = self._document_chunks[document_id]
+            document_chunks.discard(self.chunks.chunk_id(row))
+            if not document_chunks:
+                del self._document_chunks[document_id]
+                
+            moved = self.chunks.swap_remove(row)
+            if moved is not None:
+                self._chunk_rows[moved] = row
+    
+    def _remove_vectors(self, vector_ids: List[int]):
+        """
+        Remove vectors from the index by ID.
+        
+        Args:
+            vector_ids: IDs of the vectors to remove
+        """
+        vector_ids = np.array(vector_ids, dtype='int64')
+        with self._index_lock:
+            self._own_index()
+            if not self._remove_from_index(self.index, vector_ids):
+                # Graph indexes cannot remove vectors, so hide them from searches instead
+                self._deleted_vectors.update(vector_ids.tolist())
+                self._deleted_selector = None
+            if self._migration_log is not None:
+                self._migration_log.append(("remove", vector_ids, None))
+    
+    def _own_index(self):
+        """Copy a memory-mapped index into memory before it is changed. Call with the index lock held."""
+        if not self._mapped_index:
+            return
+            
+        if isinstance(self.index, faiss.IndexIDMap2):
+            # Vectors mapped from the file are read-only views
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        else:
+            # Inverted lists mapped from the file cannot grow, so copy them into memory
+            ivf = faiss.extract_index_ivf(self.index)
+            mapped = ivf.invlists
+            lists = faiss.ArrayInvertedLists(mapped.nlist, mapped.code_size)
+            for list_no in range(mapped.nlist):
+                size = mapped.list_size(list_no)
+                if size:
+                    lists.add_entries(list_no, size, mapped.get_ids(list_no), mapped.get_codes(list_no))
+            ivf.replace_invlists(lists, True)
+            lists.this.disown()
+            
+        self._mapped_index = False
+    
+    def _remove_from_index(self, index: faiss.Index, vector_ids: np.ndarray) -> bool:
+        """
+        Remove vectors from an index by ID.
+        
+        Args:
+            index: Index created by _create_index
+            vector_ids: IDs of the vectors to remove
+            
+        Returns:
+            False if the index does not support removal
+        """
+        try:
+            if isinstance(index, faiss.IndexIDMap2):
+                index.remove_ids(faiss.IDSelectorBatch(vector_ids))
+            else:
+                # The IVF direct map only removes explicit lists of IDs
+                index.remove_ids(faiss.IDSelectorArray(len(vector_ids), faiss.swig_ptr(vector_ids)))
+        except RuntimeError:
+            return False
+        return True
+    
+    def _remove_page_images(self, document_id: str, page_numbers: List[int]):
+        """
+        Remove the stored images of some pages of a document.
+        Subclasses with additional image stores should extend this.
+        
+        Args:
+            document_id: Unique identifier for the document
+            page_numbers: Pages whose images should be removed
+        """
+        for page_number in page_numbers:
+            page_key = f"{document_id}_{page_number}"
+            if page_key in self.page_images:
+                del self.page_images[page_key]
+                
+            for snippet_key in self._page_snippets.pop(page_key, ()):
+                if snippet_key in self.snippet_images:
+                    del self.snippet_images[snippet_key]
+    
+    def process_pdfs(self, items: Iterable[Tuple[Union[str, bytes], str]], 
+                     index_batch_size: int = 1024, prefetch: int = 2) -> List[Dict[str, Any]]:
+        """
+        Process many PDF files, overlapping extraction with embedding and indexing.
+        
+        Extraction of upcoming documents runs in the background (in the process pool
+        when workers > 1) while chunks of earlier documents are embedded and added
+        to the index in large batches. With stream_batch_size set, documents are
+        instead streamed into the index one at a time in micro-batches, and
+        index_batch_size and prefetch are ignored.
+        
+        Args:
+            items: Iterable of (pdf_path, document_id) pairs
+            index_batch_size: Number of chunks to embed and add to the index at once
+            prefetch: Number of documents extracted ahead of the one being indexed
+            
+        Returns:
+            One result per document, in input order, with keys "document_id",
+            "success", "skipped" (unchanged documents), "num_chunks" and "error"
+        """
+        if self.stream_batch_size:
+            return self._process_batch_streaming(items, self._stream_update)
+        return self._process_batch(items, self._extract_update, index_batch_size, prefetch)
+    
+    def process_documents_from_s3(self, items: Iterable[Tuple[str, str]], 
+                                  index_batch_size: int = 1024, prefetch: int = 2) -> List[Dict[str, Any]]:
+        """
+        Process many documents from S3, overlapping download and extraction with
+        embedding and indexing. With stream_batch_size set, documents are downloaded
+        and streamed into the index one at a time, as in process_pdfs.
+        
+        Args:
+            items: Iterable of (s3_uri, document_id) pairs
+            index_batch_size: Number of chunks to embed and add to the index at once
+            prefetch: Number of documents downloaded and extracted ahead of the one being indexed
+            
+        Returns:
+            One result per document, in input order, with keys "document_id",
+            "success", "skipped" (unchanged documents), "num_chunks" and "error"
+        """
+        if self.stream_batch_size:
+            return self._process_batch_streaming(items, self._stream_s3_document)
+        return self._process_batch(items, self._extract_s3_document, index_batch_size, prefetch)
+    
+    def _process_batch(self, items: Iterable[Tuple[Any, str]], extract: Callable, 
+                       index_batch_size: int, prefetch: int) -> List[Dict[str, Any]]:
+        """
+        Run the extract -> embed -> index pipeline over many documents.
+        
+        Args:
+            items: Iterable of (source, document_id) pairs
+            extract: Function (source, document_id) -> (plan, chunks_with_metadata, images)
+            index_batch_size: Number of chunks to embed and add to the index at once
+            prefetch: Number of documents extracted ahead of the one being indexed
+            
+        Returns:
+            One result dictionary per document, in input order
+        """
+        results = []
+        
+        # Chunks waiting to be indexed, and the results and update plans of their documents
+        pending_chunks = []
+        pending_results = []
+        
+        def flush():
+            try:
+                self._add_chunks_to_index(pending_chunks)
+                for result, plan in pending_results:
+                    self._record_hashes(result["document_id"], plan)
+            except Exception as e:
+                for result, _ in pending_results:
+                    logger.error(f"Error processing document {result['document_id']}: {str(e)}")
+                    result["success"] = False
+                    result["error"] = str(e)
+            pending_chunks.clear()
+            pending_results.clear()
+            
+        item_iter = iter(items)
+        in_flight = deque()
+        
+        with ThreadPoolExecutor(max_workers=max(1, prefetch)) as executor:
+            def submit_next():
+                item = next(item_iter, None)
+                if item is not None:
+                    source, document_id = item
+                    
+                    # A repeated document can only be planned once its earlier copy is indexed
+                    queued = document_id == current_id or \
+                             any(queued_id == document_id for queued_id, _, _ in in_flight) or \
+                             any(result["document_id"] == document_id for result, _ in pending_results)
+                    future = None if queued else executor.submit(extract, source, document_id)
+                    in_flight.append((document_id, source, future))
+                    
+            current_id = None
+            for _ in range(max(1, prefetch)):
+                submit_next()
+                
+            while in_flight:
+                document_id, source, future = in_flight.popleft()
+                current_id = document_id
+                submit_next()
+                
+                result = {"document_id": document_id, "success": True, "skipped": False,
+                          "num_chunks": 0, "error": None}
+                results.append(result)
+                
+                # Index and record the earlier copy of a repeated document first
+                if future is None:
+                    flush()
+                    
+                try:
+                    if future is None:
+                        plan, chunks_with_metadata, images = extract(source, document_id)
+                    else:
+                        plan, chunks_with_metadata, images = future.result()
+                except Exception as e:
+                    logger.error(f"Error processing document {document_id}: {str(e)}")
+                    result["success"] = False
+                    result["error"] = str(e)
+                    continue
+                    
+                if plan is None:
+                    result["skipped"] = True
+                    continue
+                    
+                # Replace the stale pages before the new chunks are indexed
+                self._remove_pages(document_id, plan["stale_pages"])
+                self._store_images(images)
+                result["num_chunks"] = len(chunks_with_metadata)
+                pending_chunks.extend(chunks_with_metadata)
+                pending_results.append((result, plan))
+                
+                if len(pending_chunks) >= index_batch_size:
+                    flush()
+                    
+            flush()
+            
+        return results
+    
+    def _process_batch_streaming(self, items: Iterable[Tuple[Any, str]], 
+                                 stream: Callable) -> List[Dict[str, Any]]:
+        """
+        Stream many documents into the index one after another. Nothing is extracted
+        ahead, so peak memory stays bounded by stream_batch_size.
+        
+        Args:
+            items: Iterable of (source, document_id) pairs
+            stream: Function (source, document_id) -> number of chunks indexed, or None
+                if the document is unchanged
+                
+        Returns:
+            One result dictionary per document, in input order
+        """
+        results = []
+        for source, document_id in items:
+            result = {"document_id": document_id, "success": True, "skipped": False,
+                      "num_chunks": 0, "error": None}
+            results.append(result)
+            
+            try:
+                num_chunks = stream(source, document_id)
+            except Exception as e:
+                logger.error(f"Error processing document {document_id}: {str(e)}")
+                result["success"] = False
+                result["error"] = str(e)
+                continue
+                
+            if num_chunks is None:
+                result["skipped"] = True
+            else:
+                result["num_chunks"] = num_chunks
+                
+        return results
+    
+    def _stream_update(self, pdf_path: Union[str, bytes], document_id: str) -> Optional[int]:
+        """
+        Plan an incremental update of a document and stream the pages it needs into the index.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
+            
+        Returns:
+            Number of chunks indexed, or None if the document is unchanged
+        """
+        plan = self._plan_update(pdf_path, document_id)
+        if plan is None:
+            return None
+        return self._process_pdf_streaming(pdf_path, document_id, plan)
+    
+    def _extract_update(self, pdf_path: Union[str, bytes], document_id: str) -> Tuple[Optional[Dict[str, Any]], List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]:
+        """
+        Plan an incremental update of a document and extract the pages it needs.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
+            
+        Returns:
+            Tuple of (update plan or None if unchanged, list of (text_chunk, metadata),
+            images by store name and key)
+        """
+        plan = self._plan_update(pdf_path, document_id)
+        if plan is None:
+            return None, [], {}
+            
+        chunks_with_metadata, images = self._extract_document(pdf_path, document_id, plan["pages"])
+        return plan, chunks_with_metadata, images
+    
+    def _extract_s3_document(self, s3_uri: str, document_id: str) -> Tuple[Optional[Dict[str, Any]], List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]:
+        """
+        Download a document from S3 and extract the pages it needs.
+        
+        Args:
+            s3_uri: S3 URI of the document PDF
+            document_id: Unique identifier for the document
+            
+        Returns:
+            Tuple of (update plan or None if unchanged, list of (text_chunk, metadata),
+            images by store name and key)
+        """
+        return self._with_s3_pdf(s3_uri, document_id, self._extract_update)
+    
+    def _stream_s3_document(self, s3_uri: str, document_id: str) -> Optional[int]:
+        """
+        Download a document from S3 and stream the pages it needs into the index.
+        
+        Args:
+            s3_uri: S3 URI of the document PDF
+            document_id: Unique identifier for the document
+            
+        Returns:
+            Number of chunks indexed, or None if the document is unchanged
+        """
+        return self._with_s3_pdf(s3_uri, document_id, self._stream_update)
+    
+    def _with_s3_pdf(self, s3_uri: str, document_id: str, process: Callable) -> Any:
         """
-        Initialize the base SnipRAG Engine.
+        Download a document from S3 and run a function on the temporary copy.
         
         Args:
-            embedding_model_name: Name of the sentence-transformers model to use for embeddings
-            aws_credentials: Optional AWS credentials for accessing S3
+            s3_uri: S3 URI of the document PDF
+            document_id: Unique identifier for the document
+            process: Function (pdf_path, document_id) to run on the download
+            
+        Returns:
+            The function's result
         """
-        self.aws_credentials = aws_credentials
-        
-        # Initialize the embedding model
-        self.embedding_model = SentenceTransformer(embedding_model_name)
-        self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
-        
-        # Initialize an in-memory FAISS index for vector storage
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        
-        # Storage for document chunks and metadata
-        self.documents = []
-        self.document_metadata = []
-        
-        # Storage for text block coordinates and page images
-        self.text_coordinates = []
-        self.page_images = {}
-        
-        # Padding for image snippets (in pixels, applied to all sides)
-        self.snippet_padding = 20
+        temp_path = self.download_pdf_from_s3(s3_uri)
         
-        # Text splitter for chunking documents
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        try:
+            return process(temp_path, document_id)
+            
+        finally:
+            # Keep the PDF bytes for on-demand rendering once the temporary file is gone
+            if self.pdf_sources.get(document_id) == temp_path:
+                with open(temp_path, "rb") as f:
+                    self.pdf_sources[document_id] = f.read()
+                    
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
     
-    def download_pdf_from_s3(self, s3_uri: str) -> str:
+    def _extract_text_chunks(self, pdf_path: str, document_id: str) -> List[Tuple[str, Dict[str, Any]]]:
         """
-        Download a PDF from S3 to a temporary file.
+        Extract text chunks from a PDF with metadata, storing rendered images.
         
         Args:
-            s3_uri: S3 URI of the PDF
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
             
         Returns:
-            Path to the downloaded temporary file
+            List of tuples (text_chunk, metadata)
         """
-        # Parse the S3 URI
-        if not s3_uri.startswith('s3://'):
-            raise ValueError(f"Invalid S3 URI format: {s3_uri}")
-            
-        s3_parts = s3_uri[5:].split('/', 1)  # Remove 's3://' and split on first '/'
-        if len(s3_parts) != 2:
-            raise ValueError(f"Invalid S3 URI format: {s3_uri}")
+        chunks_with_metadata, images = self._extract_document(pdf_path, document_id)
+        self._store_images(images)
+        return chunks_with_metadata
+    
+    def _extract_document(self, pdf_path: Union[str, bytes], document_id: str,
+                          page_numbers: Optional[List[int]] = None) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]:
+        """
+        Extract text chunks and images from a PDF without adding them to the engine.
+        With more than one worker, page ranges are extracted in a process pool
+        and merged back in page order.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
+            page_numbers: Optional pages to extract (default: all pages)
             
-        bucket_name = s3_parts[0]
-        object_key = s3_parts[1]
+        Returns:
+            Tuple of (list of (text_chunk, metadata), images by store name and key)
+        """
+        self._prepare_document(pdf_path, document_id)
         
-        # Create a temporary file
-        temp_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
-        temp_path = temp_file.name
-        temp_file.close()
+        extractor = self._page_extractor()
+        options = self._extraction_options()
         
-        # Download the file
-        if self.aws_credentials:
-            s3_client = boto3.client('s3', **self.aws_credentials)
+        if page_numbers is None:
+            page_numbers = list(range(self._count_pages(pdf_path)))
+        page_ranges = self._split_pages(page_numbers)
+        
+        if len(page_ranges) > 1:
+            # Each worker opens its own copy of the document
+            executor = self._get_executor()
+            futures = [executor.submit(_collect_pages, extractor, pdf_path, document_id, pages, options)
+                       for pages in page_ranges]
+            outputs = [future.result() for future in futures]
         else:
-            s3_client = boto3.client('s3')
+            outputs = [_collect_pages(extractor, pdf_path, document_id, pages, options)
+                       for pages in page_ranges]
+                       
+        # Merge the results in page order
+        result = []
+        images = {}
+        for chunks, range_images in outputs:
+            result.extend(chunks)
+            _merge_images(images, range_images)
             
-        s3_client.download_file(bucket_name, object_key, temp_path)
-        
-        return temp_path
+        return result, images
     
-    def process_pdf(self, pdf_path: str, document_id: str) -> bool:
+    def _iter_document(self, pdf_path: Union[str, bytes], document_id: str,
+                       page_numbers: Optional[List[int]] = None, window_size: int = 8) -> Iterator[Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]]:
         """
-        Process a PDF file and add it to the SnipRAG engine.
+        Extract a PDF incrementally, yielding chunks and images in page order.
+        With more than one worker, small windows of pages are extracted in the
+        process pool with a bounded number in flight.
         
         Args:
-            pdf_path: Path to the PDF file
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
             document_id: Unique identifier for the document
+            page_numbers: Optional pages to extract (default: all pages)
+            window_size: Number of pages per worker task
             
-        Returns:
-            True if successful, False otherwise
+        Yields:
+            Tuple of (list of (text_chunk, metadata), images by store name and key)
         """
-        try:
-            # Extract text from PDF - this method will be implemented by subclasses
-            chunks_with_metadata = self._extract_text_chunks(pdf_path, document_id)
+        # Prepare the source the same way as a full extraction would
+        self._prepare_document(pdf_path, document_id)
+        
+        extractor = self._page_extractor()
+        options = self._extraction_options()
+        if page_numbers is None:
+            page_numbers = list(range(self._count_pages(pdf_path)))
             
-            # Create embeddings and add to index
-            self._add_chunks_to_index(chunks_with_metadata)
+        if self.workers <= 1:
+            yield from extractor(pdf_path, document_id, page_numbers, options)
+            return
             
-            return True
-                
-        except Exception as e:
-            logger.error(f"Error processing document {document_id}: {str(e)}")
-            return False
+        executor = self._get_executor()
+        windows = deque(page_numbers[i:i + window_size] for i in range(0, len(page_numbers), window_size))
+        in_flight = deque()
+        
+        while windows or in_flight:
+            # Keep at most two windows per worker queued
+            while windows and len(in_flight) < 2 * self.workers:
+                in_flight.append(executor.submit(_collect_pages, extractor, pdf_path, 
+                                                 document_id, windows.popleft(), options))
+            yield in_flight.popleft().result()
     
-    def process_document_from_s3(self, s3_uri: str, document_id: str) -> bool:
+    def _prepare_document(self, pdf_path: Union[str, bytes], document_id: str):
         """
-        Process a document from S3 and add it to the SnipRAG engine.
+        Hook called before a document is extracted.
+        Subclasses can override this to record per-document state.
         
         Args:
-            s3_uri: S3 URI of the document PDF
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
             document_id: Unique identifier for the document
+        """
+        pass
+    
+    def _count_pages(self, pdf_path: Union[str, bytes]) -> int:
+        """
+        Count the pages of a PDF.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
             
         Returns:
-            True if successful, False otherwise
+            Number of pages
         """
-        try:
-            # Download the PDF
-            temp_path = self.download_pdf_from_s3(s3_uri)
-            
-            try:
-                # Process the PDF
-                return self.process_pdf(temp_path, document_id)
-                
-            finally:
-                # Clean up the temporary file
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                    
-        except Exception as e:
-            logger.error(f"Error processing document {document_id} from S3: {str(e)}")
-            return False
+        doc = _open_pdf(pdf_path)
+        num_pages = len(doc)
+        doc.close()
+        return num_pages
     
-    def _extract_text_chunks(self, pdf_path: str, document_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+    def _page_extractor(self) -> Callable:
+        """
+        Get the function that extracts chunks from a range of pages.
+        
+        The function must be defined at module level so it can be sent to worker
+        processes. It is called as extractor(pdf_path, document_id, page_numbers, options)
+        and yields a tuple (chunks_with_metadata, images) for each page, where images maps
+        the name of an image store attribute (e.g. "page_images") to {key: PNG bytes}.
+        
+        Returns:
+            The page extraction function
+        """
+        # To be implemented by subclasses
+        raise NotImplementedError("Subclasses must implement _page_extractor")
+    
+    def _extraction_options(self) -> Dict[str, Any]:
+        """
+        Get the picklable settings passed to the page extractor.
+        
+        Returns:
+            Dictionary of extraction settings
+        """
+        return {"text_splitter": self.text_splitter, "snippet_dpi": self.snippet_dpi}
+    
+    def _split_pages(self, page_numbers: List[int]) -> List[List[int]]:
         """
-        Extract text chunks from a PDF with metadata.
+        Split pages into contiguous ranges, one per worker.
         
         Args:
-            pdf_path: Path to the PDF file
-            document_id: Unique identifier for the document
+            page_numbers: Pages to process, in order
             
         Returns:
-            List of tuples (text_chunk, metadata)
+            List of page ranges
         """
-        # To be implemented by subclasses
-        raise NotImplementedError("Subclasses must implement _extract_text_chunks")
+        num_ranges = max(1, min(self.workers, len(page_numbers)))
+        range_size, remainder = divmod(len(page_numbers), num_ranges)
+        
+        page_ranges = []
+        start = 0
+        for i in range(num_ranges):
+            stop = start + range_size + (1 if i < remainder else 0)
+            page_ranges.append(page_numbers[start:stop])
+            start = stop
+        return page_ranges
+    
+    def _store_images(self, images: Dict[str, Dict[str, bytes]]):
+        """
+        Add images produced by a page extractor to the engine's image stores.
+        
+        Args:
+            images: Images keyed by store attribute name, then by image key
+        """
+        for store_name, store_images in images.items():
+            store = getattr(self, store_name)
+            for key, img_data in store_images.items():
+                store[key] = img_data
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Get the process pool used for extraction, creating it if needed."""
+        # Prefetch threads of a batch may ask for the pool at the same time
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
     
     def _add_chunks_to_index(self, chunks_with_metadata: List[Tuple[str, Dict[str, Any]]]):
         """
@@ -176,20 +1572,150 @@ class BaseSnipRAGEngine:
         # Extract just the text chunks
         texts = [chunk[0] for chunk in chunks_with_metadata]
         
-        # Create embeddings
-        embeddings = self.embedding_model.encode(texts)
+        # Assign chunk IDs
+        chunk_ids = list(range(self._next_chunk_id, self._next_chunk_id + len(texts)))
+        self._next_chunk_id += len(texts)
+        
+        # Each chunk gets its own vector, stored under its chunk ID, unless vectors are
+        # shared and another chunk with the same text already has one
+        new_vectors = list(range(len(texts)))
+        if self.share_duplicate_vectors:
+            new_vectors = []
+            for i, (chunk_id, text) in enumerate(zip(chunk_ids, texts)):
+                vector_id = self._text_vectors.get(text)
+                if vector_id is None:
+                    vector_id = self._text_vectors[text] = chunk_id
+                    self._vector_chunks[vector_id] = []
+                    new_vectors.append(i)
+                self._vector_chunks[vector_id].append(chunk_id)
+                self._chunk_vectors[chunk_id] = vector_id
+                
+        # Create embeddings and add to FAISS index
+        if new_vectors:
+            embeddings = self._encode_texts([texts[i] for i in new_vectors])
+            vector_ids = np.array([chunk_ids[i] for i in new_vectors], dtype='int64')
+            with self._index_lock:
+                self._own_index()
+                self.index.add_with_ids(embeddings, vector_ids)
+                if self._migration_log is not None:
+                    self._migration_log.append(("add", vector_ids, embeddings))
+                    
+        # Record the row and document of each chunk
+        current_idx = len(self.chunks)
+        for offset, (chunk_id, (_, meta)) in enumerate(zip(chunk_ids, chunks_with_metadata)):
+            self._chunk_rows[chunk_id] = current_idx + offset
+            self._document_chunks.setdefault(meta.get("document_id"), set()).add(chunk_id)
+        self.filter_index.add([self._chunk_vectors.get(chunk_id, chunk_id) for chunk_id in chunk_ids],
+                              [meta for _, meta in chunks_with_metadata])
+                              
+        # Store texts, metadata and coordinates
+        self.chunks.append_many(chunk_ids, texts, [meta for _, meta in chunks_with_metadata])
+        
+        # Train the configured index once the chunks are recorded, so a failure leaves them searchable
+        self._train_index()
+        
+        # Move to a larger index type if the corpus has grown past a migration threshold
+        self._migrate_index()
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Create embeddings for chunk texts, encoding identical texts once and reusing
+        cached embeddings where available.
+        
+        Args:
+            texts: Chunk texts to embed
+            
+        Returns:
+            Float32 array with one embedding per text
+        """
+        embeddings = np.empty((len(texts), self.embedding_dim), dtype='float32')
+        
+        # Embed each distinct text once and fan the vectors back out
+        unique = {}
+        positions = [unique.setdefault(text, len(unique)) for text in texts]
+        if len(unique) < len(texts):
+            return self._encode_texts(list(unique))[positions]
+            
+        if self.embedding_cache is None:
+            self._encode_into(texts, embeddings)
+            return embeddings
+            
+        # Look up every text, then only encode the ones that were not cached
+        keys = [self._embedding_key(text) for text in texts]
+        cached = self.embedding_cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        for i, key in enumerate(keys):
+            if key in cached:
+                embeddings[i] = np.frombuffer(cached[key], dtype='float32')
+                
+        if missing:
+            missing_embeddings = np.empty((len(missing), self.embedding_dim), dtype='float32')
+            self._encode_into([texts[i] for i in missing], missing_embeddings)
+            embeddings[missing] = missing_embeddings
+            self.embedding_cache.set_many({keys[i]: embeddings[i].tobytes() for i in missing})
+            
+        return embeddings
+    
+    def _encode_into(self, texts: List[str], out: np.ndarray):
+        """
+        Run texts through the embedding model in length-sorted batches, writing the
+        embeddings into a preallocated array.
         
-        # Add to FAISS index
-        self.index.add(np.array(embeddings).astype('float32'))
+        Args:
+            texts: Texts to embed
+            out: Float32 array of shape (len(texts), embedding_dim) to fill
+        """
+        # Batches of similar length waste less work on padding
+        order = np.argsort([len(text) for text in texts], kind="stable")
         
-        # Store documents, metadata, and coordinates
-        current_idx = len(self.documents)
-        self.documents.extend(texts)
-        self.document_metadata.extend([meta for _, meta in chunks_with_metadata])
+        # Spread bulk work over the embedding pool, keeping small inputs such as queries in-process
+        if self.embedding_processes > 1 and len(texts) > self.encode_batch_size:
+            # Hand out whole batches so each process pads the same groups of texts
+            num_batches = -(-len(texts) // self.encode_batch_size)
+            batches_per_chunk = max(1, num_batches // (4 * self.embedding_processes))
+            # Newer sentence-transformers deprecate encode_multi_process in favor of encode(pool=...)
+            encode = self.embedding_model.encode_multi_process
+            if _encode_takes_pool(self.embedding_model):
+                encode = self.embedding_model.encode
+            out[order] = encode(
+                [texts[i] for i in order],
+                pool=self._get_embedding_pool(),
+                batch_size=self.encode_batch_size,
+                chunk_size=batches_per_chunk * self.encode_batch_size
+            )
+        else:
+            for start in range(0, len(texts), self.encode_batch_size):
+                batch = order[start:start + self.encode_batch_size]
+                out[batch] = self.embedding_model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=self.encode_batch_size,
+                    convert_to_numpy=True
+                )
+                
+        # Normalize here rather than in the model, so both paths give identical vectors
+        if self.normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+    
+    def _get_embedding_pool(self) -> Dict[str, Any]:
+        """Get the multi-process embedding pool, starting it on first use."""
+        if self._embedding_pool is None:
+            self._embedding_pool = self.embedding_model.start_multi_process_pool(
+                target_devices=["cpu"] * self.embedding_processes
+            )
+        return self._embedding_pool
+    
+    def _embedding_key(self, text: str) -> str:
+        """
+        Get the embedding cache key of a chunk text.
         
-        # Store text coordinates for later use in image extraction
-        self.text_coordinates.extend([meta.get("coordinates", [0, 0, 0, 0]) 
-                                    for _, meta in chunks_with_metadata])
+        Args:
+            text: Chunk text
+            
+        Returns:
+            Hex digest of the model, backend, normalization and text
+        """
+        key = f"{self.embedding_model_name}\0{self.embedding_backend}\0{int(self.normalize_embeddings)}\0{text}"
+        return hashlib.sha256(key.encode()).hexdigest()
     
     def get_image_snippet(self, result_idx: int, padding: int = None) -> Dict[str, Any]:
         """
@@ -214,16 +1740,17 @@ class BaseSnipRAGEngine:
         page_number = metadata.get("page_number")
         page_key = f"{document_id}_{page_number}"
         
-        # Check if we have the page image
-        if page_key not in self.page_images:
+        # Check if we have the page image, or the source PDF to render it from
+        if page_key not in self.page_images and document_id not in self.pdf_sources:
             return {"error": "Page image not found"}
         
         # Set padding (use instance default if not specified)
         if padding is None:
             padding = self.snippet_padding
-        
-        # Extract coordinates
-        x0, y0, x1, y1 = coordinates
+            
+        # Scale coordinates from PDF points to the snippet resolution
+        scale_factor = self.snippet_dpi / 72
+        x0, y0, x1, y1 = [c * scale_factor for c in coordinates]
         
         # Apply padding
         x0 = max(0, x0 - padding)
@@ -232,17 +1759,22 @@ class BaseSnipRAGEngine:
         y1 += padding
         
         try:
-            # Get the page image
-            img_data = self.page_images[page_key]
-            img = Image.open(io.BytesIO(img_data))
-            
-            # Crop the image to the text region
-            snippet = img.crop((x0, y0, x1, y1))
-            
-            # Convert to base64
-            buffered = io.BytesIO()
-            snippet.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
+            # Get the page image, which ingestion may remove at any time
+            img_data = self.page_images.get(page_key)
+            if img_data is not None:
+                img = Image.open(io.BytesIO(img_data))
+                
+                # Crop the image to the text region
+                snippet = img.crop((x0, y0, x1, y1))
+                
+                # Convert to base64
+                buffered = io.BytesIO()
+                snippet.save(buffered, format="PNG")
+                img_base64 = base64.b64encode(buffered.getvalue()).decode()
+            else:
+                # Render only the clipped region from the source PDF
+                img_data = self._render_snippet(document_id, page_number, [x0, y0, x1, y1])
+                img_base64 = base64.b64encode(img_data).decode()
             
             return {
                 "image_data": img_base64,
@@ -256,8 +1788,42 @@ class BaseSnipRAGEngine:
             logger.error(f"Error creating image snippet: {str(e)}")
             return {"error": f"Failed to create snippet: {str(e)}"}
     
+    def _render_snippet(self, document_id: str, page_number: int, coordinates: List[float]) -> bytes:
+        """
+        Render a region of a page from the source PDF, caching the result.
+        
+        Args:
+            document_id: Unique identifier for the document
+            page_number: Page to render from
+            coordinates: Region to render (x0, y0, x1, y1) in pixels at the snippet resolution
+            
+        Returns:
+            PNG bytes of the rendered region
+        """
+        snippet_key = f"{document_id}_{page_number}_" + "_".join(f"{c:.2f}" for c in coordinates)
+        cached = self.snippet_images.get(snippet_key)
+        if cached is not None:
+            return cached
+            
+        scale_factor = self.snippet_dpi / 72
+        doc = _open_pdf(self.pdf_sources[document_id])
+        try:
+            page = doc[page_number]
+            
+            # Convert the region back to PDF points and keep it on the page
+            clip = fitz.Rect(*[c / scale_factor for c in coordinates]) & page.rect
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor), clip=clip)
+            img_data = pix.tobytes("png")
+        finally:
+            doc.close()
+        
+        self.snippet_images[snippet_key] = img_data
+        self._page_snippets.setdefault(f"{document_id}_{page_number}", []).append(snippet_key)
+        return img_data
+    
     def search(self, query: str, top_k: int = 5, 
-              filter_metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+              filter_metadata: Optional[Dict[str, Any]] = None,
+              nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Search for documents similar to the query.
         
@@ -265,45 +1831,158 @@ class BaseSnipRAGEngine:
             query: Search query
             top_k: Number of results to return
             filter_metadata: Optional metadata filters
+            nprobe: Number of IVF lists to visit (IVF indexes only)
+            ef_search: Search queue size (HNSW indexes only)
             
         Returns:
             List of results with text and metadata
         """
+        return self.search_batch([query], top_k, filter_metadata, nprobe=nprobe, ef_search=ef_search)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5,
+                     filter_metadata: Optional[Dict[str, Any]] = None,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search for documents similar to several queries, embedding and searching
+        them together.
+        
+        Args:
+            queries: Search queries
+            top_k: Number of results to return per query
+            filter_metadata: Optional metadata filters
+            nprobe: Number of IVF lists to visit (IVF indexes only)
+            ef_search: Search queue size (HNSW indexes only)
+            
+        Returns:
+            List of results with text and metadata for each query
+        """
         if len(self.documents) == 0:
-            return []
+            return [[] for _ in queries]
+            
+        # Restrict the search to the vectors that can pass the filters, using the filter index
+        k = min(top_k * 2, len(self.documents))
+        selection = None
+        if filter_metadata:
+            selection, exact = self.filter_index.select(filter_metadata)
+            if selection is not None and selection.empty:
+                return [[] for _ in queries]
+                
+            # Every selected vector has a chunk passing the filters, so no over-fetching is needed
+            if selection is not None and exact:
+                k = min(top_k, len(self.documents))
+                
+        # Create query embeddings
+        query_embeddings = self._encode_queries(queries)
+        
+        # A few selected vectors are compared directly, which also finds every match
+        # in approximate indexes; when the selection is inexact, all of them are ranked
+        if selection is not None and selection.ids is not None and len(selection.ids) <= _EXACT_SCAN_LIMIT:
+            with self._index_lock:
+                vectors = self.index.reconstruct_batch(selection.ids)
+            num_nearest = min(k, len(selection.ids)) if exact else len(selection.ids)
+            distances, positions = faiss.knn(query_embeddings, vectors, num_nearest)
+            indices = np.where(positions >= 0, selection.ids[positions], -1)
+            return [self._collect_results(distances[q], indices[q], top_k, filter_metadata)
+                    for q in range(len(queries))]
+                    
+        # Search the index, which a background migration may swap at any time; the
+        # selected IDs or bitmap are kept referenced until the search is done
+        selector, selected = selection.selector() if selection is not None else (None, None)
+        with self._index_lock:
+            index = self.index
+            params = self._search_parameters(index, nprobe, ef_search, selector)
+        distances, indices = index.search(query_embeddings, k=k, params=params)
         
-        # Create query embedding
-        query_embedding = self.embedding_model.encode([query])[0]
+        return [self._collect_results(distances[q], indices[q], top_k, filter_metadata)
+                for q in range(len(queries))]
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed search queries, reusing cached embeddings of recent queries.
+        
+        Args:
+            queries: Search queries
+            
+        Returns:
+            Array of query embeddings, one row per query
+        """
+        query_embeddings = np.empty((len(queries), self.embedding_dim), dtype='float32')
         
-        # Search the index
-        distances, indices = self.index.search(np.array([query_embedding]).astype('float32'), k=min(top_k * 2, len(self.documents)))
+        # Cached embeddings are only valid for the model that produced them
+        self.query_cache.check_model((self.embedding_model, self.embedding_model_name,
+                                      self.embedding_backend, self.normalize_embeddings))
+                                      
+        # Look up each distinct query once, remembering the rows that need encoding
+        missing = {}
+        for row, query in enumerate(queries):
+            key = self.query_cache.key(query)
+            if key in missing:
+                missing[key][1].append(row)
+                continue
+            embedding = self.query_cache.get(query)
+            if embedding is None:
+                missing[key] = (query, [row])
+            else:
+                query_embeddings[row] = embedding
+                
+        if missing:
+            # Encode the missing queries and cache their embeddings
+            texts = [query for query, _ in missing.values()]
+            encoded = np.empty((len(texts), self.embedding_dim), dtype='float32')
+            self._encode_into(texts, encoded)
+            for (query, rows), embedding in zip(missing.values(), encoded):
+                query_embeddings[rows] = embedding
+                self.query_cache.put(query, embedding)
+                
+        return query_embeddings
+    
+    def _collect_results(self, distances: np.ndarray, vector_ids: np.ndarray, top_k: int,
+                         filter_metadata: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Turn the nearest vectors found for a query into filtered search results.
         
+        Args:
+            distances: Distance of each vector to the query
+            vector_ids: IDs of the nearest vectors, -1 where there is no result
+            top_k: Number of results to return
+            filter_metadata: Optional metadata filters
+            
+        Returns:
+            List of results with text and metadata
+        """
         # Prepare results
         results = []
-        for i, idx in enumerate(indices[0]):
+        for i, vector_id in enumerate(vector_ids):
             # Skip if index is -1 (no result)
-            if idx == -1:
+            if vector_id == -1:
                 continue
                 
-            metadata = self.document_metadata[idx]
-            
-            # Apply metadata filters if provided
-            if filter_metadata:
-                skip = False
-                for key, value in filter_metadata.items():
-                    if key in metadata and metadata[key] != value:
-                        skip = True
-                        break
-                if skip:
-                    continue
-            
-            # Add to results
-            results.append({
-                "text": self.documents[idx],
-                "metadata": metadata,
-                "score": float(1.0 / (1.0 + distances[0][i]))  # Convert distance to a similarity score
-            })
-            
+            # A shared vector stands for every chunk with the same text
+            for chunk_id in self._vector_chunks.get(int(vector_id), (int(vector_id),)):
+                idx = self._chunk_rows[chunk_id]
+                metadata = self.document_metadata[idx]
+                
+                # Apply metadata filters if provided
+                if filter_metadata:
+                    skip = False
+                    for key, value in filter_metadata.items():
+                        if key in metadata and metadata[key] != value:
+                            skip = True
+                            break
+                    if skip:
+                        continue
+                        
+                # Add to results
+                results.append({
+                    "text": self.documents[idx],
+                    "metadata": metadata,
+                    "chunk_id": chunk_id,
+                    "score": float(1.0 / (1.0 + distances[i]))  # Convert distance to a similarity score
+                })
+                
+                if len(results) >= top_k:
+                    break
+                    
             # Stop once we have enough results
             if len(results) >= top_k:
                 break
@@ -313,7 +1992,9 @@ class BaseSnipRAGEngine:
     def search_with_snippets(self, query: str, top_k: int = 5, 
                            filter_metadata: Optional[Dict[str, Any]] = None,
                            include_snippets: bool = True,
-                           snippet_padding: Optional[int] = None) -> List[Dict[str, Any]]:
+                           snippet_padding: Optional[int] = None,
+                           nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Search for documents similar to the query and return image snippets.
         
@@ -323,12 +2004,14 @@ class BaseSnipRAGEngine:
             filter_metadata: Optional metadata filters
             include_snippets: Whether to include image snippets in results
             snippet_padding: Optional padding override for snippets
+            nprobe: Number of IVF lists to visit (IVF indexes only)
+            ef_search: Search queue size (HNSW indexes only)
             
         Returns:
             List of results with text, metadata, and image snippets
         """
         # Get text search results
-        results = self.search(query, top_k, filter_metadata)
+        results = self.search(query, top_k, filter_metadata, nprobe=nprobe, ef_search=ef_search)
         
         # If not including snippets, just return the text results
         if not include_snippets:
@@ -336,7 +2019,13 @@ class BaseSnipRAGEngine:
         
         # Add image snippets to results
         for i, result in enumerate(results):
-            # Find the original index in our documents list
+            # Look up the result's row by its chunk ID
+            if result.get("chunk_id") in self._chunk_rows:
+                snippet = self.get_image_snippet(self._chunk_rows[result["chunk_id"]], snippet_padding)
+                self._add_snippet(result, snippet)
+                continue
+                
+            # Otherwise find the original index in our documents list
             doc_text = result["text"]
             doc_metadata = result["metadata"]
             
@@ -349,19 +2038,26 @@ class BaseSnipRAGEngine:
                     
                     # Get image snippet
                     snippet = self.get_image_snippet(idx, snippet_padding)
-                    
-                    # Add snippet data to result
-                    if "error" not in snippet:
-                        result["image_data"] = snippet["image_data"]
-                        if "coordinates" in snippet:
-                            result["coordinates"] = snippet["coordinates"]
-                    else:
-                        result["image_error"] = snippet["error"]
-                    
+                    self._add_snippet(result, snippet)
                     break
         
         return results
     
+    def _add_snippet(self, result: Dict[str, Any], snippet: Dict[str, Any]):
+        """
+        Add snippet data from get_image_snippet to a search result.
+        
+        Args:
+            result: Search result to update
+            snippet: Snippet dictionary or error
+        """
+        if "error" not in snippet:
+            result["image_data"] = snippet["image_data"]
+            if "coordinates" in snippet:
+                result["coordinates"] = snippet["coordinates"]
+        else:
+            result["image_error"] = snippet["error"]
+    
     def _is_matching_document(self, metadata1: Dict[str, Any], metadata2: Dict[str, Any]) -> bool:
         """
         Check if two document metadata entries refer to the same document.
@@ -376,11 +2072,176 @@ class BaseSnipRAGEngine:
         """
         # Default implementation just checks page number
         return metadata1.get("page_number") == metadata2.get("page_number")
+    
+    def _image_stores(self) -> Dict[str, PageImageStore]:
+        """
+        Get the engine's image stores by attribute name.
+        Subclasses with additional image stores should extend this.
+        """
+        return {"page_images": self.page_images, "snippet_images": self.snippet_images}
+    
+    def save(self, path: str):
+        """
+        Save the index, chunks and images to a directory, to be restored with load().
+        
+        Args:
+            path: Directory to save the engine state to
+        """
+        os.makedirs(path, exist_ok=True)
+        
+        # Save the index as it is now, even if a migration swaps it in the meantime
+        with self._index_lock:
+            index = self.index
+            index_state = {
+                "active_index_factory": self.active_index_factory,
+                "index_layout": "idmap" if isinstance(index, faiss.IndexIDMap2) else "ivf",
+                "index_training": self._index_training,
+                "migration_stage": self._migration_stage,
+                "deleted_vectors": sorted(self._deleted_vectors),
+            }
+        tmp_path = os.path.join(path, "index.faiss.tmp")
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, os.path.join(path, "index.faiss"))
+        
+        # Keep PDFs given as bytes next to the chunks, for lazily rendered snippets
+        pdf_sources = {}
+        for document_id, source in self.pdf_sources.items():
+            if isinstance(source, (bytes, bytearray)):
+                file_name = f"{hashlib.sha256(document_id.encode()).hexdigest()}.pdf"
+                os.makedirs(os.path.join(path, "sources"), exist_ok=True)
+                with open(os.path.join(path, "sources", file_name), "wb") as f:
+                    f.write(source)
+                source = {"file": file_name}
+            pdf_sources[document_id] = source
+            
+        self.chunks.save(os.path.join(path, "chunks"))
+        _write_json(os.path.join(path, "state.json"), {
+            "next_chunk_id": self._next_chunk_id,
+            "vector_chunks": {str(vector_id): chunk_ids for vector_id, chunk_ids in self._vector_chunks.items()},
+            "document_hashes": self.document_hashes,
+            "page_snippets": self._page_snippets,
+            "pdf_sources": pdf_sources,
+        })
+        
+        for name, store in self._image_stores().items():
+            store.save(os.path.join(path, "images", name))
+            
+        # The manifest is written last, so an interrupted save cannot be loaded
+        _write_json(os.path.join(path, "manifest.json"), {
+            "format_version": _SAVE_FORMAT_VERSION,
+            "engine": type(self).__name__,
+            "embedding_model_name": self.embedding_model_name,
+            "embedding_backend": self.embedding_backend,
+            "normalize_embeddings": self.normalize_embeddings,
+            "embedding_dim": self.embedding_dim,
+            "snippet_dpi": self.snippet_dpi,
+            **index_state,
+        })
+    
+    def load(self, path: str, mmap: bool = True):
+        """
+        Restore engine state saved by save(), replacing the current contents.
+        
+        Args:
+            path: Directory the engine state was saved to
+            mmap: If True, the index is memory-mapped from the saved file instead of
+                read into memory, so loading is fast and processes loading the same
+                save share its pages; it is copied into memory when first changed
+                
+        Raises:
+            ValueError: If the save has an unsupported format version or was made
+                with a different embedding model
+        """
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+            
+        if manifest.get("format_version") != _SAVE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported save format version: {manifest.get('format_version')}. "
+                             f"Expected {_SAVE_FORMAT_VERSION}.")
+        saved_model = (manifest["embedding_model_name"], manifest["embedding_backend"],
+                       manifest["normalize_embeddings"], manifest["embedding_dim"])
+        if saved_model != (self.embedding_model_name, self.embedding_backend,
+                           self.normalize_embeddings, self.embedding_dim):
+            raise ValueError(f"Saved index was built with embedding model {saved_model}, which does not "
+                             f"match this engine's {self.embedding_model_name}")
+                             
+        self.clear_index()
         
+        # IVF lists and flat vector codes are memory-mapped with different flags
+        index_path = os.path.join(path, "index.faiss")
+        if mmap:
+            flags = faiss.IO_FLAG_MMAP if manifest["index_layout"] == "ivf" else faiss.IO_FLAG_MMAP_IFC
+            index = faiss.read_index(index_path, flags)
+        else:
+            index = faiss.read_index(index_path)
+            
+        with self._index_lock:
+            self.index = index
+            self._mapped_index = mmap
+            self.active_index_factory = manifest["active_index_factory"]
+            self._index_training = manifest["index_training"]
+            self._migration_stage = manifest["migration_stage"]
+            self._deleted_vectors = set(manifest["deleted_vectors"])
+            
+        with open(os.path.join(path, "state.json")) as f:
+            state = json.load(f)
+        self.chunks.load(os.path.join(path, "chunks"))
+        
+        self._next_chunk_id = state["next_chunk_id"]
+        self.document_hashes = state["document_hashes"]
+        self._page_snippets = state["page_snippets"]
+        
+        # Rebuild the lookups derived from the chunk store
+        for row in range(len(self.chunks)):
+            chunk_id = self.chunks.chunk_id(row)
+            self._chunk_rows[chunk_id] = row
+            self._document_chunks.setdefault(self.chunks.value(row, "document_id"), set()).add(chunk_id)
+        for vector_id, chunk_ids in state["vector_chunks"].items():
+            vector_id = int(vector_id)
+            self._vector_chunks[vector_id] = chunk_ids
+            for chunk_id in chunk_ids:
+                self._chunk_vectors[chunk_id] = vector_id
+            self._text_vectors[self.chunks.text(self._chunk_rows[chunk_ids[0]])] = vector_id
+        self.filter_index.add([self._chunk_vectors.get(chunk_id, chunk_id) for chunk_id in self.chunks.chunk_ids],
+                              list(self.chunks.metadata))
+                              
+        for document_id, source in state["pdf_sources"].items():
+            if isinstance(source, dict):
+                with open(os.path.join(path, "sources", source["file"]), "rb") as f:
+                    source = f.read()
+            self.pdf_sources[document_id] = source
+            
+        # Images were rendered at the saved resolution
+        self.snippet_dpi = manifest["snippet_dpi"]
+        for name, store in self._image_stores().items():
+            if os.path.isdir(os.path.join(path, "images", name)):
+                store.load(os.path.join(path, "images", name))
+    
     def clear_index(self):
         """Clear the index and all stored documents."""
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.documents = []
-        self.document_metadata = []
-        self.text_coordinates = []
-        self.page_images = {} 
\ No newline at end of file
+        self._reset_index()
+        self.chunks.clear()
+        self._chunk_rows = {}
+        self._document_chunks = {}
+        self.filter_index.clear()
+        self._text_vectors = {}
+        self._vector_chunks = {}
+        self._chunk_vectors = {}
+        self.page_images.clear()
+        self.pdf_sources = {}
+        self.snippet_images.clear()
+        self._page_snippets = {}
+        self.document_hashes = {}
+    
+    def close(self):
+        """Release resources held by the engine, such as worker processes and spilled image files."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.page_images.close()
+        self.snippet_images.close()
+        if self._embedding_pool is not None:
+            self.embedding_model.stop_multi_process_pool(self._embedding_pool)
+            self._embedding_pool = None
+        if self.embedding_cache is not None:
+            self.embedding_cache.close() 
\ No newline at end of file
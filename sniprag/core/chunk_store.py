@@ -0,0 +1,445 @@
+"""
+Chunk Store - Compact columnar storage for chunk texts and metadata.
+"""
+
+import os
+import json
+from collections.abc import Sequence
+from typing import List, Dict, Any, Callable, Iterator, Optional
+
+import numpy as np
+
+# Marker for rows without a value in an integer column
+_MISSING_INT = np.iinfo(np.int32).min
+
+# Marker for fields a row does not have
+_MISSING = object()
+
+class ChunkColumn(Sequence):
+    """
+    Read-only, list-like view of one column of a chunk store.
+    Rows are materialized as Python objects only when they are accessed.
+    """
+    
+    def __init__(self, store: "ChunkStore", getter: Callable[[int], Any]):
+        self._store = store
+        self._getter = getter
+    
+    def __len__(self) -> int:
+        return len(self._store)
+    
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self._getter(i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("chunk row out of range")
+        return self._getter(row)
+    
+    def __iter__(self) -> Iterator[Any]:
+        for row in range(len(self)):
+            yield self._getter(row)
+    
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (ChunkColumn, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"ChunkColumn({list(self)!r})"
+
+class ChunkStore:
+    """
+    Columnar store of chunk texts and metadata, one row per chunk.
+    
+    Texts are kept in a single UTF-8 buffer addressed by offsets. Integer metadata
+    fields (page numbers, block and slice indexes) are stored in int32 columns,
+    4-number coordinates in a float64 column, and other metadata values are
+    interned, so repeated values such as document IDs are stored once, and
+    released once no row uses them. Rows are removed by moving the last row into
+    their place.
+    """
+    
+    def __init__(self):
+        """Initialize an empty chunk store."""
+        self.clear()
+        
+        # List-like views, materializing rows on access
+        self.texts = ChunkColumn(self, self.text)
+        self.metadata = ChunkColumn(self, self.row_metadata)
+        self.coordinates = ChunkColumn(self, self.row_coordinates)
+        self.chunk_ids = ChunkColumn(self, self.chunk_id)
+    
+    def clear(self):
+        """Remove all rows."""
+        self._size = 0
+        self._capacity = 0
+        
+        # UTF-8 text buffer, the span of each row in it, and bytes no longer referenced
+        self._text = bytearray()
+        self._text_starts = np.zeros(0, dtype=np.int64)
+        self._text_lengths = np.zeros(0, dtype=np.int32)
+        self._dead_text_bytes = 0
+        
+        self._chunk_ids = np.zeros(0, dtype=np.int64)
+        
+        # Metadata fields in first-seen order
+        self._fields = []
+        
+        # Integer fields: name -> int32 column
+        self._int_columns = {}
+        
+        # Coordinates as float64 (x0, y0, x1, y1), so they read back exactly as they
+        # were added, and whether each row has them
+        self._coordinates = np.zeros((0, 4), dtype=np.float64)
+        self._has_coordinates = np.zeros(0, dtype=bool)
+        
+        # Other fields: name -> (int32 codes, values, value index); -1 means no value
+        self._value_columns = {}
+        
+        # Number of rows using each code of a value column, and codes free for reuse
+        self._value_counts = {}
+        self._free_codes = {}
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def _reserve(self, size: int):
+        """Grow all columns to hold at least size rows, doubling their capacity."""
+        if size <= self._capacity:
+            return
+            
+        capacity = max(size, 2 * self._capacity, 64)
+        
+        def grow(column: np.ndarray, fill: Any) -> np.ndarray:
+            grown = np.full((capacity,) + column.shape[1:], fill, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            return grown
+            
+        self._text_starts = grow(self._text_starts, 0)
+        self._text_lengths = grow(self._text_lengths, 0)
+        self._chunk_ids = grow(self._chunk_ids, -1)
+        self._coordinates = grow(self._coordinates, 0)
+        self._has_coordinates = grow(self._has_coordinates, False)
+        for name, column in self._int_columns.items():
+            self._int_columns[name] = grow(column, _MISSING_INT)
+        for name, (codes, values, index) in self._value_columns.items():
+            self._value_columns[name] = (grow(codes, -1), values, index)
+        self._capacity = capacity
+    
+    def _add_field(self, name: str):
+        """Remember a metadata field the first time it is seen."""
+        if name not in self._fields:
+            self._fields.append(name)
+    
+    def _int_column(self, name: str) -> np.ndarray:
+        """Get the integer column of a field, creating it if needed."""
+        if name not in self._int_columns:
+            self._int_columns[name] = np.full(self._capacity, _MISSING_INT, dtype=np.int32)
+        return self._int_columns[name]
+    
+    def _value_code(self, name: str, value: Any) -> int:
+        """Get the code of a value in a field's value column for a new row, interning it if needed."""
+        if name not in self._value_columns:
+            self._value_columns[name] = (np.full(self._capacity, -1, dtype=np.int32), [], {})
+            self._value_counts[name] = []
+            self._free_codes[name] = []
+        _, values, index = self._value_columns[name]
+        counts = self._value_counts[name]
+        
+        # Unhashable values are stored per row
+        try:
+            key = (type(value), value)
+            hash(key)
+        except TypeError:
+            key = None
+            
+        code = index.get(key) if key is not None else None
+        if code is None:
+            # Reuse the code of a released value if there is one
+            if self._free_codes[name]:
+                code = self._free_codes[name].pop()
+                values[code] = value
+            else:
+                code = len(values)
+                values.append(value)
+                counts.append(0)
+            if key is not None:
+                index[key] = code
+        counts[code] += 1
+        return code
+    
+    def _release_value(self, name: str, code: int):
+        """Release a row's use of a value, freeing its code once no row uses it."""
+        counts = self._value_counts[name]
+        counts[code] -= 1
+        if counts[code]:
+            return
+            
+        _, values, index = self._value_columns[name]
+        try:
+            key = (type(values[code]), values[code])
+            if index.get(key) == code:
+                del index[key]
+        except TypeError:
+            pass
+        values[code] = None
+        self._free_codes[name].append(code)
+    
+    def _compact_values(self):
+        """Renumber the codes of each value column so released values are dropped."""
+        for name, (codes, values, _) in self._value_columns.items():
+            if not self._free_codes[name]:
+                continue
+                
+            counts = self._value_counts[name]
+            live = [code for code, count in enumerate(counts) if count]
+            renumbered = np.full(len(values), -1, dtype=np.int32)
+            renumbered[live] = np.arange(len(live), dtype=np.int32)
+            rows = codes[:self._size]
+            has_value = rows >= 0
+            rows[has_value] = renumbered[rows[has_value]]
+            
+            values = [values[code] for code in live]
+            self._value_columns[name] = (codes, values, _value_index(values))
+            self._value_counts[name] = [counts[code] for code in live]
+            self._free_codes[name] = []
+    
+    def append_many(self, chunk_ids: List[int], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Append rows for chunks.
+        
+        Args:
+            chunk_ids: ID of each chunk
+            texts: Text of each chunk
+            metadatas: Metadata of each chunk
+        """
+        start = self._size
+        self._reserve(start + len(texts))
+        
+        for row, (chunk_id, text, metadata) in enumerate(zip(chunk_ids, texts, metadatas), start):
+            encoded = text.encode("utf-8")
+            self._text_starts[row] = len(self._text)
+            self._text_lengths[row] = len(encoded)
+            self._text.extend(encoded)
+            self._chunk_ids[row] = chunk_id
+            
+            for name, value in metadata.items():
+                self._add_field(name)
+                if name == "coordinates" and self._is_box(value):
+                    self._coordinates[row] = value
+                    self._has_coordinates[row] = True
+                elif (isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+                      and _MISSING_INT < value <= np.iinfo(np.int32).max):
+                    self._int_column(name)[row] = value
+                else:
+                    code = self._value_code(name, value)
+                    self._value_columns[name][0][row] = code
+                    
+        self._size = start + len(texts)
+    
+    @staticmethod
+    def _is_box(value: Any) -> bool:
+        """Check whether a value is a list of 4 numbers."""
+        return (isinstance(value, (list, tuple)) and len(value) == 4 and
+                all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool) for v in value))
+    
+    def text(self, row: int) -> str:
+        """Get the text of a row."""
+        start = int(self._text_starts[row])
+        return self._text[start:start + int(self._text_lengths[row])].decode("utf-8")
+    
+    def chunk_id(self, row: int) -> int:
+        """Get the chunk ID of a row."""
+        return int(self._chunk_ids[row])
+    
+    def value(self, row: int, name: str, default: Any = None) -> Any:
+        """
+        Get one metadata field of a row without materializing the rest.
+        
+        Args:
+            row: Row number
+            name: Metadata field name
+            default: Value returned if the row does not have the field
+            
+        Returns:
+            The field value, or the default
+        """
+        if name == "coordinates" and self._has_coordinates[row]:
+            return self._coordinates[row].tolist()
+        if name in self._int_columns and self._int_columns[name][row] != _MISSING_INT:
+            return int(self._int_columns[name][row])
+        if name in self._value_columns:
+            codes, values, _ = self._value_columns[name]
+            if codes[row] >= 0:
+                return values[codes[row]]
+        return default
+    
+    def row_metadata(self, row: int) -> Dict[str, Any]:
+        """Materialize the metadata dictionary of a row."""
+        metadata = {}
+        for name in self._fields:
+            value = self.value(row, name, _MISSING)
+            if value is not _MISSING:
+                metadata[name] = value
+        return metadata
+    
+    def row_coordinates(self, row: int) -> List[float]:
+        """Get the coordinates of a row, or zeros if it has none."""
+        return self.value(row, "coordinates", [0, 0, 0, 0])
+    
+    def swap_remove(self, row: int) -> Optional[int]:
+        """
+        Remove a row by moving the last row into its place.
+        
+        Args:
+            row: Row to remove
+            
+        Returns:
+            Chunk ID of the row moved into its place, or None if it was the last row
+        """
+        last = self._size - 1
+        self._dead_text_bytes += int(self._text_lengths[row])
+        
+        # Release the row's interned values before the last row's codes take its place
+        for name, (codes, _, _) in self._value_columns.items():
+            if codes[row] >= 0:
+                self._release_value(name, int(codes[row]))
+            codes[row] = codes[last]
+            
+        moved = None
+        if row != last:
+            self._text_starts[row] = self._text_starts[last]
+            self._text_lengths[row] = self._text_lengths[last]
+            self._chunk_ids[row] = self._chunk_ids[last]
+            self._coordinates[row] = self._coordinates[last]
+            self._has_coordinates[row] = self._has_coordinates[last]
+            for column in self._int_columns.values():
+                column[row] = column[last]
+            moved = int(self._chunk_ids[row])
+            
+        # Reset the freed row so it reads as empty when reused
+        self._has_coordinates[last] = False
+        for column in self._int_columns.values():
+            column[last] = _MISSING_INT
+        for codes, _, _ in self._value_columns.values():
+            codes[last] = -1
+        self._size = last
+        
+        # Drop removed texts from the buffer once they take up half of it
+        if self._dead_text_bytes > len(self._text) // 2:
+            self._compact_text()
+        return moved
+    
+    def _compact_text(self):
+        """Rewrite the text buffer with only the texts of current rows."""
+        text = bytearray()
+        for row in range(self._size):
+            start = int(self._text_starts[row])
+            self._text_starts[row] = len(text)
+            text.extend(self._text[start:start + int(self._text_lengths[row])])
+        self._text = text
+        self._dead_text_bytes = 0
+    
+    def save(self, directory: str):
+        """
+        Write the store to a directory.
+        
+        Args:
+            directory: Directory to save the columns to
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._compact_text()
+        self._compact_values()
+        size = self._size
+        
+        with open(os.path.join(directory, "text.bin"), "wb") as f:
+            f.write(self._text)
+        columns = {
+            "text_starts": self._text_starts[:size],
+            "text_lengths": self._text_lengths[:size],
+            "chunk_ids": self._chunk_ids[:size],
+            "coordinates": self._coordinates[:size],
+            "has_coordinates": self._has_coordinates[:size],
+        }
+        for name, column in self._int_columns.items():
+            columns[f"int:{name}"] = column[:size]
+        for name, (codes, _, _) in self._value_columns.items():
+            columns[f"codes:{name}"] = codes[:size]
+        np.savez(os.path.join(directory, "columns.npz"), **columns)
+        
+        with open(os.path.join(directory, "fields.json"), "w") as f:
+            json.dump({
+                "fields": self._fields,
+                "values": {name: values for name, (_, values, _) in self._value_columns.items()},
+            }, f, default=_json_default)
+    
+    def load(self, directory: str):
+        """
+        Replace the contents of the store with columns written by save().
+        
+        Args:
+            directory: Directory the columns were saved to
+        """
+        self.clear()
+        with open(os.path.join(directory, "text.bin"), "rb") as f:
+            self._text = bytearray(f.read())
+        with open(os.path.join(directory, "fields.json")) as f:
+            fields = json.load(f)
+            
+        with np.load(os.path.join(directory, "columns.npz")) as columns:
+            self._size = self._capacity = len(columns["chunk_ids"])
+            self._text_starts = columns["text_starts"]
+            self._text_lengths = columns["text_lengths"]
+            self._chunk_ids = columns["chunk_ids"]
+            self._coordinates = columns["coordinates"]
+            self._has_coordinates = columns["has_coordinates"]
+            for key in columns.files:
+                kind, _, name = key.partition(":")
+                if kind == "int":
+                    self._int_columns[name] = columns[key]
+                elif kind == "codes":
+                    values = fields["values"][name]
+                    codes = columns[key]
+                    self._value_columns[name] = (codes, values, _value_index(values))
+                    self._value_counts[name] = np.bincount(codes[codes >= 0], minlength=len(values)).tolist()
+                    self._free_codes[name] = []
+                    
+        self._fields = fields["fields"]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the size of the store.
+        
+        Returns:
+            Dictionary with the number of rows and bytes used by texts and columns
+        """
+        column_bytes = (self._text_starts.nbytes + self._text_lengths.nbytes + self._chunk_ids.nbytes +
+                        self._coordinates.nbytes + self._has_coordinates.nbytes +
+                        sum(column.nbytes for column in self._int_columns.values()) +
+                        sum(codes.nbytes for codes, _, _ in self._value_columns.values()))
+        return {
+            "rows": self._size,
+            "text_bytes": len(self._text),
+            "dead_text_bytes": self._dead_text_bytes,
+            "column_bytes": column_bytes,
+            "interned_values": {name: len(values) - len(self._free_codes[name])
+                                for name, (_, values, _) in self._value_columns.items()},
+        }
+
+def _value_index(values: List[Any]) -> Dict[Any, int]:
+    """Build the index from hashable values to their codes."""
+    index = {}
+    for code, value in enumerate(values):
+        try:
+            index.setdefault((type(value), value), code)
+        except TypeError:
+            pass
+    return index
+
+def _json_default(value: Any) -> Any:
+    """Convert NumPy values to JSON types."""
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
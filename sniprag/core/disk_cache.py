@@ -0,0 +1,182 @@
+"""
+Disk Cache - Persistent, size-bounded key-value cache backed by SQLite.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+
+class DiskCache:
+    """
+    Persistent cache mapping string keys to bytes values.
+    
+    Entries are stored in a SQLite database so they survive restarts and can be
+    shared by several processes. When the total size of the values exceeds the
+    byte budget, least recently used entries are evicted.
+    """
+    
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        """
+        Open (or create) a disk cache.
+        
+        Args:
+            path: Path of the SQLite database file
+            max_bytes: Maximum total size of cached values; None means unbounded
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        # One connection shared by the threads of this process, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+        
+        # Counters for sizing the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _next_access(self) -> int:
+        """Get an access stamp newer than every stored entry."""
+        row = self._conn.execute("SELECT MAX(accessed) FROM entries").fetchone()
+        return (row[0] or 0) + 1
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up a cached value, marking it as recently used.
+        
+        Args:
+            key: Cache key
+            
+        Returns:
+            The cached bytes, or None if the key is not cached
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+                
+            self.hits += 1
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (self._next_access(), key))
+            self._conn.commit()
+            return bytes(row[0])
+    
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Look up several cached values in one transaction, marking them as recently used.
+        
+        Args:
+            keys: Cache keys
+            
+        Returns:
+            Dictionary of the keys that were cached and their values
+        """
+        found = {}
+        with self._lock:
+            access = self._next_access()
+            for key in keys:
+                row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                found[key] = bytes(row[0])
+                
+            self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", 
+                                   [(access, key) for key in found])
+            self._conn.commit()
+        return found
+    
+    def set(self, key: str, value: bytes):
+        """
+        Store a value, evicting least recently used entries if over budget.
+        
+        Args:
+            key: Cache key
+            value: Bytes to store
+        """
+        self.set_many({key: value})
+    
+    def set_many(self, items: Dict[str, bytes]):
+        """
+        Store several values in one transaction, evicting least recently used
+        entries if over budget.
+        
+        Args:
+            items: Dictionary of cache keys and the bytes to store
+        """
+        if not items:
+            return
+            
+        with self._lock:
+            access = self._next_access()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                [(key, sqlite3.Binary(value), len(value), access) for key, value in items.items()]
+            )
+            
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                
+                # Evict oldest entries, always keeping the ones just stored
+                while total > self.max_bytes:
+                    row = self._conn.execute(
+                        "SELECT key, size FROM entries WHERE accessed < ? ORDER BY accessed LIMIT 1", (access,)
+                    ).fetchone()
+                    if row is None:
+                        break
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (row[0],))
+                    total -= row[1]
+                    self.evictions += 1
+                    
+            self._conn.commit()
+    
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def clear(self):
+        """Remove all cached entries."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get usage counters for the cache.
+        
+        Returns:
+            Dictionary with hit/miss/eviction counters and the cache size
+        """
+        lookups = self.hits + self.misses
+        with self._lock:
+            items, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "items": items,
+            "bytes": size,
+        }
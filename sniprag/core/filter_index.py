@@ -0,0 +1,360 @@
+"""
+Filter Index - Inverted indexes from metadata values to vector IDs for filtered search.
+"""
+
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+import faiss
+
+# Keys of values that cannot be hashed, and of chunks without the field
+_UNINDEXED = object()
+_NO_FIELD = object()
+
+# A value also keeps a bitmap over vector IDs once it has at least one vector per this
+# many bits of the bitmap, so bitmaps never take more memory than the ID lists
+_BITS_PER_DENSE_ID = 64
+
+def _filter_key(value: Any) -> Any:
+    """Get the filter index key of a metadata value."""
+    try:
+        hash(value)
+    except TypeError:
+        return _UNINDEXED
+    return value
+
+def _bitmap_of(vector_ids: np.ndarray) -> np.ndarray:
+    """
+    Build a bitmap with the bits of vector IDs set, in FAISS IDSelectorBitmap layout.
+    
+    Args:
+        vector_ids: Vector IDs to set
+        
+    Returns:
+        Bitmap as a uint8 array, bit (id & 7) of byte (id >> 3) set for each ID
+    """
+    flags = np.zeros(int(vector_ids.max()) + 1 if len(vector_ids) else 0, dtype=bool)
+    flags[vector_ids] = True
+    return np.packbits(flags, bitorder="little")
+
+class _Postings:
+    """
+    Vector IDs of the chunks with one metadata value, as a sorted array with one
+    entry per chunk (shared vectors appear once per chunk), plus a bitmap while
+    the value is dense.
+    
+    Removed entries are only marked dead, and the array is compacted once half of
+    it is dead, so a removal costs time in the removed chunks, not in every chunk
+    with the value.
+    """
+    
+    def __init__(self):
+        self._ids = np.zeros(16, dtype='int64')
+        self._dead = np.zeros(16, dtype=bool)
+        self._used = 0
+        self.size = 0
+        self.bitmap = None
+    
+    @property
+    def ids(self) -> np.ndarray:
+        """Sorted vector IDs, one per chunk."""
+        ids = self._ids[:self._used]
+        return ids if self.size == self._used else ids[~self._dead[:self._used]]
+    
+    def unique_ids(self) -> np.ndarray:
+        """Sorted vector IDs without the repeats of shared vectors."""
+        ids = self.ids
+        return ids[np.concatenate([[True], ids[1:] != ids[:-1]])] if len(ids) else ids
+    
+    def _reserve(self, count: int):
+        """Make room for more entries, growing the arrays geometrically when full."""
+        if self._used + count <= len(self._ids):
+            return
+            
+        capacity = max(2 * len(self._ids), self._used + count)
+        ids = np.zeros(capacity, dtype='int64')
+        ids[:self._used] = self._ids[:self._used]
+        dead = np.zeros(capacity, dtype=bool)
+        dead[:self._used] = self._dead[:self._used]
+        self._ids, self._dead = ids, dead
+    
+    def add(self, vector_ids: np.ndarray):
+        """
+        Add the vector IDs of new chunks.
+        
+        Args:
+            vector_ids: Sorted vector IDs
+        """
+        self._reserve(len(vector_ids))
+        used = self._used
+        end = used + len(vector_ids)
+        if used and vector_ids[0] < self._ids[used - 1]:
+            # IDs of shared vectors can be older than the newest ones
+            positions = np.searchsorted(self._ids[:used], vector_ids, side="right")
+            self._ids[:end] = np.insert(self._ids[:used], positions, vector_ids)
+            self._dead[:end] = np.insert(self._dead[:used], positions, False)
+        else:
+            # New vectors have the largest IDs so far, so appending keeps the order
+            self._ids[used:end] = vector_ids
+            self._dead[used:end] = False
+        self._used = end
+        self.size += len(vector_ids)
+        
+        if self.bitmap is not None:
+            if int(vector_ids[-1]) >> 3 >= len(self.bitmap):
+                # Grow geometrically, as the ID list does
+                grown = np.zeros(max(2 * len(self.bitmap), (int(vector_ids[-1]) >> 3) + 1), dtype=np.uint8)
+                grown[:len(self.bitmap)] = self.bitmap
+                self.bitmap = grown
+            np.bitwise_or.at(self.bitmap, vector_ids >> 3, (1 << (vector_ids & 7)).astype(np.uint8))
+        self._update_bitmap()
+    
+    def remove(self, vector_ids: np.ndarray):
+        """
+        Remove the vector IDs of removed chunks.
+        
+        Args:
+            vector_ids: Sorted vector IDs, each present in the list
+        """
+        ids = self._ids[:self._used]
+        dead = self._dead[:self._used]
+        starts = np.searchsorted(ids, vector_ids, side="left")
+        ends = np.searchsorted(ids, vector_ids, side="right")
+        
+        # Most vectors have a single entry, which is live
+        single = ends - starts == 1
+        dead[starts[single]] = True
+        gone = [vector_ids[single]]
+        
+        # Chunks sharing a vector have consecutive entries, some of which may already be dead
+        shared, counts = np.unique(vector_ids[~single], return_counts=True)
+        for vector_id, count in zip(shared, counts):
+            start, end = np.searchsorted(ids, [vector_id, vector_id + 1])
+            dead[start + np.flatnonzero(~dead[start:end])[:count]] = True
+            if dead[start:end].all():
+                gone.append([vector_id])
+        self.size -= len(vector_ids)
+        
+        if self.bitmap is not None:
+            # Clear the bits of vectors no other chunk with this value uses
+            gone = np.concatenate(gone).astype('int64')
+            np.bitwise_and.at(self.bitmap, gone >> 3, ~(1 << (gone & 7)).astype(np.uint8))
+            
+        if 2 * self.size < self._used:
+            # Compact the dead entries away
+            live = ids[~dead]
+            self._ids[:self.size] = live
+            self._dead[:self.size] = False
+            self._used = self.size
+        self._update_bitmap()
+    
+    def _update_bitmap(self):
+        """Keep a bitmap while the value is dense, with some slack before dropping it."""
+        if not self.size:
+            self.bitmap = None
+            return
+            
+        num_bits = int(self._ids[self._used - 1]) + 1
+        if self.bitmap is None and self.size * _BITS_PER_DENSE_ID >= num_bits:
+            self.bitmap = _bitmap_of(self.ids)
+        elif self.bitmap is not None and 2 * self.size * _BITS_PER_DENSE_ID < num_bits:
+            self.bitmap = None
+
+class FilterSelection:
+    """
+    Vectors that can pass a metadata filter, held as sorted unique IDs or as a bitmap.
+    """
+    
+    def __init__(self, ids: Optional[np.ndarray] = None, bitmap: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.bitmap = bitmap
+    
+    @property
+    def empty(self) -> bool:
+        """Whether no vector is selected."""
+        if self.ids is not None:
+            return len(self.ids) == 0
+        return not self.bitmap.any()
+    
+    def to_bitmap(self) -> np.ndarray:
+        """Get the selection as a bitmap."""
+        return _bitmap_of(self.ids) if self.ids is not None else self.bitmap
+    
+    def union(self, other: "FilterSelection") -> "FilterSelection":
+        """Select the vectors selected by either selection."""
+        if self.ids is not None and other.ids is not None:
+            return FilterSelection(ids=np.union1d(self.ids, other.ids))
+        longer, shorter = sorted((self.to_bitmap(), other.to_bitmap()), key=len, reverse=True)
+        bitmap = longer.copy()
+        bitmap[:len(shorter)] |= shorter
+        return FilterSelection(bitmap=bitmap)
+    
+    def intersection(self, other: "FilterSelection") -> "FilterSelection":
+        """Select the vectors selected by both selections."""
+        if self.ids is not None and other.ids is not None:
+            return FilterSelection(ids=np.intersect1d(self.ids, other.ids, assume_unique=True))
+        if self.ids is not None or other.ids is not None:
+            # Look the IDs up in the bitmap
+            ids, bitmap = (self.ids, other.bitmap) if self.ids is not None else (other.ids, self.bitmap)
+            inside = ids[(ids >> 3) < len(bitmap)]
+            return FilterSelection(ids=inside[(bitmap[inside >> 3] >> (inside & 7)) & 1 == 1])
+        num_bytes = min(len(self.bitmap), len(other.bitmap))
+        return FilterSelection(bitmap=self.bitmap[:num_bytes] & other.bitmap[:num_bytes])
+    
+    def selector(self) -> Tuple[faiss.IDSelector, Any]:
+        """
+        Build a FAISS selector of the selected vectors.
+        
+        Returns:
+            Tuple of (selector, object that must be kept alive while the selector is used)
+        """
+        if self.ids is not None:
+            return faiss.IDSelectorBatch(self.ids), self.ids
+        bitmap = np.ascontiguousarray(self.bitmap)
+        return faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)), bitmap
+
+class FilterIndex:
+    """
+    Inverted indexes from the values of chosen metadata fields to the vectors of
+    the chunks that have them.
+    
+    Each value keeps a sorted array of vector IDs, updated as chunks are added and
+    removed, and values matching a large share of the corpus also keep a bitmap
+    over vector IDs, so a filter is turned into a FAISS selector without visiting
+    every matching chunk.
+    """
+    
+    def __init__(self, fields: Iterable[str]):
+        """
+        Initialize the filter index.
+        
+        Args:
+            fields: Metadata fields to index
+        """
+        self.fields = tuple(fields)
+        self._postings = {field: {} for field in self.fields}
+        
+        # Number of indexed chunks on each vector, and of vectors shared by several chunks
+        self._vector_chunks = np.zeros(0, dtype='int32')
+        self._num_shared = 0
+    
+    def clear(self):
+        """Remove all indexed chunks."""
+        self._postings = {field: {} for field in self.fields}
+        self._vector_chunks = np.zeros(0, dtype='int32')
+        self._num_shared = 0
+    
+    def _count_chunks(self, vector_ids: List[int], delta: int):
+        """Update the number of chunks on each vector, and the number of shared vectors."""
+        vector_ids = np.asarray(vector_ids, dtype='int64')
+        if not len(vector_ids):
+            return
+            
+        if vector_ids.max() >= len(self._vector_chunks):
+            grown = np.zeros(max(2 * len(self._vector_chunks), int(vector_ids.max()) + 1), dtype='int32')
+            grown[:len(self._vector_chunks)] = self._vector_chunks
+            self._vector_chunks = grown
+            
+        touched = np.unique(vector_ids)
+        shared_before = np.count_nonzero(self._vector_chunks[touched] > 1)
+        np.add.at(self._vector_chunks, vector_ids, delta)
+        self._num_shared += np.count_nonzero(self._vector_chunks[touched] > 1) - shared_before
+    
+    def _group(self, vector_ids: List[int], metadatas: List[Dict[str, Any]]) -> Dict[str, Dict[Any, np.ndarray]]:
+        """Group vector IDs by field and value key, each group sorted."""
+        groups = {field: {} for field in self.fields}
+        for vector_id, metadata in zip(vector_ids, metadatas):
+            for field in self.fields:
+                groups[field].setdefault(_filter_key(metadata.get(field, _NO_FIELD)), []).append(vector_id)
+        return {field: {key: np.sort(np.array(ids, dtype='int64')) for key, ids in field_groups.items()}
+                for field, field_groups in groups.items()}
+    
+    def add(self, vector_ids: List[int], metadatas: List[Dict[str, Any]]):
+        """
+        Index new chunks.
+        
+        Args:
+            vector_ids: Vector ID of each chunk
+            metadatas: Metadata of each chunk
+        """
+        if self.fields:
+            self._count_chunks(vector_ids, 1)
+        for field, field_groups in self._group(vector_ids, metadatas).items():
+            for key, ids in field_groups.items():
+                self._postings[field].setdefault(key, _Postings()).add(ids)
+    
+    def remove(self, vector_ids: List[int], metadatas: List[Dict[str, Any]]):
+        """
+        Remove chunks from the index.
+        
+        Args:
+            vector_ids: Vector ID of each chunk
+            metadatas: Metadata of each chunk
+        """
+        if self.fields:
+            self._count_chunks(vector_ids, -1)
+        for field, field_groups in self._group(vector_ids, metadatas).items():
+            for key, ids in field_groups.items():
+                postings = self._postings[field][key]
+                postings.remove(ids)
+                if not postings.size:
+                    del self._postings[field][key]
+    
+    def _field_selection(self, field: str, value: Any) -> Tuple[Optional[FilterSelection], bool]:
+        """
+        Select the vectors that can pass a filter on one indexed field.
+        
+        Args:
+            field: Indexed metadata field
+            value: Hashable value to match
+            
+        Returns:
+            Tuple of (selection, or None if nothing matches; whether every selected
+            vector has a chunk passing the filter)
+        """
+        # Chunks without the field pass the filter, and unhashable values are checked after the search
+        field_postings = self._postings[field]
+        parts = [field_postings[key] for key in (value, _NO_FIELD, _UNINDEXED) if key in field_postings]
+        exact = _UNINDEXED not in field_postings
+        
+        selection = None
+        for postings in parts:
+            if postings.bitmap is not None:
+                part = FilterSelection(bitmap=postings.bitmap)
+            else:
+                part = FilterSelection(ids=postings.unique_ids())
+            selection = part if selection is None else selection.union(part)
+        return selection, exact
+    
+    def select(self, filter_metadata: Dict[str, Any]) -> Tuple[Optional[FilterSelection], bool]:
+        """
+        Select the vectors whose chunks can pass metadata filters.
+        
+        Args:
+            filter_metadata: Metadata filters
+            
+        Returns:
+            Tuple of (selection, or None if no filter is on an indexed field; whether
+            every selected vector has a chunk passing all filters)
+        """
+        selection = None
+        exact = True
+        for field, value in filter_metadata.items():
+            if field not in self._postings or _filter_key(value) is _UNINDEXED:
+                exact = False
+                continue
+                
+            field_selection, field_exact = self._field_selection(field, value)
+            exact = exact and field_exact
+            if field_selection is None:
+                return FilterSelection(ids=np.zeros(0, dtype='int64')), exact
+                
+            # A shared vector can pass each field through a different chunk, so an
+            # intersection is only exact while no vector is shared
+            if selection is None:
+                selection = field_selection
+            else:
+                selection = selection.intersection(field_selection)
+                exact = exact and not self._num_shared
+                
+        return selection, exact
@@ -0,0 +1,273 @@
+"""
+Page Image Store - Size-bounded storage for rendered page and slice images.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Any, Iterator, Optional
+
+class PageImageStore(MutableMapping):
+    """
+    Dictionary-like store for encoded images (PNG bytes) keyed by page or slice key.
+    
+    Recently used images are kept in memory up to a byte budget. Least recently
+    used images beyond the budget are spilled to a content-addressed directory on
+    disk and read back transparently when requested again. Images of a store
+    restored with load() are read directly from the saved directory.
+    
+    The store is safe to share between threads, such as searches rendering
+    snippets while documents are being ingested.
+    """
+    
+    def __init__(self, max_memory_bytes: Optional[int] = None, spill_dir: Optional[str] = None):
+        """
+        Initialize the page image store.
+        
+        Args:
+            max_memory_bytes: Maximum total size of images held in memory; None means unbounded
+            spill_dir: Directory for images evicted from memory, in which the store
+                spills into a private subdirectory so stores sharing the directory never
+                delete each other's files. If a memory budget is set without a
+                directory, a temporary directory is used. Either is removed on close()
+        """
+        self.max_memory_bytes = max_memory_bytes
+        
+        # Spill directory, and the private directory the store writes to, created
+        # lazily on first eviction
+        self.spill_dir = spill_dir
+        self._spill_path = None
+        self._owns_spill_dir = False
+        
+        # In-memory tier, ordered from least to most recently used; every tier is
+        # guarded by the lock, which is reentrant as mapping methods call each other
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        
+        # On-disk tier: key -> content digest, and digest -> number of keys sharing it
+        self._disk = {}
+        self._digest_refs = {}
+        
+        # Read-only tier of images restored with load(): key -> file path
+        self._saved = {}
+        
+        # Counters for sizing the memory budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_reads = 0
+    
+    def __getitem__(self, key: str) -> bytes:
+        with self._lock:
+            return self._get(key)
+    
+    def _get(self, key: str) -> bytes:
+        """Look up an image, promoting spilled images to memory. Call with the lock held."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+            
+        self.misses += 1
+        if key in self._saved:
+            # Served from the saved files, leaving caching to the OS
+            with open(self._saved[key], "rb") as f:
+                data = f.read()
+            self.disk_reads += 1
+            return data
+            
+        if key not in self._disk:
+            raise KeyError(key)
+            
+        # Read the image back from disk and promote it to the memory tier
+        with open(self._digest_path(self._disk[key]), "rb") as f:
+            data = f.read()
+        self.disk_reads += 1
+        self._store_in_memory(key, data)
+        return data
+    
+    def __setitem__(self, key: str, data: bytes):
+        with self._lock:
+            if key in self:
+                del self[key]
+            self._store_in_memory(key, bytes(data))
+    
+    def __delitem__(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            elif key in self._disk:
+                self._release_digest(self._disk.pop(key))
+            elif key in self._saved:
+                # Saved files are left in place for other processes using them
+                del self._saved[key]
+            else:
+                raise KeyError(key)
+    
+    def pop(self, key: str, *default: Any) -> Any:
+        """Remove an image and return it, as one step."""
+        with self._lock:
+            return super().pop(key, *default)
+    
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk or key in self._saved
+    
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            keys = list(self._memory) + list(self._disk) + list(self._saved)
+        yield from keys
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory) + len(self._disk) + len(self._saved)
+    
+    def _store_in_memory(self, key: str, data: bytes):
+        """Add an image to the memory tier, spilling older images if over budget."""
+        if key in self._disk:
+            self._release_digest(self._disk.pop(key))
+        self._saved.pop(key, None)
+        
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        
+        if self.max_memory_bytes is None:
+            return
+            
+        # Evict least recently used images, always keeping the newest one in memory
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            old_key, old_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            self._spill(old_key, old_data)
+            self.evictions += 1
+    
+    def _spill(self, key: str, data: bytes):
+        """Write an evicted image to the content-addressed spill directory."""
+        if self._spill_path is None:
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix="sniprag-images-")
+                self._owns_spill_dir = True
+                self._spill_path = self.spill_dir
+            else:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._spill_path = tempfile.mkdtemp(prefix="sniprag-images-", dir=self.spill_dir)
+                
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._digest_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            
+        self._disk[key] = digest
+        self._digest_refs[digest] = self._digest_refs.get(digest, 0) + 1
+    
+    def _release_digest(self, digest: str):
+        """Drop one reference to a spilled image, deleting the file when unused."""
+        self._digest_refs[digest] -= 1
+        if self._digest_refs[digest] == 0:
+            del self._digest_refs[digest]
+            path = self._digest_path(digest)
+            if os.path.exists(path):
+                os.unlink(path)
+    
+    def _digest_path(self, digest: str) -> str:
+        """Path of the spill file for a content digest."""
+        return os.path.join(self._spill_path, digest[:2], f"{digest}.png")
+    
+    def clear(self):
+        """Remove all images from memory and disk."""
+        with self._lock:
+            for digest in list(self._digest_refs):
+                self._digest_refs[digest] = 1
+                self._release_digest(digest)
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk.clear()
+            self._saved.clear()
+    
+    def save(self, directory: str):
+        """
+        Write all images to a content-addressed directory with an index of their keys.
+        Files of images no longer in the store are left in place, so processes still
+        serving an earlier save of the same directory keep working.
+        
+        Args:
+            directory: Directory to save the images to
+        """
+        os.makedirs(directory, exist_ok=True)
+        
+        # Hold the lock throughout, so the saved keys are a consistent snapshot
+        keys = {}
+        with self._lock:
+            for key in self:
+                data = self._get(key)
+                digest = hashlib.sha256(data).hexdigest()
+                path = os.path.join(directory, digest[:2], f"{digest}.png")
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                keys[key] = digest
+                
+        tmp_path = os.path.join(directory, "keys.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(keys, f)
+        os.replace(tmp_path, os.path.join(directory, "keys.json"))
+    
+    def load(self, directory: str):
+        """
+        Replace the contents of the store with images saved by save().
+        Images are not read until requested, and are then read from the saved files.
+        
+        Args:
+            directory: Directory the images were saved to
+        """
+        with open(os.path.join(directory, "keys.json")) as f:
+            keys = json.load(f)
+        with self._lock:
+            self.clear()
+            self._saved = {key: os.path.join(directory, digest[:2], f"{digest}.png") for key, digest in keys.items()}
+    
+    def close(self):
+        """Remove all images and the directories the store created to spill them."""
+        with self._lock:
+            self.clear()
+            if self._spill_path is not None:
+                shutil.rmtree(self._spill_path, ignore_errors=True)
+                self._spill_path = None
+            if self._owns_spill_dir:
+                self.spill_dir = None
+                self._owns_spill_dir = False
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get usage counters for the store.
+        
+        Returns:
+            Dictionary with hit/miss/eviction counters and tier sizes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_reads": self.disk_reads,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_items": len(self._disk),
+                "saved_items": len(self._saved),
+                "disk_bytes": sum(os.path.getsize(self._digest_path(d)) for d in self._digest_refs),
+            }
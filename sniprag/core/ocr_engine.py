@@ -2,15 +2,507 @@
 OCR-based SnipRAG Engine - Uses OCR on horizontal slices for text extraction.
 """
 
+import os
+import json
 import base64
-from typing import List, Dict, Any, Optional, Tuple
+import bisect
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Union
 import fitz
 import io
+import numpy as np
 from PIL import Image
 import pytesseract
 from langchain.docstore.document import Document
 
-from .base_engine import BaseSnipRAGEngine, logger
+from .base_engine import BaseSnipRAGEngine, logger, _open_pdf
+from .disk_cache import DiskCache
+from .image_store import PageImageStore
+
+# Pixels differing this much from the page background (in the darkest channel) count as ink
+_INK_CONTRAST = 48
+
+# Adaptive OCR resolution: rendered font size in pixels, and the most pixels per page
+_TARGET_TEXT_PIXELS = 40
+_MAX_PAGE_PIXELS = 12_000_000
+
+def _snap_bounds(ink_rows: np.ndarray, slice_bounds: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Move the edges between slices to the emptiest nearby pixel row, so text lines
+    are not cut in half.
+    
+    Args:
+        ink_rows: Number of ink pixels in each pixel row of the page
+        slice_bounds: List of (y0, y1) slice edges in pixels, sorted by y0
+        
+    Returns:
+        Slice edges with every interior edge moved by at most a quarter slice height
+    """
+    edges = [y0 for y0, _ in slice_bounds[1:]]
+    snapped = []
+    for edge, (y0, y1) in zip(edges, slice_bounds):
+        reach = max(1, (y1 - y0) // 4)
+        lo = max(edge - reach, 1)
+        hi = min(edge + reach, len(ink_rows) - 1)
+        if lo >= hi:
+            snapped.append(edge)
+            continue
+            
+        # Prefer the row with the least ink, then the one closest to the original edge
+        window = ink_rows[lo:hi]
+        distance = np.abs(np.arange(lo, hi) - edge)
+        snapped.append(lo + int(np.lexsort((distance, window))[0]))
+        
+    starts = [slice_bounds[0][0]] + snapped
+    ends = snapped + [slice_bounds[-1][1]]
+    return list(zip(starts, ends))
+
+def _adaptive_dpi(page: fitz.Page, min_dpi: int = 150, max_dpi: int = 300) -> int:
+    """
+    Pick the OCR resolution for a page from its font sizes or scanned image resolution,
+    capped so large pages do not exceed a pixel budget.
+    
+    Args:
+        page: PyMuPDF page to render
+        min_dpi: Lowest resolution to use
+        max_dpi: Highest resolution to use
+        
+    Returns:
+        Resolution in dots per inch
+    """
+    sizes = [span["size"] for block in page.get_text("dict")["blocks"] if block["type"] == 0
+             for line in block["lines"] for span in line["spans"]]
+    images = page.get_image_info()
+    
+    if sizes:
+        # Render the typical font at the height Tesseract reads best
+        dpi = _TARGET_TEXT_PIXELS * 72 / float(np.median(sizes))
+    elif images:
+        # Scanned pages: match the resolution of the largest image, as more pixels add nothing
+        largest = max(images, key=lambda info: abs(fitz.Rect(info["bbox"])))
+        dpi = largest["width"] / max(fitz.Rect(largest["bbox"]).width / 72, 1e-6)
+    else:
+        dpi = max_dpi
+        
+    page_area = page.rect.width * page.rect.height / (72 * 72)
+    dpi = min(dpi, (_MAX_PAGE_PIXELS / page_area) ** 0.5)
+    return int(round(min(max(dpi, min_dpi), max_dpi)))
+
+def _text_layer_lines(page: fitz.Page) -> List[Tuple[str, float, float]]:
+    """
+    Read the lines of a page's text layer with their vertical extent.
+    
+    Args:
+        page: PyMuPDF page to read
+        
+    Returns:
+        List of (line text, top, bottom) in PDF points, in reading order
+    """
+    # Accurate bounding boxes follow the glyphs rather than the font's ascender/descender
+    page_dict = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_ACCURATE_BBOXES)
+    
+    lines = []
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            x0, y0, x1, y1 = line["bbox"]
+            
+            # Ignore lines outside the page horizontally
+            if x1 <= 0 or x0 >= page.rect.width:
+                continue
+            lines.append(("".join(span["text"] for span in line["spans"]), y0, y1))
+            
+    return lines
+
+def _slice_text_layer(page: fitz.Page, lines: List[Tuple[str, float, float]], num_slices: int,
+                      snap_slices: bool) -> Tuple[List[Tuple[float, float]], List[str]]:
+    """
+    Cut a page into horizontal slices in PDF points and assign each text layer line
+    to the slice containing its vertical center, so no line is read twice.
+    
+    Args:
+        page: PyMuPDF page to slice
+        lines: Lines of the page from _text_layer_lines
+        num_slices: Number of horizontal slices
+        snap_slices: If True, move slice edges to nearby gaps between lines
+        
+    Returns:
+        Tuple of (list of (y0, y1) slice edges in points, text of each slice)
+    """
+    height = page.rect.height
+    slice_height = height / num_slices
+    slice_points = [(slice_idx * slice_height, (slice_idx + 1) * slice_height if slice_idx < num_slices - 1 else height)
+                    for slice_idx in range(num_slices)]
+                    
+    if snap_slices:
+        # Snap on a one-point grid counting the lines covering each row, which
+        # stands in for the ink rows of a rendered page
+        coverage = np.zeros(int(np.ceil(height)), dtype=np.int64)
+        for _, top, bottom in lines:
+            coverage[max(int(top), 0):max(int(np.ceil(bottom)), 0)] += 1
+        snapped = _snap_bounds(coverage, [(int(round(y0)), int(round(y1))) for y0, y1 in slice_points])
+        edges = [float(y0) for y0, _ in snapped[1:]]
+        slice_points = list(zip([0.0] + edges, edges + [height]))
+        
+    # Put each line in the slice containing its vertical center
+    slice_ends = [y1 for _, y1 in slice_points]
+    slice_lines = [[] for _ in slice_points]
+    for text, top, bottom in lines:
+        slice_idx = min(bisect.bisect_right(slice_ends, (top + bottom) / 2), num_slices - 1)
+        slice_lines[slice_idx].append(text)
+        
+    return slice_points, ["".join(line + "\n" for line in text_lines) for text_lines in slice_lines]
+
+def _render_page(doc: fitz.Document, page_idx: int, document_id: str,
+                 options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cut a page into horizontal slices, reading the slices' text layer if OCR can be
+    skipped, and render its stored page and slice images.
+    
+    In "auto" OCR mode the text layer is checked first, and pages with enough
+    native text are sliced in points without being rendered for OCR. Other pages
+    are rendered once at the OCR resolution (in grayscale if configured) and,
+    unless that render can be reused, once in color at the snippet resolution.
+    
+    Args:
+        doc: Open PDF document
+        page_idx: Page to render
+        document_id: Unique identifier for the document
+        options: Extraction settings from OCRSnipRAGEngine._extraction_options
+        
+    Returns:
+        Dictionary with the page's key, width in points, stored images, slice bounds
+        in OCR pixels and in points, blank slice flags, OCR page and slice images
+        (None for blank slices), and its slice texts if they were read from the
+        text layer (in which case the OCR bounds and images are None)
+    """
+    num_slices = options["num_slices"]
+    page = doc[page_idx]
+    
+    # Store key for this page
+    page_key = f"{document_id}_{page_idx}"
+    
+    # Read the slices from the text layer if the page has enough native text,
+    # and only fall back to OCR for scanned or image-only pages
+    lines = None
+    if options["ocr_mode"] == "auto":
+        lines = _text_layer_lines(page)
+        if sum(len("".join(text.split())) for text, _, _ in lines) < options["min_text_chars"]:
+            lines = None
+            
+    if lines is not None:
+        slice_points, slice_texts = _slice_text_layer(page, lines, num_slices, options["snap_slices"])
+        slice_bounds = None
+        pix = img = ocr_scale = None
+        
+        # Slices read from the text layer are blank exactly when they have no text
+        blank = [not text.strip() for text in slice_texts]
+    else:
+        slice_texts = None
+        
+        # Render the page for OCR
+        ocr_dpi = options["ocr_dpi"]
+        if ocr_dpi == "auto":
+            ocr_dpi = _adaptive_dpi(page)
+        ocr_scale = ocr_dpi / 72
+        colorspace = fitz.csGRAY if options["ocr_grayscale"] else fitz.csRGB
+        pix = page.get_pixmap(matrix=fitz.Matrix(ocr_scale, ocr_scale), colorspace=colorspace)
+        img = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+        
+        # Get page dimensions
+        width, height = img.size
+        
+        # Count the ink pixels in each row of the rendered samples, measured against the
+        # page's most common level so light text and dark backgrounds are handled too
+        samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(height, width, pix.n)
+        levels = samples.min(axis=2)
+        background = int(np.bincount(levels.ravel(), minlength=256).argmax())
+        ink_rows = np.count_nonzero(np.abs(levels.astype(np.int16) - background) >= _INK_CONTRAST, axis=1)
+        
+        # Calculate slice height
+        slice_height = height // num_slices
+        
+        # Calculate slice coordinates
+        slice_bounds = []
+        for slice_idx in range(num_slices):
+            y0 = slice_idx * slice_height
+            y1 = (slice_idx + 1) * slice_height if slice_idx < num_slices - 1 else height
+            slice_bounds.append((y0, y1))
+            
+        if options["snap_slices"]:
+            slice_bounds = _snap_bounds(ink_rows, slice_bounds)
+            
+        # Slice edges in PDF points, independent of the render resolution
+        slice_points = [(y0 / ocr_scale, y1 / ocr_scale) for y0, y1 in slice_bounds]
+        
+        # Slices with almost no ink are skipped before any encoding or OCR
+        blank = [bool(ink_rows[y0:y1].sum() <= options["blank_threshold"] * width * (y1 - y0))
+                 for y0, y1 in slice_bounds]
+                 
+    # Render the page for snippets, reusing the OCR render if it matches
+    snippet_scale = options["snippet_dpi"] / 72
+    if snippet_scale == ocr_scale and pix.n == 3:
+        snippet_pix, snippet_img = pix, img
+    else:
+        snippet_pix = page.get_pixmap(matrix=fitz.Matrix(snippet_scale, snippet_scale))
+        snippet_img = Image.frombytes("RGB", (snippet_pix.width, snippet_pix.height), snippet_pix.samples)
+    img_data = snippet_pix.tobytes("png")
+    
+    # Extract the OCR images and store the snippet images of non-blank slices
+    slice_imgs = []
+    slice_images = {}
+    for slice_idx, (top, bottom) in enumerate(slice_points):
+        if blank[slice_idx]:
+            slice_imgs.append(None)
+            continue
+            
+        if img is not None:
+            y0, y1 = slice_bounds[slice_idx]
+            slice_imgs.append(img.crop((0, y0, img.width, y1)))
+        else:
+            slice_imgs.append(None)
+            
+        snippet = snippet_img.crop((0, round(top * snippet_scale), snippet_img.width, round(bottom * snippet_scale)))
+        slice_buffer = io.BytesIO()
+        snippet.save(slice_buffer, format="PNG")
+        slice_images[f"{page_key}_slice_{slice_idx}"] = slice_buffer.getvalue()
+        
+    return {
+        "page_idx": page_idx,
+        "page_key": page_key,
+        "width": page.rect.width,
+        "slice_bounds": slice_bounds,
+        "slice_points": slice_points,
+        "blank": blank,
+        "img": img,
+        "slice_imgs": slice_imgs,
+        "slice_texts": slice_texts,
+        "images": {"page_images": {page_key: img_data}, "slice_images": slice_images}
+    }
+
+def _ocr_page(img: Image.Image, slice_bounds: List[Tuple[int, int]]) -> List[str]:
+    """
+    OCR a whole page once and assign the recognized lines to horizontal slices.
+    
+    Args:
+        img: Rendered page image
+        slice_bounds: List of (y0, y1) slice edges in pixels, sorted by y0
+        
+    Returns:
+        Text of each slice, one recognized line per row
+    """
+    data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+    
+    # Group words into lines, tracking each line's vertical extent
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        top = data["top"][i]
+        bottom = top + data["height"][i]
+        if line_key in lines:
+            words, line_top, line_bottom = lines[line_key]
+            words.append(word)
+            lines[line_key] = (words, min(line_top, top), max(line_bottom, bottom))
+        else:
+            lines[line_key] = ([word], top, bottom)
+            
+    # Put each line in the slice containing its vertical center, so lines that
+    # cross a slice edge stay whole
+    slice_ends = [y1 for _, y1 in slice_bounds]
+    slice_lines = [[] for _ in slice_bounds]
+    for words, top, bottom in lines.values():
+        slice_idx = min(bisect.bisect_right(slice_ends, (top + bottom) / 2), len(slice_bounds) - 1)
+        slice_lines[slice_idx].append(" ".join(words))
+        
+    return ["".join(line + "\n" for line in text_lines) for text_lines in slice_lines]
+
+def _tesseract_version() -> str:
+    """Get the version of the configured Tesseract, or "unknown" if it cannot be run."""
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unknown"
+
+def _cached_ocr(cache: Optional[DiskCache], config_key: str, ocr: Callable, 
+                img: Image.Image, *args) -> Any:
+    """
+    Run an OCR function on an image, consulting a persistent cache first.
+    
+    Args:
+        cache: Cache of OCR results, or None to always run OCR
+        config_key: Tesseract settings that affect the output
+        ocr: OCR function taking the image (and any further arguments)
+        img: Image to OCR
+        *args: Further arguments for the OCR function
+        
+    Returns:
+        The OCR result
+    """
+    if cache is None:
+        return ocr(img, *args)
+        
+    # Key on the pixels rather than the encoded image, so re-renders hit the cache
+    digest = hashlib.sha256()
+    digest.update(repr((config_key, ocr.__name__, args, img.mode, img.size)).encode())
+    digest.update(img.tobytes())
+    key = digest.hexdigest()
+    
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+        
+    result = ocr(img, *args)
+    cache.set(key, json.dumps(result).encode())
+    return result
+
+def _build_chunks(page: Dict[str, Any], document_id: str, 
+                  text_splitter: Any) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Create chunks for the slices of a page, in slice order.
+    
+    Args:
+        page: Page dictionary from _render_page, with "slice_texts" filled in
+        document_id: Unique identifier for the document
+        text_splitter: Splitter used to chunk the text of each slice
+        
+    Returns:
+        List of (text_chunk, metadata)
+    """
+    result = []
+    for slice_idx, ((y0, y1), ocr_text) in enumerate(zip(page["slice_points"], page["slice_texts"])):
+        # Skip if the slice is blank or no text was found
+        if page["blank"][slice_idx] or not ocr_text.strip():
+            continue
+            
+        # Create metadata for this slice
+        metadata = {
+            "document_id": document_id,
+            "page_number": page["page_idx"],
+            "slice_index": slice_idx,
+            "slice_key": f"{page['page_key']}_slice_{slice_idx}",
+            "source": "ocr_slices",
+            "text_source": page["text_source"],
+            "coordinates": [0, y0, page["width"], y1]
+        }
+        
+        # Create a document for langchain
+        langchain_doc = Document(
+            page_content=ocr_text,
+            metadata=metadata
+        )
+        
+        # Split the text into chunks
+        chunks = text_splitter.split_documents([langchain_doc])
+        
+        # Add each chunk with its metadata
+        for chunk in chunks:
+            result.append((chunk.page_content, chunk.metadata))
+            
+    return result
+
+def _extract_pages(pdf_path: str, document_id: str, page_numbers: List[int],
+                   options: Dict[str, Any]) -> Iterator[Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]]:
+    """
+    Extract text chunks, page images and slice images for a range of pages using OCR
+    on horizontal slices. In "auto" OCR mode, pages with a text layer are read
+    directly instead. Pages are yielded one at a time; this is a module-level
+    function so it can run in a worker process.
+    
+    Slices (or whole pages, with "ocr_per_page") are OCRed by a pool of threads
+    (each Tesseract call runs in its own subprocess), so later pages are rendered
+    and OCRed while earlier ones finish.
+    
+    Args:
+        pdf_path: Path to the PDF file, or the PDF contents as bytes
+        document_id: Unique identifier for the document
+        page_numbers: Pages to process, in order
+        options: Extraction settings from OCRSnipRAGEngine._extraction_options
+        
+    Yields:
+        Tuple of (list of (text_chunk, metadata), images by store name and key) for each page
+    """
+    text_splitter = options["text_splitter"]
+    ocr_workers = options["ocr_workers"]
+    ocr_per_page = options["ocr_per_page"]
+    
+    # Keep about two Tesseract calls per thread queued, which bounds the images held in memory
+    calls_per_page = 1 if ocr_per_page else options["num_slices"]
+    max_pending_pages = max(1, -(-2 * ocr_workers // calls_per_page))
+    
+    # Worker processes do not inherit a Tesseract path configured after start-up
+    pytesseract.pytesseract.tesseract_cmd = options["tesseract_cmd"]
+    
+    # Persistent cache of OCR results, opened per process
+    cache = None
+    config_key = None
+    if options["ocr_cache_dir"]:
+        cache = DiskCache(os.path.join(options["ocr_cache_dir"], "ocr_cache.sqlite"), 
+                          max_bytes=options["ocr_cache_size"])
+        config_key = f"{options['tesseract_cmd']}:{_tesseract_version()}"
+        
+    # Open the PDF
+    doc = _open_pdf(pdf_path)
+    executor = ThreadPoolExecutor(max_workers=ocr_workers)
+    pending = deque()
+    
+    def finish_page():
+        # Wait for the oldest page's slices and reassemble them in slice order
+        page = pending.popleft()
+        if page["slice_texts"] is None:
+            if ocr_per_page:
+                page["slice_texts"] = page["ocr_futures"][0].result()
+            else:
+                page["slice_texts"] = [future.result() if future is not None else ""
+                                       for future in page["ocr_futures"]]
+            page["text_source"] = "ocr"
+        else:
+            page["text_source"] = "text_layer"
+        return _build_chunks(page, document_id, text_splitter), page["images"]
+        
+    try:
+        # Process each page
+        for page_idx in page_numbers:
+            page = _render_page(doc, page_idx, document_id, options)
+            
+            # Nothing to read on a blank page
+            if page["slice_texts"] is None and all(page["blank"]):
+                page["slice_texts"] = ["" for _ in page["blank"]]
+                
+            # Perform OCR on the page or its non-blank slices, unless the text layer is used
+            if page["slice_texts"] is None and ocr_per_page:
+                page["ocr_futures"] = [executor.submit(_cached_ocr, cache, config_key, _ocr_page,
+                                                       page["img"], page["slice_bounds"])]
+            elif page["slice_texts"] is None:
+                page["ocr_futures"] = [executor.submit(_cached_ocr, cache, config_key, 
+                                                       pytesseract.image_to_string, slice_img)
+                                       if slice_img is not None else None
+                                       for slice_img in page["slice_imgs"]]
+            del page["img"], page["slice_imgs"]
+            pending.append(page)
+            
+            while len(pending) >= max_pending_pages:
+                yield finish_page()
+                
+        while pending:
+            yield finish_page()
+            
+    finally:
+        # Drop queued OCR work if the consumer stopped early
+        for page in pending:
+            for future in page.get("ocr_futures", []):
+                if future is not None:
+                    future.cancel()
+        executor.shutdown()
+        if cache is not None:
+            cache.close()
+            
+        # Close the document
+        doc.close()
 
 class OCRSnipRAGEngine(BaseSnipRAGEngine):
     """
@@ -19,111 +511,94 @@ class OCRSnipRAGEngine(BaseSnipRAGEngine):
     OCR on each slice to extract text.
     """
     
-    def __init__(self, num_slices: int = 10, tesseract_cmd: Optional[str] = None, **kwargs):
+    def __init__(self, num_slices: int = 10, tesseract_cmd: Optional[str] = None, 
+                 ocr_mode: str = "always", min_text_chars: int = 50, 
+                 ocr_workers: int = 1, ocr_per_page: bool = False,
+                 ocr_cache_dir: Optional[str] = None, ocr_cache_size: int = 1 << 30,
+                 blank_threshold: float = 0.0001, snap_slices: bool = False,
+                 ocr_dpi: Union[int, str] = 300, ocr_grayscale: bool = False, **kwargs):
         """
         Initialize the OCR-based SnipRAG Engine.
         
         Args:
             num_slices: Number of horizontal slices per page
             tesseract_cmd: Path to tesseract executable, if not in PATH
+            ocr_mode: "always" to OCR every page, or "auto" to read pages that have
+                a text layer directly and OCR only scanned or image-only pages
+            min_text_chars: In "auto" mode, the number of non-whitespace characters a
+                page's text layer needs for the page to skip OCR
+            ocr_workers: Number of threads running Tesseract concurrently on the slices
+                of consecutive pages (per extraction worker process)
+            ocr_per_page: If True, run Tesseract once per page and assign the recognized
+                lines to slices, instead of running it on every slice
+            ocr_cache_dir: Directory of a persistent cache of OCR results keyed by the
+                rendered pixels and Tesseract version, so re-ingestion only OCRs new pages
+            ocr_cache_size: Maximum size of the OCR cache in bytes; least recently used
+                results beyond it are evicted
+            blank_threshold: Fraction of ink pixels (pixels contrasting with the page
+                background) at or below which a slice of a page that needs OCR is treated
+                as blank and skipped without being encoded or OCRed (negative disables)
+            snap_slices: If True, move slice edges to nearby whitespace rows so text
+                lines are not cut
+            ocr_dpi: Resolution pages are rendered at for OCR, or "auto" to pick it per
+                page from the font size or scanned image resolution (150-300 DPI)
+            ocr_grayscale: If True, render pages for OCR in grayscale
             **kwargs: Additional arguments to pass to the base class
+            
+        Raises:
+            ValueError: If an invalid OCR mode is specified
         """
+        if ocr_mode not in ("always", "auto"):
+            raise ValueError(f"Invalid OCR mode: {ocr_mode}. Must be 'always' or 'auto'.")
+            
         super().__init__(**kwargs)
         self.num_slices = num_slices
+        self.ocr_mode = ocr_mode
+        self.min_text_chars = min_text_chars
+        self.ocr_workers = max(1, ocr_workers)
+        self.ocr_per_page = ocr_per_page
+        self.ocr_cache_dir = ocr_cache_dir
+        self.ocr_cache_size = ocr_cache_size
+        self.blank_threshold = blank_threshold
+        self.snap_slices = snap_slices
+        self.ocr_dpi = ocr_dpi
+        self.ocr_grayscale = ocr_grayscale
         
         # Configure Tesseract path if provided
         if tesseract_cmd:
             pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
             
         # Storage for slice images
-        self.slice_images = {}
+        self.slice_images = self._create_image_store("slices")
     
-    def _extract_text_chunks(self, pdf_path: str, document_id: str) -> List[Tuple[str, Dict[str, Any]]]:
-        """
-        Extract text chunks from a PDF with metadata using OCR on horizontal slices.
-        
-        Args:
-            pdf_path: Path to the PDF file
-            document_id: Unique identifier for the document
-            
-        Returns:
-            List of tuples (text_chunk, metadata)
-        """
-        result = []
-        
-        # Open the PDF
-        doc = fitz.open(pdf_path)
-        
-        # Process each page
-        for page_idx in range(len(doc)):
-            page = doc[page_idx]
-            
-            # Store key for this page
-            page_key = f"{document_id}_{page_idx}"
-            
-            # Render the page to an image at 300 DPI and store it
-            pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-            self.page_images[page_key] = img_data
-            
-            # Get page dimensions
-            width, height = img.size
-            
-            # Calculate slice height
-            slice_height = height // self.num_slices
-            
-            # Create and process slices
-            for slice_idx in range(self.num_slices):
-                # Calculate slice coordinates
-                y0 = slice_idx * slice_height
-                y1 = (slice_idx + 1) * slice_height if slice_idx < self.num_slices - 1 else height
-                
-                # Extract the slice image
-                slice_img = img.crop((0, y0, width, y1))
-                
-                # Generate a key for this slice
-                slice_key = f"{page_key}_slice_{slice_idx}"
-                
-                # Store the slice image
-                slice_buffer = io.BytesIO()
-                slice_img.save(slice_buffer, format="PNG")
-                self.slice_images[slice_key] = slice_buffer.getvalue()
-                
-                # Perform OCR on the slice
-                ocr_text = pytesseract.image_to_string(slice_img)
-                
-                # Skip if no text was found
-                if not ocr_text.strip():
-                    continue
-                
-                # Create metadata for this slice
-                metadata = {
-                    "document_id": document_id,
-                    "page_number": page_idx,
-                    "slice_index": slice_idx,
-                    "slice_key": slice_key,
-                    "source": "ocr_slices",
-                    "coordinates": [0, y0, width, y1]
-                }
-                
-                # Create a document for langchain
-                langchain_doc = Document(
-                    page_content=ocr_text,
-                    metadata=metadata
-                )
-                
-                # Split the text into chunks
-                chunks = self.text_splitter.split_documents([langchain_doc])
-                
-                # Add each chunk with its metadata
-                for chunk in chunks:
-                    result.append((chunk.page_content, chunk.metadata))
-        
-        # Close the document
-        doc.close()
-        
-        return result
+    def _page_extractor(self) -> Callable:
+        """Get the function that extracts chunks from a range of pages."""
+        return _extract_pages
+    
+    def _extraction_options(self) -> Dict[str, Any]:
+        """Get the picklable settings passed to the page extractor."""
+        options = super()._extraction_options()
+        options.update({
+            "num_slices": self.num_slices,
+            "tesseract_cmd": pytesseract.pytesseract.tesseract_cmd,
+            "ocr_mode": self.ocr_mode,
+            "min_text_chars": self.min_text_chars,
+            "ocr_workers": self.ocr_workers,
+            "ocr_per_page": self.ocr_per_page,
+            "ocr_cache_dir": self.ocr_cache_dir,
+            "ocr_cache_size": self.ocr_cache_size,
+            "blank_threshold": self.blank_threshold,
+            "snap_slices": self.snap_slices,
+            "ocr_dpi": self.ocr_dpi,
+            "ocr_grayscale": self.ocr_grayscale
+        })
+        return options
+    
+    def _image_stores(self) -> Dict[str, PageImageStore]:
+        """Get the engine's image stores, including slice images, by attribute name."""
+        stores = super()._image_stores()
+        stores["slice_images"] = self.slice_images
+        return stores
     
     def get_image_snippet(self, result_idx: int, padding: int = None) -> Dict[str, Any]:
         """
@@ -196,8 +671,28 @@ class OCRSnipRAGEngine(BaseSnipRAGEngine):
             
         # Otherwise, they match if page numbers match
         return True
+    
+    def _remove_page_images(self, document_id: str, page_numbers: List[int]):
+        """
+        Remove the stored page and slice images of some pages of a document.
         
+        Args:
+            document_id: Unique identifier for the document
+            page_numbers: Pages whose images should be removed
+        """
+        super()._remove_page_images(document_id, page_numbers)
+        for page_number in page_numbers:
+            for slice_idx in range(self.num_slices):
+                slice_key = f"{document_id}_{page_number}_slice_{slice_idx}"
+                if slice_key in self.slice_images:
+                    del self.slice_images[slice_key]
+    
     def clear_index(self):
         """Clear the index and all stored documents."""
         super().clear_index()
-        self.slice_images = {} 
\ No newline at end of file
+        self.slice_images.clear()
+    
+    def close(self):
+        """Release resources held by the engine, such as worker processes and spilled image files."""
+        super().close()
+        self.slice_images.close() 
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Query Cache - Size-bounded in-memory cache of query embeddings.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Optional
+
+import numpy as np
+
+class QueryCache:
+    """
+    Least recently used cache mapping query strings to their embeddings.
+    
+    Keys can optionally be normalized (whitespace collapsed, case folded) so that
+    trivially different spellings of the same query share an entry. The cache
+    remembers which model produced its embeddings and empties itself when a
+    different model is used.
+    """
+    
+    def __init__(self, max_items: int = 1024, normalize_keys: bool = False):
+        """
+        Initialize the query cache.
+        
+        Args:
+            max_items: Maximum number of cached embeddings; 0 disables caching
+            normalize_keys: If True, queries differing only in whitespace or case share an entry
+        """
+        self.max_items = max_items
+        self.normalize_keys = normalize_keys
+        
+        # Embeddings ordered from least to most recently used, shared by concurrent searches
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Identity of the model the cached embeddings came from
+        self._model_key = None
+        
+        # Counters for sizing the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def key(self, query: str) -> str:
+        """
+        Get the cache key of a query.
+        
+        Args:
+            query: Search query
+            
+        Returns:
+            The query itself, or its normalized form if key normalization is enabled
+        """
+        if self.normalize_keys:
+            return re.sub(r"\s+", " ", query).strip().casefold()
+        return query
+    
+    def check_model(self, model_key: Hashable):
+        """
+        Empty the cache if its embeddings were produced by a different model.
+        
+        Args:
+            model_key: Identity of the model about to be used for queries
+        """
+        with self._lock:
+            if self._model_key is not None and self._model_key != model_key:
+                self._entries.clear()
+                self.invalidations += 1
+            self._model_key = model_key
+    
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        Look up the embedding of a query, marking it as recently used.
+        
+        Args:
+            query: Search query
+            
+        Returns:
+            The cached embedding, or None if the query is not cached
+        """
+        key = self.key(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+                
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, query: str, embedding: np.ndarray):
+        """
+        Store the embedding of a query, evicting the least recently used entry if full.
+        
+        Args:
+            query: Search query
+            embedding: Embedding of the query
+        """
+        if self.max_items <= 0:
+            return
+            
+        key = self.key(query)
+        embedding = np.array(embedding, dtype='float32')
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def __contains__(self, query: object) -> bool:
+        return isinstance(query, str) and self.key(query) in self._entries
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def clear(self):
+        """Remove all cached embeddings."""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get usage counters for the cache.
+        
+        Returns:
+            Dictionary with hit/miss/eviction counters and the cache size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "items": len(self._entries),
+            "max_items": self.max_items,
+        }
@@ -2,110 +2,143 @@
 Semantic SnipRAG Engine - Uses horizontal block chunking with PyMuPDF text extraction.
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Tuple, Callable, Iterator, Union
 import fitz
-import io
-from PIL import Image
+import numpy as np
 from langchain.docstore.document import Document
 
-from .base_engine import BaseSnipRAGEngine, logger
+from .base_engine import BaseSnipRAGEngine, _open_pdf
 
-class SemanticSnipRAGEngine(BaseSnipRAGEngine):
-    """
-    SnipRAG Engine that uses horizontal blocks with semantic chunking.
-    This implementation divides pages into horizontal blocks and extracts
-    text using PyMuPDF's built-in text extraction.
+def _bucket_lines(page: fitz.Page, block_bounds: List[Tuple[float, float]]) -> List[str]:
     """
+    Extract the text of every horizontal block from a single pass over the page.
     
-    def __init__(self, num_blocks: int = 20, block_overlap: float = 0.2, **kwargs):
-        """
-        Initialize the Semantic SnipRAG Engine.
-        
-        Args:
-            num_blocks: Number of horizontal blocks per page
-            block_overlap: Overlap between blocks as a fraction (0.0-1.0)
-            **kwargs: Additional arguments to pass to the base class
-        """
-        super().__init__(**kwargs)
-        self.num_blocks = num_blocks
-        self.block_overlap = block_overlap
+    Lines are read once with get_text("dict") and assigned to every block their
+    glyph bounding box overlaps, using a vectorized interval lookup over the
+    sorted block edges.
     
-    def _extract_text_chunks(self, pdf_path: str, document_id: str) -> List[Tuple[str, Dict[str, Any]]]:
-        """
-        Extract text chunks from a PDF with metadata using horizontal block chunking.
+    Args:
+        page: PyMuPDF page to extract text from
+        block_bounds: List of (y0, y1) block edges in PDF points, sorted by y0
         
-        Args:
-            pdf_path: Path to the PDF file
-            document_id: Unique identifier for the document
+    Returns:
+        Text of each block, formatted like get_text("text") (one line per row)
+    """
+    # Accurate bounding boxes follow the glyphs rather than the font's ascender/descender,
+    # which is what clipped extraction uses to decide whether a glyph is in a region
+    page_dict = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_ACCURATE_BBOXES)
+    
+    line_texts = []
+    line_boxes = []
+    for block in page_dict["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            line_texts.append("".join(span["text"] for span in line["spans"]))
+            line_boxes.append(line["bbox"])
             
-        Returns:
-            List of tuples (text_chunk, metadata)
-        """
-        result = []
+    if not line_texts:
+        return ["" for _ in block_bounds]
         
-        # Open the PDF
-        doc = fitz.open(pdf_path)
+    line_boxes = np.array(line_boxes, dtype=np.float64)
+    block_y0 = np.array([y0 for y0, _ in block_bounds])
+    block_y1 = np.array([y1 for _, y1 in block_bounds])
+    
+    # Both block edges increase monotonically, so each line overlaps a contiguous
+    # run of blocks: from the first block ending below its top to the last block
+    # starting above its bottom
+    first_block = np.searchsorted(block_y1, line_boxes[:, 1], side="right")
+    last_block = np.searchsorted(block_y0, line_boxes[:, 3], side="left") - 1
+    
+    # Ignore lines outside the page horizontally
+    on_page = (line_boxes[:, 2] > 0) & (line_boxes[:, 0] < page.rect.width)
+    last_block[~on_page] = -1
+    
+    block_texts = []
+    for block_idx in range(len(block_bounds)):
+        in_block = np.flatnonzero((first_block <= block_idx) & (last_block >= block_idx))
+        block_texts.append("".join(line_texts[i] + "\n" for i in in_block))
+        
+    return block_texts
+
+def _extract_pages(pdf_path: str, document_id: str, page_numbers: List[int],
+                   options: Dict[str, Any]) -> Iterator[Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Dict[str, bytes]]]]:
+    """
+    Extract text chunks and page images for a range of pages using horizontal block chunking.
+    Pages are yielded one at a time; this is a module-level function so it can
+    run in a worker process.
+    
+    Args:
+        pdf_path: Path to the PDF file, or the PDF contents as bytes
+        document_id: Unique identifier for the document
+        page_numbers: Pages to process, in order
+        options: Extraction settings from SemanticSnipRAGEngine._extraction_options
         
+    Yields:
+        Tuple of (list of (text_chunk, metadata), images by store name and key) for each page
+    """
+    
+    num_blocks = options["num_blocks"]
+    block_overlap = options["block_overlap"]
+    text_splitter = options["text_splitter"]
+    
+    # Open the PDF
+    doc = _open_pdf(pdf_path)
+    
+    try:
         # Process each page
-        for page_idx in range(len(doc)):
+        for page_idx in page_numbers:
             page = doc[page_idx]
+            result = []
+            page_images = {}
             
             # Store key for this page
             page_key = f"{document_id}_{page_idx}"
             
-            # Render the page to an image at 300 DPI and store it
-            pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-            self.page_images[page_key] = img_data
-            
+            # Render the page to an image at the snippet resolution and store it
+            if options["render_pages"]:
+                scale_factor = options["snippet_dpi"] / 72
+                pix = page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor))
+                page_images[page_key] = pix.tobytes("png")
+                
             # Get page dimensions
             page_rect = page.rect
             page_width = page_rect.width
             page_height = page_rect.height
             
             # Calculate block height (1/num_blocks of page height)
-            block_height = page_height / self.num_blocks
-            overlap = block_height * self.block_overlap  # Overlap between blocks
-            
-            # Extract whole page text
-            page_text = page.get_text()
+            block_height = page_height / num_blocks
+            overlap = block_height * block_overlap  # Overlap between blocks
             
-            # Create horizontal blocks with overlap
-            for block_idx in range(self.num_blocks):
-                # Calculate block coordinates
+            # Calculate horizontal block coordinates with overlap
+            block_bounds = []
+            for block_idx in range(num_blocks):
                 y0 = block_idx * block_height - overlap if block_idx > 0 else 0
-                y1 = (block_idx + 1) * block_height if block_idx < self.num_blocks - 1 else page_height
+                y1 = (block_idx + 1) * block_height if block_idx < num_blocks - 1 else page_height
                 
                 if y0 >= page_height:
                     break
                     
-                if y1 > page_height:
-                    y1 = page_height
-                
-                # Define block rectangle
-                block_rect = fitz.Rect(0, y0, page_width, y1)
-                
-                # Extract text from this region
-                block_text = page.get_text("text", clip=block_rect)
+                block_bounds.append((y0, min(y1, page_height)))
                 
+            # Extract the text of all blocks in one pass over the page
+            block_texts = _bucket_lines(page, block_bounds)
+            
+            # Create a chunk for each non-empty block
+            for block_idx, ((y0, y1), block_text) in enumerate(zip(block_bounds, block_texts)):
                 if not block_text.strip():
                     continue
-                
-                # Coordinates in format expected by the rest of the code (x0, y0, x1, y1)
+                    
+                # Coordinates in PDF points, in format expected by the rest of the code (x0, y0, x1, y1)
                 coordinates = [0, y0, page_width, y1]
                 
-                # Scale coordinates to match the rendered image resolution
-                scale_factor = 300/72
-                scaled_coords = [c * scale_factor for c in coordinates]
-                
                 # Create metadata
                 metadata = {
                     "document_id": document_id,
                     "page_number": page_idx,
                     "source": "semantic_blocks",
                     "block_index": block_idx,
-                    "coordinates": scaled_coords
+                    "coordinates": coordinates
                 }
                 
                 # Create a document for langchain
@@ -115,13 +148,64 @@ class SemanticSnipRAGEngine(BaseSnipRAGEngine):
                 )
                 
                 # Split the text into chunks
-                chunks = self.text_splitter.split_documents([langchain_doc])
+                chunks = text_splitter.split_documents([langchain_doc])
                 
                 # Add each chunk with its metadata
                 for chunk in chunks:
                     result.append((chunk.page_content, chunk.metadata))
-        
+                    
+            yield result, {"page_images": page_images}
+            
+    finally:
         # Close the document
         doc.close()
+
+class SemanticSnipRAGEngine(BaseSnipRAGEngine):
+    """
+    SnipRAG Engine that uses horizontal blocks with semantic chunking.
+    This implementation divides pages into horizontal blocks and extracts
+    text using PyMuPDF's built-in text extraction.
+    """
+    
+    def __init__(self, num_blocks: int = 20, block_overlap: float = 0.2, 
+                 lazy_rendering: bool = False, **kwargs):
+        """
+        Initialize the Semantic SnipRAG Engine.
         
-        return result 
\ No newline at end of file
+        Args:
+            num_blocks: Number of horizontal blocks per page
+            block_overlap: Overlap between blocks as a fraction (0.0-1.0)
+            lazy_rendering: If True, pages are not rendered during ingestion; only the
+                source PDF is kept and snippet regions are rendered when first requested
+            **kwargs: Additional arguments to pass to the base class
+        """
+        super().__init__(**kwargs)
+        self.num_blocks = num_blocks
+        self.block_overlap = block_overlap
+        self.lazy_rendering = lazy_rendering
+    
+    def _prepare_document(self, pdf_path: Union[str, bytes], document_id: str):
+        """
+        Record the source PDF of a document before it is extracted.
+        
+        Args:
+            pdf_path: Path to the PDF file, or the PDF contents as bytes
+            document_id: Unique identifier for the document
+        """
+        # With lazy rendering, keep the source so snippets can be rendered on demand
+        if self.lazy_rendering:
+            self.pdf_sources[document_id] = pdf_path
+    
+    def _page_extractor(self) -> Callable:
+        """Get the function that extracts chunks from a range of pages."""
+        return _extract_pages
+    
+    def _extraction_options(self) -> Dict[str, Any]:
+        """Get the picklable settings passed to the page extractor."""
+        options = super()._extraction_options()
+        options.update({
+            "num_blocks": self.num_blocks,
+            "block_overlap": self.block_overlap,
+            "render_pages": not self.lazy_rendering
+        })
+        return options
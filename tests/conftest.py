@@ -0,0 +1,61 @@
+"""
+Shared fixtures for the SnipRAG tests.
+"""
+
+import os
+import sys
+import tempfile
+import pytest
+import fitz  # PyMuPDF
+
+# Add the parent directory to the path so we can import the package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture
+def sample_pdf():
+    """Create a sample PDF file for testing."""
+    # Create a temporary PDF file
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+        temp_path = tmp.name
+    
+    # Create a new PDF with PyMuPDF
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)  # Letter size
+    
+    # Position the text blocks
+    page.insert_text((72, 72), "This is a sample invoice for SnipRAG testing.", fontsize=11)
+    page.insert_text((72, 144), "The invoice total amount is $1,234.56.", fontsize=11)
+    page.insert_text((72, 216), "This document was created on January 15, 2023.", fontsize=11)
+    page.insert_text((72, 288), "Please make payment by February 15, 2023.", fontsize=11)
+    
+    # Save the PDF
+    doc.save(temp_path)
+    doc.close()
+    
+    yield temp_path
+    
+    # Clean up
+    if os.path.exists(temp_path):
+        os.unlink(temp_path)
+
+
+@pytest.fixture
+def multi_page_pdf():
+    """Create a multi-page PDF file for testing."""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+        temp_path = tmp.name
+    
+    doc = fitz.open()
+    for page_idx in range(5):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 72), f"Quarterly report, section {page_idx + 1}.", fontsize=11)
+        page.insert_text((72, 144), f"Revenue for region {page_idx} grew by {page_idx * 3}%.", fontsize=11)
+        page.insert_text((72, 400), f"Footnote {page_idx}: figures are unaudited.", fontsize=11)
+    doc.save(temp_path)
+    doc.close()
+    
+    yield temp_path
+    
+    if os.path.exists(temp_path):
+        os.unlink(temp_path)
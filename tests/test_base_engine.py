@@ -0,0 +1,682 @@
+"""
+Tests for functionality shared by all SnipRAG engines.
+"""
+
+import os
+import json
+import threading
+import pytest
+import numpy as np
+import faiss
+import fitz  # PyMuPDF
+
+from sniprag.core import SemanticSnipRAGEngine
+from sniprag.core import base_engine
+
+class TestBaseSnipRAGEngine:
+    """Tests for the common engine functionality."""
+    
+    def test_process_pdfs(self, sample_pdf, multi_page_pdf):
+        """Test batch ingestion returns per-document results and indexes everything."""
+        engine = SemanticSnipRAGEngine()
+        results = engine.process_pdfs([
+            (sample_pdf, "invoice"),
+            ("/nonexistent/file.pdf", "missing"),
+            (multi_page_pdf, "report"),
+        ], index_batch_size=4)
+        
+        assert [r["document_id"] for r in results] == ["invoice", "missing", "report"]
+        assert [r["success"] for r in results] == [True, False, True]
+        assert results[1]["error"]
+        assert results[0]["num_chunks"] + results[2]["num_chunks"] == len(engine.documents)
+        assert engine.index.ntotal == len(engine.documents)
+        
+        # Batch ingestion produces the same chunks as processing one document at a time
+        serial = SemanticSnipRAGEngine()
+        serial.process_pdf(sample_pdf, "invoice")
+        serial.process_pdf(multi_page_pdf, "report")
+        assert engine.documents == serial.documents
+        assert engine.document_metadata == serial.document_metadata
+    
+    def test_streaming_ingestion(self, multi_page_pdf):
+        """Test that streaming ingestion indexes the same chunks in bounded micro-batches."""
+        engine = SemanticSnipRAGEngine(stream_batch_size=2)
+        batch_sizes = []
+        add_chunks = engine._add_chunks_to_index
+        
+        def record_batch(chunks_with_metadata):
+            batch_sizes.append(len(chunks_with_metadata))
+            add_chunks(chunks_with_metadata)
+        
+        engine._add_chunks_to_index = record_batch
+        assert engine.process_pdf(multi_page_pdf, "report")
+        
+        assert max(batch_sizes) <= 2
+        assert len(batch_sizes) > 1
+        
+        full = SemanticSnipRAGEngine()
+        full.process_pdf(multi_page_pdf, "report")
+        assert engine.documents == full.documents
+        assert engine.document_metadata == full.document_metadata
+        assert engine.index.ntotal == full.index.ntotal
+    
+    def test_process_pdfs_streaming(self, sample_pdf, multi_page_pdf):
+        """Test that batch ingestion streams documents in micro-batches when stream_batch_size is set."""
+        engine = SemanticSnipRAGEngine(stream_batch_size=2)
+        batch_sizes = []
+        add_chunks = engine._add_chunks_to_index
+        
+        def record_batch(chunks_with_metadata):
+            batch_sizes.append(len(chunks_with_metadata))
+            add_chunks(chunks_with_metadata)
+            
+        engine._add_chunks_to_index = record_batch
+        results = engine.process_pdfs([
+            (sample_pdf, "invoice"),
+            ("/nonexistent/file.pdf", "missing"),
+            (multi_page_pdf, "report"),
+        ], index_batch_size=1024)
+        
+        assert [r["success"] for r in results] == [True, False, True]
+        assert max(batch_sizes) <= 2
+        assert results[0]["num_chunks"] + results[2]["num_chunks"] == len(engine.documents)
+        assert engine.process_pdfs([(multi_page_pdf, "report")])[0]["skipped"]
+        
+        serial = SemanticSnipRAGEngine()
+        serial.process_pdf(sample_pdf, "invoice")
+        serial.process_pdf(multi_page_pdf, "report")
+        assert engine.documents == serial.documents
+        assert engine.document_metadata == serial.document_metadata
+    
+    def test_streaming_retry_after_failure(self, multi_page_pdf):
+        """Test that a streaming run that fails partway leaves nothing behind for the retry to duplicate."""
+        engine = SemanticSnipRAGEngine(stream_batch_size=2)
+        add_chunks = engine._add_chunks_to_index
+        calls = []
+        
+        def fail_third_batch(chunks_with_metadata):
+            calls.append(len(chunks_with_metadata))
+            if len(calls) == 3:
+                raise RuntimeError("embedding failed")
+            add_chunks(chunks_with_metadata)
+            
+        engine._add_chunks_to_index = fail_third_batch
+        assert not engine.process_pdf(multi_page_pdf, "report")
+        assert len(engine.documents) == engine.index.ntotal == 0
+        assert not engine.page_images
+        
+        engine._add_chunks_to_index = add_chunks
+        assert engine.process_pdf(multi_page_pdf, "report")
+        full = SemanticSnipRAGEngine()
+        full.process_pdf(multi_page_pdf, "report")
+        assert engine.documents == full.documents
+        assert engine.index.ntotal == full.index.ntotal
+    
+    def test_incremental_updates(self, multi_page_pdf, tmp_path):
+        """Test that re-processing a document only re-indexes the pages that changed."""
+        engine = SemanticSnipRAGEngine()
+        assert engine.process_pdf(multi_page_pdf, "report")
+        num_rows = engine.index.ntotal
+        
+        # An unchanged document is skipped entirely
+        assert engine.process_pdf(multi_page_pdf, "report")
+        assert engine.index.ntotal == num_rows
+        assert engine.process_pdfs([(multi_page_pdf, "report")])[0]["skipped"]
+        
+        # Edit one page and drop the last one
+        doc = fitz.open(multi_page_pdf)
+        doc[1].insert_text((72, 600), "Revised after the audit.", fontsize=11)
+        doc.delete_page(4)
+        updated_pdf = str(tmp_path / "updated.pdf")
+        doc.save(updated_pdf)
+        doc.close()
+        
+        added = []
+        add_chunks = engine._add_chunks_to_index
+        
+        def record_chunks(chunks_with_metadata):
+            added.extend(chunks_with_metadata)
+            add_chunks(chunks_with_metadata)
+        
+        engine._add_chunks_to_index = record_chunks
+        assert engine.process_pdf(updated_pdf, "report")
+        assert {metadata["page_number"] for _, metadata in added} == {1}
+        
+        # The index matches a fresh ingestion of the updated document
+        fresh = SemanticSnipRAGEngine()
+        fresh.process_pdf(updated_pdf, "report")
+        key = lambda row: (row[1]["page_number"], row[1]["block_index"], row[0])
+        assert sorted(zip(engine.documents, engine.document_metadata), key=key) == \
+            sorted(zip(fresh.documents, fresh.document_metadata), key=key)
+        assert engine.index.ntotal == len(engine.documents)
+        assert "report_4" not in engine.page_images
+    
+    def test_batch_with_repeated_document(self, sample_pdf, multi_page_pdf):
+        """Test that a document repeated within one batch is indexed once, as with serial processing."""
+        serial = SemanticSnipRAGEngine()
+        serial.process_pdf(sample_pdf, "doc")
+        serial.process_pdf(multi_page_pdf, "doc")
+        
+        engine = SemanticSnipRAGEngine()
+        results = engine.process_pdfs([(sample_pdf, "doc"), (multi_page_pdf, "doc")], prefetch=4)
+        assert all(r["success"] for r in results)
+        assert engine.index.ntotal == len(engine.documents) == len(serial.documents)
+        assert engine.documents == serial.documents
+        
+        # The same file twice is skipped the second time
+        engine = SemanticSnipRAGEngine()
+        results = engine.process_pdfs([(sample_pdf, "doc"), (multi_page_pdf, "other"), (sample_pdf, "doc")])
+        assert [r["skipped"] for r in results] == [False, False, True]
+        assert engine.index.ntotal == len(engine.documents)
+        assert len(engine._document_chunks["doc"]) == results[0]["num_chunks"]
+    
+    def test_remove_and_replace_document(self, sample_pdf, multi_page_pdf):
+        """Test that documents can be removed and replaced without rebuilding the index."""
+        engine = SemanticSnipRAGEngine()
+        engine.process_pdf(sample_pdf, "invoice")
+        engine.process_pdf(multi_page_pdf, "report")
+        invoice_ids = set(engine._document_chunks["invoice"])
+        
+        assert engine.remove_document("report")
+        assert not engine.remove_document("report")
+        assert engine.index.ntotal == len(engine.documents) == len(engine.chunk_ids)
+        assert {m["document_id"] for m in engine.document_metadata} == {"invoice"}
+        assert not [key for key in engine.page_images if key.startswith("report_")]
+        
+        # Remaining chunks keep their IDs, and search maps IDs back to rows
+        assert set(engine.chunk_ids) == invoice_ids
+        results = engine.search("invoice total", top_k=2)
+        assert results[0]["chunk_id"] in invoice_ids
+        assert results[0]["metadata"]["document_id"] == "invoice"
+        assert "image_data" in engine.search_with_snippets("invoice total", top_k=1)[0]
+        
+        assert engine.replace_document(multi_page_pdf, "invoice")
+        assert {m["document_id"] for m in engine.document_metadata} == {"invoice"}
+        assert not set(engine.chunk_ids) & invoice_ids
+        assert engine.index.ntotal == len(engine.documents)
+    
+    def test_embedding_cache(self, multi_page_pdf, tmp_path):
+        """Test that re-indexing unchanged chunks reuses cached embeddings."""
+        cache_dir = str(tmp_path / "embeddings")
+        first = SemanticSnipRAGEngine(embedding_cache_dir=cache_dir)
+        first.process_pdf(multi_page_pdf, "report")
+        first.close()
+        
+        second = SemanticSnipRAGEngine(embedding_cache_dir=cache_dir)
+        encoded = []
+        encode = second.embedding_model.encode
+        
+        def record_encode(texts, *args, **kwargs):
+            encoded.extend(texts)
+            return encode(texts, *args, **kwargs)
+        
+        second.embedding_model.encode = record_encode
+        second.process_pdf(multi_page_pdf, "report")
+        
+        assert encoded == []
+        assert second.embedding_cache.stats()["hit_rate"] == 1.0
+        
+        # Cached embeddings are identical to freshly computed ones
+        fresh = SemanticSnipRAGEngine()
+        fresh.process_pdf(multi_page_pdf, "report")
+        assert (second.index.reconstruct_n(0, second.index.ntotal) == 
+                fresh.index.reconstruct_n(0, fresh.index.ntotal)).all()
+        second.close()
+    
+    def test_duplicate_texts_are_encoded_once(self, sample_pdf):
+        """Test that identical chunk texts in a batch are only encoded once."""
+        engine = SemanticSnipRAGEngine()
+        encoded = []
+        encode = engine.embedding_model.encode
+        
+        def record_encode(texts, *args, **kwargs):
+            encoded.extend(texts)
+            return encode(texts, *args, **kwargs)
+        
+        engine.embedding_model.encode = record_encode
+        engine.process_pdfs([(sample_pdf, "invoice"), (sample_pdf, "copy")])
+        
+        # Both copies, and the overlapping blocks within each, produce repeated texts
+        assert len(encoded) == len(set(engine.documents)) < len(engine.documents)
+        assert engine.index.ntotal == len(engine.documents)
+    
+    def test_shared_duplicate_vectors(self, sample_pdf):
+        """Test that chunks with identical text can share one vector in the index."""
+        engine = SemanticSnipRAGEngine(share_duplicate_vectors=True)
+        engine.process_pdf(sample_pdf, "invoice")
+        engine.process_pdf(sample_pdf, "copy")
+        
+        assert engine.index.ntotal == len(set(engine.documents)) < len(engine.documents)
+        results = engine.search("invoice total", top_k=2)
+        assert {r["metadata"]["document_id"] for r in results} == {"invoice", "copy"}
+        assert results[0]["text"] == results[1]["text"]
+        
+        # A shared vector is kept until its last chunk is removed
+        engine.remove_document("invoice")
+        assert engine.index.ntotal == len(set(engine.documents))
+        assert engine.search("invoice total", top_k=1)[0]["metadata"]["document_id"] == "copy"
+        engine.remove_document("copy")
+        assert engine.index.ntotal == 0
+    
+    def test_filters_on_shared_vectors(self, tmp_path):
+        """Test that filters on several fields find chunks whose vector is shared with other chunks."""
+        paths = {}
+        for document_id, pages in {"x": ["Opening remarks.", "Shared closing text."],
+                                   "y": ["Shared closing text.", "Appendix with tables."]}.items():
+            doc = fitz.open()
+            for text in pages:
+                doc.new_page(width=612, height=792).insert_text((72, 72), text, fontsize=11)
+            paths[document_id] = str(tmp_path / f"{document_id}.pdf")
+            doc.save(paths[document_id])
+            doc.close()
+            
+        engine = SemanticSnipRAGEngine(share_duplicate_vectors=True)
+        engine.process_pdf(paths["x"], "x")
+        engine.process_pdf(paths["y"], "y")
+        assert engine.index.ntotal < len(engine.documents)
+        
+        # The shared vector passes each field through a different chunk, but no chunk on it passes both
+        filters = {"document_id": "y", "page_number": 1}
+        assert not engine.filter_index.select(filters)[1]
+        results = engine.search("Shared closing text.", top_k=1, filter_metadata=filters)
+        assert [r["text"] for r in results] == ["Appendix with tables."]
+    
+    def test_length_bucketed_encoding(self, multi_page_pdf):
+        """Test that chunks are encoded in bounded, length-sorted batches."""
+        engine = SemanticSnipRAGEngine(encode_batch_size=4, normalize_embeddings=True)
+        batches = []
+        encode = engine.embedding_model.encode
+        
+        def record_encode(texts, *args, **kwargs):
+            batches.append(list(texts))
+            return encode(texts, *args, **kwargs)
+        
+        engine.embedding_model.encode = record_encode
+        engine.process_pdf(multi_page_pdf, "report")
+        
+        assert max(len(batch) for batch in batches) <= 4
+        lengths = [len(text) for batch in batches for text in batch]
+        assert lengths == sorted(lengths)
+        
+        vectors = engine.index.reconstruct_n(0, engine.index.ntotal)
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+        
+        # Batched search returns the same results as searching one query at a time
+        queries = ["quarterly report", "revenue growth", "unaudited figures"]
+        assert engine.search_batch(queries, top_k=3) == [engine.search(q, top_k=3) for q in queries]
+    
+    def test_embedding_process_pool(self, multi_page_pdf):
+        """Test that the multi-process embedding pool gives the single-process vectors."""
+        single = SemanticSnipRAGEngine(encode_batch_size=2, normalize_embeddings=True)
+        pooled = SemanticSnipRAGEngine(encode_batch_size=2, normalize_embeddings=True, 
+                                       embedding_processes=2)
+        single.process_pdf(multi_page_pdf, "report")
+        pooled.process_pdf(multi_page_pdf, "report")
+        
+        # The pool is started once and kept for later documents
+        pool = pooled._embedding_pool
+        assert pool is not None
+        pooled.process_pdf(multi_page_pdf, "copy")
+        assert pooled._embedding_pool is pool
+        
+        assert pooled.documents[:len(single.documents)] == single.documents
+        assert np.allclose(pooled.index.reconstruct_n(0, single.index.ntotal),
+                           single.index.reconstruct_n(0, single.index.ntotal), atol=1e-6)
+        
+        pooled.close()
+        assert pooled._embedding_pool is None
+    
+    def test_embedding_pool_uses_encode(self, multi_page_pdf):
+        """Test that models whose encode() takes a pool are not sent to encode_multi_process."""
+        engine = SemanticSnipRAGEngine(encode_batch_size=2, embedding_processes=2)
+        model = engine.embedding_model
+        pools = []
+        encode = model.encode
+        
+        def pooled_encode(texts, batch_size=32, convert_to_numpy=True, pool=None, chunk_size=None):
+            pools.append(pool)
+            return encode(texts, batch_size=batch_size, convert_to_numpy=convert_to_numpy)
+        
+        def deprecated(*args, **kwargs):
+            raise AssertionError("encode_multi_process is deprecated")
+            
+        model.encode = pooled_encode
+        model.encode_multi_process = deprecated
+        engine.process_pdf(multi_page_pdf, "report")
+        assert engine._embedding_pool is not None
+        assert engine._embedding_pool in pools
+        engine.close()
+    
+    @pytest.mark.parametrize("backend", ["onnx", "int8"])
+    def test_embedding_backend_parity(self, backend):
+        """Test that alternative embedding backends agree with the PyTorch model."""
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("optimum")
+        try:
+            reference = SemanticSnipRAGEngine()
+            engine = SemanticSnipRAGEngine(embedding_backend=backend)
+        except OSError as e:
+            pytest.skip(f"Embedding model unavailable: {e}")
+            
+        texts = ["The invoice total amount is $1,234.56.",
+                 "Please make payment by February 15, 2023.",
+                 "Quarterly report, section 3."]
+        expected = reference._encode_texts(texts)
+        actual = engine._encode_texts(texts)
+        cosine = (expected * actual).sum(axis=1) / (
+            np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+        assert cosine.min() > 0.99
+    
+    def test_int8_export_is_reused(self, monkeypatch, tmp_path):
+        """Test that the int8 backend quantizes an ONNX export once and loads it afterwards."""
+        import sentence_transformers
+        monkeypatch.setattr(base_engine, "_INT8_MODEL_DIR", str(tmp_path))
+        loaded, exported = [], []
+        
+        class FakeModel:
+            def __init__(self, model_name, **kwargs):
+                loaded.append((model_name, kwargs))
+            
+            def save(self, path):
+                os.makedirs(path)
+        
+        def export(model, config, model_dir):
+            exported.append(config)
+            os.makedirs(os.path.join(model_dir, "onnx"))
+            open(os.path.join(model_dir, "onnx", f"model_qint8_{config}.onnx"), "wb").close()
+            
+        monkeypatch.setattr(base_engine, "SentenceTransformer", FakeModel)
+        monkeypatch.setattr(sentence_transformers, "export_dynamic_quantized_onnx_model", export, raising=False)
+        engine = SemanticSnipRAGEngine.__new__(SemanticSnipRAGEngine)
+        for _ in range(2):
+            engine._load_embedding_model("org/model", "int8")
+            
+        model_dir = str(tmp_path / "org--model")
+        file_name = f"onnx/model_qint8_{exported[0]}.onnx"
+        assert len(exported) == 1
+        assert loaded == [("org/model", {"backend": "onnx", "device": "cpu"})] + \
+            [(model_dir, {"backend": "onnx", "device": "cpu", "model_kwargs": {"file_name": file_name}})] * 2
+    
+    def test_invalid_embedding_backend(self):
+        """Test that an unknown embedding backend is rejected."""
+        with pytest.raises(ValueError):
+            SemanticSnipRAGEngine(embedding_backend="tpu")
+    
+    def test_query_embedding_cache(self, sample_pdf):
+        """Test that repeated queries reuse cached embeddings with identical results."""
+        engine = SemanticSnipRAGEngine(normalize_query_keys=True)
+        engine.process_pdf(sample_pdf, "invoice")
+        
+        encoded = []
+        encode_into = engine._encode_into
+        
+        def record_encode(texts, out):
+            encoded.extend(texts)
+            encode_into(texts, out)
+            
+        engine._encode_into = record_encode
+        first = engine.search("invoice total", top_k=3)
+        assert engine.search("Invoice   TOTAL ", top_k=3) == first
+        assert engine.search_batch(["invoice total", "payment due", "payment due"], top_k=3)[0] == first
+        assert encoded == ["invoice total", "payment due"]
+        assert engine.query_cache.stats()["hits"] == 2
+        
+        # Swapping the embedding model invalidates cached query embeddings
+        engine.embedding_model = type(engine.embedding_model)(engine.embedding_model_name)
+        engine.search("invoice total", top_k=3)
+        assert encoded[-1] == "invoice total"
+        assert engine.query_cache.stats()["invalidations"] == 1
+    
+    @pytest.mark.parametrize("index_type,factory,needs_training", [
+        ("flat", "Flat", False),
+        ("ivf", "IVF1024,Flat", True),
+        ("hnsw", "HNSW32", False),
+        ("ivfpq", "IVF1024,PQ", True),
+    ])
+    def test_index_types(self, index_type, factory, needs_training):
+        """Test that named index types map to FAISS factory strings and train when needed."""
+        engine = SemanticSnipRAGEngine(index_type=index_type)
+        assert engine.index_factory.startswith(factory)
+        assert engine._index_training == needs_training
+        assert engine.index.is_trained
+        if index_type == "ivfpq":
+            assert engine.embedding_dim % int(engine.index_factory.rsplit("PQ", 1)[1]) == 0
+    
+    def test_invalid_index_type(self):
+        """Test that an unknown index type is rejected."""
+        with pytest.raises(ValueError):
+            SemanticSnipRAGEngine(index_type="annoy")
+    
+    def test_index_training_buffer(self, sample_pdf, multi_page_pdf):
+        """Test that an IVF index buffers vectors in a flat index until it can be trained."""
+        exact = SemanticSnipRAGEngine()
+        exact.process_pdf(sample_pdf, "invoice")
+        exact.process_pdf(multi_page_pdf, "report")
+        chunks = list(zip(exact.documents, exact.document_metadata))
+        
+        engine = SemanticSnipRAGEngine(index_factory="IVF2,Flat", index_training_size=len(chunks))
+        assert engine._index_training
+        
+        # Below the training size, vectors are held in an exact flat index
+        engine._add_chunks_to_index(chunks[:-1])
+        assert engine._index_training
+        assert engine.index.ntotal == len(chunks) - 1
+        assert len(engine.search("quarterly revenue", top_k=2)) == 2
+        
+        # Reaching it trains the IVF index and moves every vector into it
+        engine._add_chunks_to_index(chunks[-1:])
+        assert not engine._index_training
+        assert isinstance(faiss.downcast_index(engine.index), faiss.IndexIVFFlat)
+        assert engine.index.ntotal == len(chunks)
+        
+        # Visiting every list gives exact results, also after removing a document
+        query = exact.documents[-1]
+        assert engine.search(query, top_k=3, nprobe=2) == exact.search(query, top_k=3)
+        engine.remove_document("invoice")
+        exact.remove_document("invoice")
+        assert engine.index.ntotal == exact.index.ntotal
+        assert engine.search(query, top_k=3, nprobe=2) == exact.search(query, top_k=3)
+    
+    def test_index_training_failures(self, sample_pdf):
+        """Test that too small training sizes are rejected and failed training keeps chunks searchable."""
+        with pytest.raises(ValueError):
+            SemanticSnipRAGEngine(index_type="ivf", index_training_size=4)
+        with pytest.raises(ValueError):
+            SemanticSnipRAGEngine(index_factory="IVF2,PQ4", index_training_size=100)
+        
+        class FailingIndex:
+            def train(self, vectors):
+                raise RuntimeError("training failed")
+                
+        engine = SemanticSnipRAGEngine(index_factory="IVF2,Flat", index_training_size=2)
+        create_index = engine._create_index
+        engine._create_index = lambda index_factory=None: FailingIndex()
+        assert engine.process_pdf(sample_pdf, "invoice")
+        assert engine._index_training
+        assert engine.index.ntotal == len(engine.documents) > 0
+        assert engine.search("invoice total", top_k=1)
+        
+        # Training is retried with the next chunks
+        engine._create_index = create_index
+        engine._add_chunks_to_index([("Payment terms are net 30 days.", {"document_id": "terms"})])
+        assert not engine._index_training
+        assert engine.index.ntotal == len(engine.documents)
+    
+    def test_hnsw_removal_and_ef_search(self, sample_pdf, multi_page_pdf):
+        """Test that chunks removed from an HNSW index are excluded from searches."""
+        engine = SemanticSnipRAGEngine(index_type="hnsw")
+        engine.process_pdf(sample_pdf, "invoice")
+        engine.process_pdf(multi_page_pdf, "report")
+        assert not engine._index_training
+        
+        engine.remove_document("invoice")
+        results = engine.search("invoice total amount", top_k=10, ef_search=64)
+        assert results
+        assert all(r["metadata"]["document_id"] == "report" for r in results)
+    
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+    @pytest.mark.parametrize("exact_scan_limit", [10_000, 0])
+    def test_filtered_search_prefilters_in_index(self, sample_pdf, multi_page_pdf, monkeypatch,
+                                                 index_type, exact_scan_limit):
+        """Test that filters on indexed fields restrict the search inside FAISS and return exactly top_k."""
+        # A limit of 0 sends every filtered search through a FAISS selector
+        monkeypatch.setattr(base_engine, "_EXACT_SCAN_LIMIT", exact_scan_limit)
+        options = {"index_type": index_type}
+        if index_type == "ivf":
+            options = {"index_factory": "IVF2,Flat", "index_training_size": 8}
+            
+        engine = SemanticSnipRAGEngine(**options)
+        engine.process_pdf(multi_page_pdf, "report")
+        engine.process_pdf(sample_pdf, "invoice")
+        assert not engine._index_training
+        
+        alone = SemanticSnipRAGEngine()
+        alone.process_pdf(sample_pdf, "invoice")
+        top_k = len(alone.documents)
+        
+        # A selective filter still fills every requested result
+        query = engine.documents[0]
+        for results in (engine.search(query, top_k=top_k, filter_metadata={"document_id": "invoice"}),
+                        engine.search_with_snippets(query, top_k=top_k, filter_metadata={"document_id": "invoice"},
+                                                    include_snippets=False)):
+            expected = alone.search(query, top_k=top_k)
+            assert len(results) == top_k
+            assert [(r["text"], r["metadata"], r["score"]) for r in results] == \
+                   [(r["text"], r["metadata"], r["score"]) for r in expected]
+                   
+        # Filters on several indexed fields are intersected
+        page = engine.document_metadata[-1]["page_number"]
+        filters = {"document_id": "report", "page_number": page, "source": "semantic_blocks"}
+        results = engine.search(query, top_k=50, filter_metadata=filters)
+        matching = [m for m in engine.document_metadata if m["document_id"] == "report" and m["page_number"] == page]
+        assert len(results) == len(matching)
+        assert engine.search(query, top_k=5, filter_metadata={"document_id": "missing"}) == []
+        
+        # Filters on other fields are still applied after the search
+        block = engine.document_metadata[0]["block_index"]
+        results = engine.search(query, top_k=50, filter_metadata={"document_id": "report", "block_index": block})
+        assert results
+        assert all(r["metadata"]["document_id"] == "report" and r["metadata"]["block_index"] == block
+                   for r in results)
+                   
+        # The filter index follows removals
+        engine.remove_document("invoice")
+        assert engine.search(query, top_k=5, filter_metadata={"document_id": "invoice"}) == []
+        for page_number in {m["page_number"] for m in alone.document_metadata}:
+            selection, exact = engine.filter_index.select({"page_number": page_number})
+            expected = sorted(c for c, m in zip(engine.chunk_ids, engine.document_metadata)
+                              if m["page_number"] == page_number)
+            ids = selection.ids if selection.ids is not None else \
+                np.flatnonzero(np.unpackbits(selection.bitmap, bitorder="little"))
+            assert exact and ids.tolist() == expected
+    
+    def test_background_index_migration(self, sample_pdf, multi_page_pdf):
+        """Test that the index migrates to IVF in the background once a threshold is crossed."""
+        exact = SemanticSnipRAGEngine()
+        exact.process_pdf(sample_pdf, "invoice")
+        exact.process_pdf(multi_page_pdf, "report")
+        chunks = list(zip(exact.documents, exact.document_metadata))
+        
+        engine = SemanticSnipRAGEngine(index_migrations={len(chunks) // 2: "IVF2,Flat"})
+        
+        # Hold the rebuild until changes have been made to the serving index
+        release = threading.Event()
+        create_index = engine._create_index
+        
+        def slow_create_index(index_factory=None):
+            release.wait()
+            return create_index(index_factory)
+            
+        # The snapshot vectors are read in the background, without holding the index lock
+        snapshot_reads = []
+        index_vectors = engine._index_vectors
+        
+        def record_index_vectors(index, deleted_vectors):
+            snapshot_reads.append((threading.current_thread() is threading.main_thread(),
+                                   engine._index_lock.locked()))
+            return index_vectors(index, deleted_vectors)
+            
+        engine._create_index = slow_create_index
+        engine._index_vectors = record_index_vectors
+        engine._add_chunks_to_index(chunks[:len(chunks) // 2])
+        assert engine._migration_thread is not None
+        
+        # The flat index keeps serving and changing while the new index is built
+        engine._add_chunks_to_index(chunks[len(chunks) // 2:])
+        engine.remove_document("invoice")
+        exact.remove_document("invoice")
+        query = exact.documents[-1]
+        assert engine.search(query, top_k=3) == exact.search(query, top_k=3)
+        assert engine.active_index_factory == "Flat"
+        
+        # Once built, the new index has replayed those changes and is swapped in
+        release.set()
+        assert engine.wait_for_index_migration(timeout=30)
+        assert snapshot_reads == [(False, False)]
+        assert engine.active_index_factory == "IVF2,Flat"
+        assert isinstance(faiss.downcast_index(engine.index), faiss.IndexIVFFlat)
+        assert engine.index.ntotal == exact.index.ntotal
+        assert engine.search(query, top_k=3, nprobe=2) == exact.search(query, top_k=3)
+    
+    @pytest.mark.parametrize("mmap", [True, False])
+    def test_save_and_load(self, sample_pdf, multi_page_pdf, tmp_path, mmap):
+        """Test that a saved engine is restored with identical search results and snippets."""
+        engine = SemanticSnipRAGEngine(share_duplicate_vectors=True, lazy_rendering=True)
+        engine.process_pdf(sample_pdf, "invoice")
+        with open(multi_page_pdf, "rb") as f:
+            engine.process_pdf(f.read(), "report")
+        engine.save(str(tmp_path / "saved"))
+        
+        restored = SemanticSnipRAGEngine(share_duplicate_vectors=True, lazy_rendering=True)
+        restored.load(str(tmp_path / "saved"), mmap=mmap)
+        assert restored._mapped_index == mmap
+        assert restored.documents == engine.documents
+        assert restored.pdf_sources == engine.pdf_sources
+        assert restored.document_hashes == engine.document_hashes
+        
+        query = engine.documents[0]
+        assert restored.search(query, top_k=5) == engine.search(query, top_k=5)
+        assert restored.search_with_snippets(query, top_k=2) == engine.search_with_snippets(query, top_k=2)
+        
+        # The restored engine can be changed without touching the save
+        assert restored.process_pdf(multi_page_pdf, "invoice_copy")
+        restored.remove_document("report")
+        assert not restored._mapped_index
+        assert "report" not in {r["metadata"]["document_id"] for r in restored.search(query, top_k=10)}
+        
+        reloaded = SemanticSnipRAGEngine(share_duplicate_vectors=True, lazy_rendering=True)
+        reloaded.load(str(tmp_path / "saved"), mmap=mmap)
+        assert reloaded.index.ntotal == engine.index.ntotal
+        assert reloaded.search(query, top_k=5) == engine.search(query, top_k=5)
+    
+    def test_save_and_load_ivf_index(self, sample_pdf, multi_page_pdf, tmp_path):
+        """Test that a memory-mapped IVF index is restored and copied into memory when changed."""
+        engine = SemanticSnipRAGEngine(index_factory="IVF2,Flat", index_training_size=2)
+        engine.process_pdf(sample_pdf, "invoice")
+        engine.save(str(tmp_path / "saved"))
+        
+        restored = SemanticSnipRAGEngine(index_factory="IVF2,Flat", index_training_size=2)
+        restored.load(str(tmp_path / "saved"))
+        query = engine.documents[0]
+        assert restored.search(query, top_k=3, nprobe=2) == engine.search(query, top_k=3, nprobe=2)
+        
+        restored.process_pdf(multi_page_pdf, "report")
+        restored.remove_document("invoice")
+        assert restored.index.ntotal == len(restored.documents)
+        assert {r["metadata"]["document_id"] for r in restored.search(query, top_k=3, nprobe=2)} == {"report"}
+    
+    def test_load_rejects_incompatible_saves(self, sample_pdf, tmp_path):
+        """Test that saves from another format version or embedding model are rejected."""
+        engine = SemanticSnipRAGEngine()
+        engine.process_pdf(sample_pdf, "invoice")
+        engine.save(str(tmp_path / "saved"))
+        
+        with pytest.raises(ValueError):
+            SemanticSnipRAGEngine(normalize_embeddings=True).load(str(tmp_path / "saved"))
+            
+        manifest_path = tmp_path / "saved" / "manifest.json"
+        manifest = json.loads(manifest_path.read_text())
+        manifest["format_version"] = 0
+        manifest_path.write_text(json.dumps(manifest))
+        with pytest.raises(ValueError):
+            SemanticSnipRAGEngine().load(str(tmp_path / "saved"))
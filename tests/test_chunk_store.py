@@ -0,0 +1,107 @@
+"""
+Tests for the columnar chunk store.
+"""
+
+from sniprag.core import ChunkStore
+
+def make_metadata(document_id, page, block):
+    return {
+        "document_id": document_id,
+        "page_number": page,
+        "source": "semantic_blocks",
+        "block_index": block,
+        "coordinates": [0, 10.5 * block, 612, 10.5 * (block + 1)],
+    }
+
+class TestChunkStore:
+    """Tests for ChunkStore."""
+    
+    def test_rows_round_trip(self):
+        """Test that texts and metadata are materialized as they were added."""
+        store = ChunkStore()
+        metadatas = [make_metadata(f"doc_{i % 2}", i // 4, i % 4) for i in range(10)]
+        metadatas[3]["tags"] = ["unhashable"]
+        metadatas[4]["page_number"] = "cover"
+        del metadatas[5]["coordinates"]
+        texts = [f"chunk {i} é中" for i in range(10)]
+        store.append_many(list(range(100, 110)), texts, metadatas)
+        
+        assert len(store) == 10
+        assert list(store.texts) == texts
+        assert store.metadata == metadatas
+        assert store.coordinates[5] == [0, 0, 0, 0]
+        assert store.chunk_ids[-1] == 109
+        assert store.value(4, "page_number") == "cover"
+        
+        # Coordinates read back exactly, not rounded to single precision
+        store.append_many([110], ["text"], [{"coordinates": [0.1, 33.68, 612.0, 79.2]}])
+        assert store.coordinates[10] == [0.1, 33.68, 612.0, 79.2]
+        
+        # Document IDs are interned, integers and coordinates stored in NumPy columns
+        stats = store.stats()
+        assert stats["interned_values"]["document_id"] == 2
+        assert "page_number" in store._int_columns
+        assert store._coordinates.dtype.name == "float64"
+    
+    def test_swap_remove_and_compaction(self):
+        """Test that removed rows are replaced by the last row and their text is reclaimed."""
+        store = ChunkStore()
+        metadatas = [make_metadata("doc", 0, i) for i in range(6)]
+        store.append_many(list(range(6)), [f"text {i}" for i in range(6)], metadatas)
+        
+        assert store.swap_remove(1) == 5
+        assert store.swap_remove(4) is None
+        assert list(store.chunk_ids) == [0, 5, 2, 3]
+        assert list(store.texts) == ["text 0", "text 5", "text 2", "text 3"]
+        assert store.metadata[1] == metadatas[5]
+        
+        for row in (3, 2, 1):
+            store.swap_remove(row)
+        assert store.stats()["text_bytes"] <= len("text 0") * 2
+        
+        # Freed rows are reused cleanly
+        store.append_many([7], ["text 7"], [{"document_id": "other"}])
+        assert store.metadata[1] == {"document_id": "other"}
+    
+    def test_released_values(self, tmp_path):
+        """Test that interned values no row uses are released, reused and not saved."""
+        store = ChunkStore()
+        for i in range(5):
+            metadatas = [make_metadata(f"doc_{i}", 0, block) for block in range(3)]
+            metadatas[0]["tags"] = ["unhashable"]
+            store.append_many(list(range(3 * i, 3 * i + 3)), ["text"] * 3, metadatas)
+        for row in reversed(range(3, 15)):
+            store.swap_remove(row)
+        assert store.stats()["interned_values"] == {"document_id": 1, "source": 1, "tags": 1}
+        
+        # Released codes are reused by new values
+        store.append_many([20], ["text"], [make_metadata("doc_new", 0, 0)])
+        assert len(store._value_columns["document_id"][1]) == 5
+        assert store.value(3, "document_id") == "doc_new"
+        
+        store.save(str(tmp_path))
+        restored = ChunkStore()
+        restored.load(str(tmp_path))
+        assert restored._value_columns["document_id"][1] == ["doc_0", "doc_new"]
+        assert restored.metadata == store.metadata
+        for row in reversed(range(len(restored))):
+            restored.swap_remove(row)
+        assert restored.stats()["interned_values"] == {"document_id": 0, "source": 0, "tags": 0}
+    
+    def test_save_and_load(self, tmp_path):
+        """Test that a saved store is restored with identical rows."""
+        store = ChunkStore()
+        metadatas = [make_metadata(f"doc_{i % 3}", i, i) for i in range(5)]
+        store.append_many(list(range(5)), [f"text {i}" for i in range(5)], metadatas)
+        store.swap_remove(0)
+        store.save(str(tmp_path))
+        
+        restored = ChunkStore()
+        restored.load(str(tmp_path))
+        assert restored.texts == store.texts
+        assert restored.metadata == store.metadata
+        assert restored.chunk_ids == store.chunk_ids
+        
+        restored.append_many([9], ["text 9"], [make_metadata("doc_0", 9, 9)])
+        assert restored.metadata[-1] == make_metadata("doc_0", 9, 9)
+        assert restored.stats()["interned_values"]["document_id"] == 3
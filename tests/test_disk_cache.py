@@ -0,0 +1,39 @@
+"""
+Tests for the persistent disk cache.
+"""
+
+from sniprag.core import DiskCache
+
+class TestDiskCache:
+    """Tests for DiskCache."""
+    
+    def test_values_persist_across_instances(self, tmp_path):
+        """Test that cached values survive reopening the cache."""
+        path = str(tmp_path / "cache.sqlite")
+        cache = DiskCache(path)
+        cache.set("page", b"ocr text")
+        cache.close()
+        
+        cache = DiskCache(path)
+        assert cache.get("page") == b"ocr text"
+        assert cache.get("missing") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        cache.close()
+    
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        """Test that the cache stays within its byte budget using LRU eviction."""
+        cache = DiskCache(str(tmp_path / "cache.sqlite"), max_bytes=25)
+        cache.set("a", b"x" * 10)
+        cache.set("b", b"x" * 10)
+        
+        # Touch "a" so that "b" is the least recently used entry
+        assert cache.get("a") is not None
+        cache.set("c", b"x" * 10)
+        
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.stats()["bytes"] <= 25
+        assert cache.stats()["evictions"] == 1
+        cache.close()
@@ -0,0 +1,80 @@
+"""
+Tests for the metadata filter index.
+"""
+
+import numpy as np
+import faiss
+
+from sniprag.core import FilterIndex
+
+def selected_ids(selection):
+    """Get the vector IDs of a selection, whichever form it is in."""
+    if selection.ids is not None:
+        return selection.ids.tolist()
+    return np.flatnonzero(np.unpackbits(selection.bitmap, bitorder="little")).tolist()
+
+class TestFilterIndex:
+    """Tests for FilterIndex."""
+    
+    def test_dense_and_sparse_values(self):
+        """Test that common values get bitmaps, rare ones ID lists, and filters combine."""
+        index = FilterIndex(["document_id", "page_number"])
+        metadatas = [{"document_id": "big" if i < 900 else f"doc{i}", "page_number": i % 3} for i in range(1000)]
+        index.add(list(range(1000)), metadatas)
+        
+        big, exact = index.select({"document_id": "big"})
+        assert exact and big.bitmap is not None
+        assert selected_ids(big) == list(range(900))
+        
+        small, _ = index.select({"document_id": "doc950"})
+        assert small.ids is not None and selected_ids(small) == [950]
+        
+        both, _ = index.select({"document_id": "big", "page_number": 1})
+        assert selected_ids(both) == [i for i in range(900) if i % 3 == 1]
+        assert index.select({"document_id": "doc950", "page_number": 0})[0].empty
+        assert index.select({"document_id": "missing"})[0].empty
+        
+        # The bitmap works as a FAISS selector
+        flat = faiss.IndexIDMap2(faiss.IndexFlatL2(2))
+        flat.add_with_ids(np.random.rand(1000, 2).astype('float32'), np.arange(1000, dtype='int64'))
+        selector, selected = both.selector()
+        _, labels = flat.search(np.zeros((1, 2), dtype='float32'), 1000, params=faiss.SearchParameters(sel=selector))
+        assert sorted(labels[0][labels[0] >= 0].tolist()) == selected_ids(both)
+        
+        # Removals clear the bits of vectors no chunk with the value uses anymore
+        index.remove(list(range(850)), metadatas[:850])
+        big, _ = index.select({"document_id": "big"})
+        assert selected_ids(big) == list(range(850, 900))
+    
+    def test_missing_shared_and_unhashable_values(self):
+        """Test chunks without the field, vectors shared by chunks and unhashable values."""
+        index = FilterIndex(["source"])
+        index.add([0, 1, 2, 1], [{"source": "a"}, {"source": "a"}, {}, {"source": "a"}])
+        
+        # Chunks without the field pass any filter on it
+        selection, exact = index.select({"source": "b"})
+        assert exact and selected_ids(selection) == [2]
+        
+        # A shared vector stays selected until its last chunk with the value is removed
+        index.remove([1], [{"source": "a"}])
+        assert selected_ids(index.select({"source": "a"})[0]) == [0, 1, 2]
+        index.remove([1], [{"source": "a"}])
+        assert selected_ids(index.select({"source": "a"})[0]) == [0, 2]
+        
+        # Unhashable values and other fields are left to the post-filter
+        assert index.select({"other": 1}) == (None, False)
+        assert index.select({"source": ["a"]}) == (None, False)
+        index.add([3], [{"source": ["a", "b"]}])
+        selection, exact = index.select({"source": "a"})
+        assert not exact and selected_ids(selection) == [0, 2, 3]
+        
+        # Intersections are inexact while chunks share a vector
+        index = FilterIndex(["document_id", "page_number"])
+        index.add([0, 1, 0], [{"document_id": "x", "page_number": 1}, {"document_id": "y", "page_number": 1},
+                              {"document_id": "y", "page_number": 0}])
+        assert selected_ids(index.select({"document_id": "y", "page_number": 1})[0]) == [0, 1]
+        assert index.select({"document_id": "y"})[1]
+        assert not index.select({"document_id": "y", "page_number": 1})[1]
+        index.remove([0], [{"document_id": "x", "page_number": 1}])
+        assert index.select({"document_id": "y", "page_number": 1})[1]
+
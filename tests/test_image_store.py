@@ -0,0 +1,148 @@
+"""
+Tests for the page image store.
+"""
+
+import os
+import sys
+import threading
+
+from sniprag.core import PageImageStore
+
+class TestPageImageStore:
+    """Tests for the size-bounded page image store."""
+    
+    def test_unbounded_store_keeps_everything_in_memory(self):
+        """Test that a store without a budget behaves like a dict."""
+        store = PageImageStore()
+        store["doc_0"] = b"a" * 100
+        store["doc_1"] = b"b" * 100
+        
+        assert len(store) == 2
+        assert store["doc_0"] == b"a" * 100
+        assert store.stats()["evictions"] == 0
+        assert store.stats()["disk_items"] == 0
+    
+    def test_spill_and_reload(self, tmp_path):
+        """Test that images over the budget are spilled to disk and read back."""
+        store = PageImageStore(max_memory_bytes=250, spill_dir=str(tmp_path))
+        for i in range(5):
+            store[f"doc_{i}"] = bytes([i]) * 100
+        
+        stats = store.stats()
+        assert len(store) == 5
+        assert stats["memory_bytes"] <= 250
+        assert stats["evictions"] == 3
+        assert stats["disk_items"] == 3
+        
+        # The oldest image comes back from disk and counts as a miss
+        assert store["doc_0"] == bytes([0]) * 100
+        assert store.stats()["misses"] == 1
+        assert store.stats()["disk_reads"] == 1
+        
+        # The newest image is a memory hit
+        assert store["doc_4"] == bytes([4]) * 100
+        assert store.stats()["hits"] == 1
+    
+    def test_identical_images_share_a_spill_file(self, tmp_path):
+        """Test that the spill tier is content addressed."""
+        store = PageImageStore(max_memory_bytes=100, spill_dir=str(tmp_path))
+        store["doc_0"] = b"x" * 100
+        store["doc_1"] = b"x" * 100
+        store["doc_2"] = b"y" * 100
+        
+        assert store.stats()["disk_items"] == 2
+        files = [f for _, _, names in os.walk(tmp_path) for f in names]
+        assert len(files) == 1
+        
+        # Deleting one key keeps the file for the other
+        del store["doc_0"]
+        assert store["doc_1"] == b"x" * 100
+    
+    def test_clear_and_close(self, tmp_path):
+        """Test that clearing removes spilled files and close removes the temp directory."""
+        store = PageImageStore(max_memory_bytes=100)
+        for i in range(3):
+            store[f"doc_{i}"] = bytes([i]) * 100
+        spill_dir = store.spill_dir
+        assert os.path.isdir(spill_dir)
+        
+        store.clear()
+        assert len(store) == 0
+        assert store.stats()["disk_bytes"] == 0
+        
+        store.close()
+        assert not os.path.exists(spill_dir)
+    
+    def test_shared_spill_dir(self, tmp_path):
+        """Test that stores sharing a spill directory keep their files apart."""
+        first = PageImageStore(max_memory_bytes=100, spill_dir=str(tmp_path))
+        second = PageImageStore(max_memory_bytes=100, spill_dir=str(tmp_path))
+        for store in (first, second):
+            store["doc_0"] = b"x" * 100
+            store["doc_1"] = b"y" * 100
+            
+        # Clearing or closing one store leaves the other's identical images in place
+        first.clear()
+        assert second["doc_0"] == b"x" * 100
+        first.close()
+        second["doc_2"] = b"z" * 100
+        assert second["doc_1"] == b"y" * 100
+        
+        second.close()
+        assert os.listdir(tmp_path) == []
+    
+    def test_save_and_load(self, tmp_path):
+        """Test that a saved store is restored lazily and its files are never deleted."""
+        store = PageImageStore(max_memory_bytes=150, spill_dir=str(tmp_path / "spill"))
+        for i in range(3):
+            store[f"doc_{i}"] = bytes([i]) * 100
+        store.save(str(tmp_path / "saved"))
+        
+        restored = PageImageStore()
+        restored.load(str(tmp_path / "saved"))
+        assert restored.stats()["saved_items"] == 3
+        assert restored.stats()["memory_items"] == 0
+        assert {key: restored[key] for key in restored} == {f"doc_{i}": bytes([i]) * 100 for i in range(3)}
+        
+        # Removing or replacing restored images leaves the saved files in place
+        del restored["doc_0"]
+        restored["doc_1"] = b"new"
+        restored.clear()
+        
+        again = PageImageStore()
+        again.load(str(tmp_path / "saved"))
+        assert again["doc_0"] == bytes([0]) * 100
+    
+    def test_concurrent_use(self, tmp_path):
+        """Test that threads can read, write and remove images while the store spills them."""
+        store = PageImageStore(max_memory_bytes=400, spill_dir=str(tmp_path))
+        errors = []
+        
+        def worker(offset):
+            try:
+                for i in range(500):
+                    key = f"doc_{(i + offset) % 12}"
+                    if store.get(key) is None:
+                        store[key] = bytes([i % 12]) * 100
+                    elif i % 7 == 0:
+                        store.pop(key, None)
+            except Exception as e:
+                errors.append(e)
+                
+        # Switch threads as often as possible to interleave lookups with evictions
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+            
+        assert not errors
+        stats = store.stats()
+        assert stats["memory_bytes"] <= 400
+        assert stats["memory_items"] + stats["disk_items"] == len(store)
+        assert all(len(store[key]) == 100 for key in store)
@@ -0,0 +1,254 @@
+"""
+Tests for the OCR SnipRAG engine.
+"""
+
+import time
+import hashlib
+import threading
+import io
+import pytest
+import pytesseract
+import numpy as np
+import fitz  # PyMuPDF
+from PIL import Image
+
+from sniprag.core import OCRSnipRAGEngine
+from sniprag.core.ocr_engine import _snap_bounds, _adaptive_dpi, _TARGET_TEXT_PIXELS
+
+class TestOCRSnipRAGEngine:
+    """Tests for the OCR engine."""
+    
+    @pytest.fixture
+    def mixed_pdf(self, sample_pdf, tmp_path):
+        """Create a PDF with a born-digital page followed by an image-only page."""
+        doc = fitz.open(sample_pdf)
+        pix = doc[0].get_pixmap()
+        page = doc.new_page(width=612, height=792)
+        page.insert_image(page.rect, stream=pix.tobytes("png"))
+        path = str(tmp_path / "mixed.pdf")
+        doc.save(path)
+        doc.close()
+        return path
+    
+    def test_auto_mode_skips_ocr_on_text_pages(self, mixed_pdf, monkeypatch):
+        """Test that auto mode reads the text layer and only OCRs image-only pages."""
+        ocr_calls = []
+        
+        def fake_ocr(image):
+            ocr_calls.append(image.size)
+            return "Scanned invoice text"
+        
+        monkeypatch.setattr(pytesseract, "image_to_string", fake_ocr)
+        engine = OCRSnipRAGEngine(ocr_mode="auto")
+        assert engine.process_pdf(mixed_pdf, "mixed")
+        
+        # Only the non-blank slices of the scanned page went through OCR
+        scanned_slices = [key for key in engine.slice_images if key.startswith("mixed_1_")]
+        assert 0 < len(ocr_calls) == len(scanned_slices) < engine.num_slices
+        
+        sources = {(m["page_number"], m["text_source"]) for m in engine.document_metadata}
+        assert sources == {(0, "text_layer"), (1, "ocr")}
+        assert any("invoice total amount" in text for text in engine.documents)
+        
+        # Text layer chunks still point at their slice images
+        row = next(i for i, m in enumerate(engine.document_metadata) if m["text_source"] == "text_layer")
+        assert "image_data" in engine.get_image_snippet(row)
+    
+    @pytest.mark.parametrize("snap_slices", [False, True])
+    def test_text_layer_pages_skip_ocr_render(self, tmp_path, monkeypatch, snap_slices):
+        """Test that text layer pages are only rendered for snippets and read each line once."""
+        doc = fitz.open()
+        page = doc.new_page(width=612, height=792)
+        
+        # A line straddling the edge between the first two slices (at 79.2 points)
+        page.insert_text((72, 85), "This line crosses the edge between the first two slices.", fontsize=14)
+        page.insert_text((72, 400), "Another line of native text further down the page.", fontsize=11)
+        path = str(tmp_path / "digital.pdf")
+        doc.save(path)
+        doc.close()
+        
+        scales = []
+        get_pixmap = fitz.Page.get_pixmap
+        
+        def recording_get_pixmap(self, *args, matrix=fitz.Identity, **kwargs):
+            scales.append(matrix.a)
+            return get_pixmap(self, *args, matrix=matrix, **kwargs)
+        
+        def failing_ocr(*args, **kwargs):
+            raise AssertionError("Tesseract should not run on text layer pages")
+            
+        monkeypatch.setattr(fitz.Page, "get_pixmap", recording_get_pixmap)
+        monkeypatch.setattr(pytesseract, "image_to_string", failing_ocr)
+        engine = OCRSnipRAGEngine(ocr_mode="auto", ocr_dpi=200, snap_slices=snap_slices)
+        assert engine.process_pdf(path, "digital")
+        
+        assert scales == [engine.snippet_dpi / 72]
+        assert sum("crosses the edge" in text for text in engine.documents) == 1
+        assert sum("Another line" in text for text in engine.documents) == 1
+    
+    def test_concurrent_ocr_preserves_slice_order(self, mixed_pdf, monkeypatch):
+        """Test that concurrent OCR produces the same chunks as serial OCR."""
+        lock = threading.Lock()
+        running = [0, 0]
+        
+        def fake_ocr(image):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            digest = hashlib.md5(image.tobytes()).hexdigest()
+            
+            # Finish out of order
+            time.sleep(int(digest[0], 16) / 1000)
+            with lock:
+                running[0] -= 1
+            return f"Scanned text {digest[:8]}"
+        
+        monkeypatch.setattr(pytesseract, "image_to_string", fake_ocr)
+        serial = OCRSnipRAGEngine()
+        serial.process_pdf(mixed_pdf, "mixed")
+        
+        running[1] = 0
+        concurrent = OCRSnipRAGEngine(ocr_workers=4)
+        concurrent.process_pdf(mixed_pdf, "mixed")
+        
+        assert running[1] > 1
+        assert concurrent.documents == serial.documents
+        assert concurrent.document_metadata == serial.document_metadata
+    
+    def test_ocr_per_page_buckets_lines_into_slices(self, mixed_pdf, monkeypatch):
+        """Test that page-level OCR assigns whole lines to slices with one call per page."""
+        calls = []
+        
+        def fake_data(image, output_type=None):
+            calls.append(image.size)
+            words = [
+                # (block, par, line, top, height, text)
+                (1, 1, 1, 100, 40, "Invoice"), (1, 1, 1, 104, 36, "header"),
+                (1, 1, 2, 320, 30, "Straddles"), (1, 1, 2, 318, 30, "edge"),
+                (2, 1, 1, 1500, 40, "Total"), (2, 1, 1, 1500, 40, ""),
+            ]
+            keys = ["block_num", "par_num", "line_num", "top", "height", "text"]
+            return {key: [word[i] for word in words] for i, key in enumerate(keys)}
+        
+        monkeypatch.setattr(pytesseract, "image_to_data", fake_data)
+        engine = OCRSnipRAGEngine(ocr_per_page=True, blank_threshold=-1)
+        assert engine.process_pdf(mixed_pdf, "mixed")
+        
+        assert len(calls) == 2
+        page_chunks = sorted((m["slice_index"], text) for text, m in 
+                             zip(engine.documents, engine.document_metadata) if m["page_number"] == 1)
+        assert page_chunks == [(0, "Invoice header"), (1, "Straddles edge"), (4, "Total")]
+        
+        # Coordinates are stored in PDF points
+        slice_height = calls[0][1] // engine.num_slices * 72 / 300
+        metadata = next(m for m in engine.document_metadata if m["slice_index"] == 4)
+        assert metadata["coordinates"] == pytest.approx([0, 4 * slice_height, 612, 5 * slice_height])
+    
+    def test_ocr_cache_skips_unchanged_pages(self, mixed_pdf, monkeypatch, tmp_path):
+        """Test that re-ingesting a document reuses cached OCR results."""
+        ocr_calls = []
+        
+        def fake_ocr(image):
+            ocr_calls.append(image.size)
+            return f"Scanned text {len(ocr_calls)}"
+        
+        monkeypatch.setattr(pytesseract, "image_to_string", fake_ocr)
+        cache_dir = str(tmp_path / "ocr-cache")
+        first = OCRSnipRAGEngine(ocr_cache_dir=cache_dir)
+        first.process_pdf(mixed_pdf, "mixed")
+        num_calls = len(ocr_calls)
+        
+        # Pixel-identical slices (such as blank margins) are only OCRed once
+        assert 0 < num_calls < 2 * first.num_slices
+        
+        # A new engine rebuilding the index does not run OCR again
+        second = OCRSnipRAGEngine(ocr_cache_dir=cache_dir)
+        second.process_pdf(mixed_pdf, "mixed")
+        assert len(ocr_calls) == num_calls
+        assert second.documents == first.documents
+    
+    def test_blank_slices_are_skipped(self, mixed_pdf, monkeypatch):
+        """Test that empty slices are neither stored nor OCRed, and edges snap to whitespace."""
+        ocr_calls = []
+        
+        def fake_ocr(image):
+            ocr_calls.append(image.size)
+            return "Scanned text"
+        
+        monkeypatch.setattr(pytesseract, "image_to_string", fake_ocr)
+        engine = OCRSnipRAGEngine()
+        engine.process_pdf(mixed_pdf, "mixed")
+        
+        # The sample text only covers the top of each page
+        assert len(ocr_calls) == len(engine.slice_images) < 2 * engine.num_slices
+        assert all(key in engine.slice_images for key in 
+                   {m["slice_key"] for m in engine.document_metadata})
+    
+    @pytest.mark.parametrize("ocr_mode", ["auto", "always"])
+    def test_light_text_is_not_blank(self, tmp_path, monkeypatch, ocr_mode):
+        """Test that pages of light grey text are read, not skipped as blank."""
+        ocr_calls = []
+        
+        def fake_ocr(image):
+            ocr_calls.append(image.size)
+            return "Scanned text"
+            
+        monkeypatch.setattr(pytesseract, "image_to_string", fake_ocr)
+        doc = fitz.open()
+        page = doc.new_page(width=612, height=792)
+        for i in range(5):
+            page.insert_text((72, 72 + 150 * i), f"Light grey line number {i} of the report.",
+                             fontsize=11, color=(0.7, 0.7, 0.7))
+        path = str(tmp_path / "light.pdf")
+        doc.save(path)
+        doc.close()
+        
+        engine = OCRSnipRAGEngine(ocr_mode=ocr_mode)
+        engine.process_pdf(path, "light")
+        assert len(engine.documents) == 5
+        assert len(ocr_calls) == (5 if ocr_mode == "always" else 0)
+    
+    def test_slice_edges_snap_to_whitespace(self):
+        """Test that slice edges move off text lines to the nearest empty rows."""
+        ink_rows = np.zeros(300, dtype=int)
+        ink_rows[90:115] = 50  # A text line across the first edge
+        ink_rows[195:199] = 5  # Light noise just before the second edge
+        
+        bounds = _snap_bounds(ink_rows, [(0, 100), (100, 200), (200, 300)])
+        assert bounds == [(0, 89), (89, 200), (200, 300)]
+    
+    def test_ocr_and_snippet_resolutions(self, mixed_pdf, monkeypatch):
+        """Test that OCR renders use their own resolution and colors, separate from snippets."""
+        ocr_images = []
+        
+        def fake_ocr(image):
+            ocr_images.append(image)
+            return "Scanned text"
+        
+        monkeypatch.setattr(pytesseract, "image_to_string", fake_ocr)
+        engine = OCRSnipRAGEngine(ocr_dpi=150, ocr_grayscale=True, snippet_dpi=100)
+        engine.process_pdf(mixed_pdf, "mixed")
+        
+        assert {image.mode for image in ocr_images} == {"L"}
+        assert {image.width for image in ocr_images} == {612 * 150 // 72}
+        
+        # Stored images are rendered in color at the snippet resolution
+        page = Image.open(io.BytesIO(engine.page_images["mixed_0"]))
+        assert page.mode == "RGB"
+        assert page.size == (round(612 * 100 / 72), round(792 * 100 / 72))
+        snippet = Image.open(io.BytesIO(engine.slice_images[engine.document_metadata[0]["slice_key"]]))
+        assert snippet.width == page.width
+    
+    def test_adaptive_ocr_dpi(self, sample_pdf, mixed_pdf):
+        """Test that the adaptive resolution follows font size and scan resolution."""
+        doc = fitz.open(mixed_pdf)
+        
+        # 11pt text renders at the target height; the scanned page was rendered at 72 DPI
+        assert _adaptive_dpi(doc[0]) == round(_TARGET_TEXT_PIXELS * 72 / 11)
+        assert _adaptive_dpi(doc[1]) == 150
+        doc.close()
+    
+    def test_invalid_ocr_mode(self):
+        """Test that an unknown OCR mode is rejected."""
+        with pytest.raises(ValueError):
+            OCRSnipRAGEngine(ocr_mode="sometimes")
@@ -0,0 +1,73 @@
+"""
+Tests for the query embedding cache.
+"""
+
+import sys
+import threading
+import numpy as np
+
+from sniprag.core import QueryCache
+
+class TestQueryCache:
+    """Tests for QueryCache."""
+    
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache keeps at most max_items embeddings using LRU eviction."""
+        cache = QueryCache(max_items=2)
+        cache.put("a", np.ones(3))
+        cache.put("b", np.ones(3))
+        
+        # Touch "a" so that "b" is the least recently used entry
+        assert cache.get("a") is not None
+        cache.put("c", np.ones(3))
+        
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.get("b") is None
+        stats = cache.stats()
+        assert stats["items"] == 2
+        assert stats["evictions"] == 1
+        assert stats["hit_rate"] == 0.5
+    
+    def test_normalized_keys_and_model_invalidation(self):
+        """Test key normalization and that a different model empties the cache."""
+        cache = QueryCache(normalize_keys=True)
+        cache.check_model("model-a")
+        cache.put("Invoice  Total", np.ones(3))
+        assert cache.get(" invoice total\n") is not None
+        
+        cache.check_model("model-a")
+        assert len(cache) == 1
+        cache.check_model("model-b")
+        assert len(cache) == 0
+        assert cache.stats()["invalidations"] == 1
+    
+    def test_concurrent_use(self):
+        """Test that threads can share a small cache while it evicts entries."""
+        cache = QueryCache(max_items=4)
+        errors = []
+        
+        def worker(offset):
+            try:
+                for i in range(2000):
+                    query = str((i + offset) % 16)
+                    if cache.get(query) is None:
+                        cache.put(query, np.ones(3))
+            except Exception as e:
+                errors.append(e)
+                
+        # Switch threads as often as possible to interleave lookups with evictions
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+            
+        assert not errors
+        assert len(cache) == 4
+        assert cache.hits + cache.misses == 8 * 2000
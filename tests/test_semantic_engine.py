@@ -0,0 +1,100 @@
+"""
+Tests for the semantic SnipRAG engine.
+"""
+
+import base64
+from io import BytesIO
+from PIL import Image
+import fitz  # PyMuPDF
+
+from sniprag.core import SemanticSnipRAGEngine
+from sniprag.core.semantic_engine import _bucket_lines
+
+class TestSemanticSnipRAGEngine:
+    """Tests for the semantic SnipRAG engine."""
+    
+    def test_lazy_rendering(self, sample_pdf):
+        """Test that lazy rendering skips page images and renders snippets on demand."""
+        engine = SemanticSnipRAGEngine(lazy_rendering=True)
+        assert engine.process_pdf(sample_pdf, "test-document")
+        
+        # No page was rasterized during ingestion
+        assert len(engine.page_images) == 0
+        assert engine.pdf_sources["test-document"] == sample_pdf
+        
+        results = engine.search_with_snippets("invoice total", top_k=1)
+        
+        assert len(results) == 1
+        assert "image_data" in results[0]
+        img = Image.open(BytesIO(base64.b64decode(results[0]["image_data"])))
+        assert img.width > 0
+        assert img.height > 0
+        assert len(engine.snippet_images) == 1
+    
+    def test_lazy_rendering_matches_eager_text(self, sample_pdf):
+        """Test that lazy rendering does not change the extracted chunks."""
+        eager = SemanticSnipRAGEngine()
+        lazy = SemanticSnipRAGEngine(lazy_rendering=True)
+        eager.process_pdf(sample_pdf, "test-document")
+        lazy.process_pdf(sample_pdf, "test-document")
+        
+        assert lazy.documents == eager.documents
+        assert lazy.text_coordinates == eager.text_coordinates
+    
+    def test_page_images_spill_to_disk(self, sample_pdf, tmp_path):
+        """Test that page images go through a bounded store and snippets still work."""
+        engine = SemanticSnipRAGEngine(image_memory_limit=1, image_spill_dir=str(tmp_path))
+        engine.process_pdf(sample_pdf, "test-document")
+        engine.process_pdf(sample_pdf, "another-document")
+        
+        assert len(engine.page_images) == 2
+        assert engine.page_images.stats()["evictions"] == 1
+        
+        results = engine.search_with_snippets("invoice total", top_k=2)
+        assert all("image_data" in result for result in results)
+        engine.close()
+    
+    def test_parallel_extraction_matches_serial(self, multi_page_pdf):
+        """Test that extracting pages in a process pool gives the serial output."""
+        serial = SemanticSnipRAGEngine()
+        parallel = SemanticSnipRAGEngine(workers=2)
+        serial.process_pdf(multi_page_pdf, "test-document")
+        assert parallel.process_pdf(multi_page_pdf, "test-document")
+        
+        assert parallel.documents == serial.documents
+        assert parallel.document_metadata == serial.document_metadata
+        assert sorted(parallel.page_images) == sorted(serial.page_images)
+        parallel.close()
+    
+    def test_bucketed_lines_match_clipped_text(self, sample_pdf):
+        """Test that single-pass line bucketing matches per-block clipped extraction."""
+        doc = fitz.open(sample_pdf)
+        for page in doc:
+            block_height = page.rect.height / 20
+            block_bounds = [(max(0, i * block_height - block_height * 0.2), (i + 1) * block_height)
+                            for i in range(20)]
+            
+            expected = [page.get_text("text", clip=fitz.Rect(0, y0, page.rect.width, y1))
+                        for y0, y1 in block_bounds]
+            assert _bucket_lines(page, block_bounds) == expected
+        doc.close()
+    
+    def test_snippet_dpi(self, sample_pdf):
+        """Test that coordinates are stored in points and snippets use the snippet resolution."""
+        eager = SemanticSnipRAGEngine(snippet_dpi=150)
+        lazy = SemanticSnipRAGEngine(snippet_dpi=150, lazy_rendering=True)
+        eager.process_pdf(sample_pdf, "test-document")
+        lazy.process_pdf(sample_pdf, "test-document")
+        
+        assert max(c[2] for c in eager.text_coordinates) == 612
+        page = Image.open(BytesIO(eager.page_images["test-document_0"]))
+        assert page.size == (round(612 * 150 / 72), round(792 * 150 / 72))
+        
+        eager_snippet = eager.get_image_snippet(0, padding=0)
+        lazy_snippet = lazy.get_image_snippet(0, padding=0)
+        assert eager_snippet["coordinates"] == lazy_snippet["coordinates"]
+        for snippet in (eager_snippet, lazy_snippet):
+            img = Image.open(BytesIO(base64.b64decode(snippet["image_data"])))
+            x0, y0, x1, y1 = snippet["coordinates"]
+            assert abs(img.width - (x1 - x0)) <= 1
+            assert abs(img.height - (y1 - y0)) <= 1